@@ -11,6 +11,9 @@ npm install
 npm run build
 cd ..
 
+echo "Applying migrations..."
+python manage.py migrate --no-input
+
 echo "Collecting static files..."
 python manage.py collectstatic --no-input
 
@@ -0,0 +1,138 @@
+"""
+Acumuladores compactos para los bucles de agrupación de los endpoints.
+
+Cada clave de agrupación (etapa, URL, recurso, elemento) se acumula en un
+registro con __slots__ en vez de un dict de contadores con claves string:
+ocupa menos memoria (sin __dict__ por instancia) y cada suma es un acceso
+a atributo, no un hash de la clave.
+"""
+
+
+# ============================================================
+# Embudo: tiempos por dispositivo
+# ============================================================
+class DeviceTimes:
+    """Suma de tiempos promedio y filas, en total y por dispositivo."""
+
+    __slots__ = ("total_time", "count", "desktop_time", "desktop_count", "mobile_time", "mobile_count")
+
+    def __init__(self):
+        self.total_time = 0
+        self.count = 0
+        self.desktop_time = 0
+        self.desktop_count = 0
+        self.mobile_time = 0
+        self.mobile_count = 0
+
+    def add_time(self, device_category, seconds):
+        self.total_time += seconds
+        self.count += 1
+        if device_category == "desktop":
+            self.desktop_time += seconds
+            self.desktop_count += 1
+        elif device_category == "mobile":
+            self.mobile_time += seconds
+            self.mobile_count += 1
+
+    def averages(self):
+        """(promedio total, desktop, mobile); 0 si no hay filas."""
+        return (
+            self.total_time / self.count if self.count > 0 else 0,
+            self.desktop_time / self.desktop_count if self.desktop_count > 0 else 0,
+            self.mobile_time / self.mobile_count if self.mobile_count > 0 else 0,
+        )
+
+
+class UrlStats(DeviceTimes):
+    __slots__ = ("vistas",)
+
+    def __init__(self):
+        super().__init__()
+        self.vistas = 0
+
+
+class StageStats(UrlStats):
+    """Totales de una etapa del embudo y sus URLs ({page_path: UrlStats})."""
+
+    __slots__ = ("eventos", "urls")
+
+    def __init__(self):
+        super().__init__()
+        self.eventos = 0
+        self.urls = {}
+
+    def url(self, page_path):
+        stats = self.urls.get(page_path)
+        if stats is None:
+            stats = self.urls[page_path] = UrlStats()
+        return stats
+
+
+# ============================================================
+# Recursos: totales por clave de recurso
+# ============================================================
+class ResourceTotals:
+    """Totales de un recurso; los promedios se calculan por evento."""
+
+    __slots__ = ("type", "events", "duration", "repeat", "size", "rows")
+
+    def __init__(self, resource_type=None, events=0.0, duration=0.0, repeat=0.0, size=0.0, rows=0):
+        self.type = resource_type
+        self.events = events
+        self.duration = duration
+        self.repeat = repeat
+        self.size = size
+        self.rows = rows
+
+    def add(self, events, duration, repeat, size, rows=1):
+        self.events += events
+        self.duration += duration
+        self.repeat += repeat
+        self.size += size
+        self.rows += rows
+
+    def merge(self, other, sign=1):
+        """Suma (o resta con sign=-1) otros totales."""
+        self.add(sign * other.events, sign * other.duration, sign * other.repeat, sign * other.size, sign * other.rows)
+
+    def copy(self):
+        return ResourceTotals(self.type, self.events, self.duration, self.repeat, self.size, self.rows)
+
+    def averages(self):
+        """(duración, repeticiones, tamaño) promedio por evento."""
+        if self.events > 0:
+            return self.duration / self.events, self.repeat / self.events, self.size / self.events
+        return 0, 0, 0
+
+
+# ============================================================
+# ClickRelation: sesiones, carritos y compras por elemento
+# ============================================================
+class ClickStats:
+    __slots__ = ("elemento", "img_click_home", "sesiones", "carritos", "compras", "ingresos")
+
+    def __init__(self, elemento, img_click_home):
+        self.elemento = elemento
+        self.img_click_home = img_click_home
+        self.sesiones = 0
+        self.carritos = 0
+        self.compras = 0
+        self.ingresos = 0.0
+
+    def as_dict(self):
+        return {
+            "elemento": self.elemento,
+            "img_click_home": self.img_click_home,
+            "sesiones": self.sesiones,
+            "carritos": self.carritos,
+            "compras": self.compras,
+            "ingresos": self.ingresos,
+        }
+
+
+class PurchaseStats:
+    __slots__ = ("count", "revenue")
+
+    def __init__(self):
+        self.count = 0
+        self.revenue = 0.0
@@ -0,0 +1,277 @@
+"""
+Caminos de navegación agregados de todas las sesiones (trie y Sankey).
+
+Para un rango se piden los eventos user_click_event y page_view de todas las
+sesiones (mismas dimensiones que ga4_click_flow), se arma por sesión la
+secuencia de pasos ordenada por timestamp ("click: ..." y "page: ...", sin
+repetir pasos consecutivos iguales) y se cuentan sus prefijos en un trie de
+hasta `depth` pasos. GA4 entrega las filas ordenadas por sesión y timestamp,
+así que cada página del reporte se procesa y se descarta antes de la
+siguiente: la memoria queda acotada por el tamaño de página y el trie.
+
+El cálculo corre en segundo plano (un solo hilo, para acotar memoria) y el
+trie se guarda en caché por (propiedad, rango, profundidad). Mientras se
+calcula el endpoint responde "pending"; un resultado vencido se sigue
+sirviendo marcado como stale mientras se recalcula. Si el cálculo falla, el
+error se recuerda FAILURE_TTL segundos: en ese lapso no se reintenta y el
+endpoint lo informa en vez de quedar "pending". La poda por frecuencia se
+aplica al responder, sobre el trie cacheado.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from cachetools import LRUCache, TTLCache
+from google.analytics.data_v1beta.types import DateRange, Dimension, OrderBy, RunReportRequest
+
+from . import ga4_cache, ga4_client, ga4_filters, ga4_metrics, ga4_urls
+from .ga4_columns import decode_response
+from .ga4_pagination import iter_report_pages
+
+DEFAULT_DEPTH = 6
+MAX_DEPTH = 10
+DEFAULT_MIN_COUNT = 5
+# Las ramas vistas en menos sesiones no se guardan en caché
+MIN_COUNT_FLOOR = int(os.getenv("GA4_CLICK_PATHS_MIN_COUNT_FLOOR", "2"))
+RESULTS_MAXSIZE = int(os.getenv("GA4_CLICK_PATHS_MAXSIZE", "8"))
+FAILURE_TTL = int(os.getenv("GA4_CLICK_PATHS_FAILURE_TTL", "60"))
+
+ROOT = "(inicio)"
+NOT_SET = ("", "(not set)")
+
+SESSION = "customEvent:session_id_final"
+EVENT = "eventName"
+CLICK = "customEvent:user_click"
+PAGE = "pageLocation"
+TIMESTAMP = "dateHourMinute"
+
+# Únicos eventos que aportan pasos al trie
+PATH_EVENTS = ("user_click_event", "page_view")
+
+
+class PathNode:
+    """Nodo del trie: sesiones que pasaron por este prefijo y sus pasos siguientes."""
+
+    __slots__ = ("count", "children")
+
+    def __init__(self):
+        self.count = 0
+        self.children = {}
+
+    def child(self, step):
+        node = self.children.get(step)
+        if node is None:
+            node = self.children[step] = PathNode()
+        return node
+
+    def prune(self, min_count):
+        """Elimina (en sitio) las ramas con menos de min_count sesiones."""
+        self.children = {step: node for step, node in self.children.items() if node.count >= min_count}
+        for node in self.children.values():
+            node.prune(min_count)
+        return self
+
+
+class ClickPaths:
+    __slots__ = ("root", "depth", "start_date", "end_date", "computed_at")
+
+    def __init__(self, root, depth, start_date, end_date):
+        self.root = root
+        self.depth = depth
+        self.start_date = start_date
+        self.end_date = end_date
+        self.computed_at = time.time()
+
+
+# ============================================================
+# Cálculo
+# ============================================================
+def _paths_request(property_id, start_date, end_date):
+    return RunReportRequest(
+        property=f"properties/{property_id}",
+        dimensions=[
+            Dimension(name=SESSION),
+            Dimension(name=EVENT),
+            Dimension(name=CLICK),
+            Dimension(name=PAGE),
+            Dimension(name=TIMESTAMP),
+        ],
+        metrics=[],
+        date_ranges=[DateRange(start_date=start_date, end_date=end_date)],
+        dimension_filter=ga4_filters.in_list_filter(EVENT, PATH_EVENTS),
+        order_bys=[
+            OrderBy(dimension=OrderBy.DimensionOrderBy(dimension_name=SESSION)),
+            OrderBy(dimension=OrderBy.DimensionOrderBy(dimension_name=TIMESTAMP)),
+        ],
+    )
+
+
+def _steps(clicks, pages):
+    """Etiquetas de paso por nivel de cada dimensión (None si no aplica)."""
+    click_steps = [None if c in NOT_SET else f"click: {c}" for c in clicks]
+    page_steps = [None if p in NOT_SET else f"page: {ga4_urls.page_entry(p).normalized}" for p in pages]
+    return click_steps, page_steps
+
+
+def build_paths(client, property_id, start_date, end_date, depth=DEFAULT_DEPTH):
+    """Trie de prefijos de navegación de todas las sesiones del rango."""
+    root = PathNode()
+    current_session = None
+    skip = True
+    node = root
+    steps = 0
+    last_step = None
+
+    # Filas ordenadas por sesión y timestamp: una sesión puede seguir en la página siguiente
+    for response in iter_report_pages(client, _paths_request(property_id, start_date, end_date)):
+        columns = decode_response(response)
+        del response
+        if not len(columns):
+            continue
+
+        session_codes, sessions = columns.codes(SESSION)
+        click_codes, clicks = columns.codes(CLICK)
+        page_codes, pages = columns.codes(PAGE)
+        click_steps, page_steps = _steps(clicks, pages)
+
+        for session, click, page in zip(
+            session_codes.tolist(), click_codes.tolist(), page_codes.tolist()
+        ):
+            session = sessions[session]
+            if session != current_session:
+                current_session = session
+                node, steps, last_step = root, 0, None
+                skip = session in NOT_SET
+                if not skip:
+                    root.count += 1
+            if skip:
+                continue
+
+            # Mismo orden que ga4_click_flow: el click y luego la página del evento
+            for step in (click_steps[click], page_steps[page]):
+                if step is None or step == last_step or steps >= depth:
+                    continue
+                node = node.child(step)
+                node.count += 1
+                steps += 1
+                last_step = step
+
+        del columns
+
+    return ClickPaths(root.prune(MIN_COUNT_FLOOR), depth, start_date, end_date)
+
+
+# ============================================================
+# Caché y cálculo en segundo plano
+# ============================================================
+_lock = threading.Lock()
+_results = LRUCache(maxsize=RESULTS_MAXSIZE)
+_failures = TTLCache(maxsize=RESULTS_MAXSIZE, ttl=FAILURE_TTL)
+_inflight = {}
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ga4-click-paths")
+
+
+def _ttl(end_date):
+    """Mismas reglas que ga4_cache: rangos que tocan hoy o ayer vencen pronto."""
+    if date.fromisoformat(end_date) >= date.today() - timedelta(days=1):
+        return ga4_cache.RECENT_DAYS_TTL
+    return ga4_cache.CLOSED_DAYS_TTL
+
+
+def _compute(key, property_id, start_date, end_date, depth):
+    try:
+        with ga4_metrics.endpoint_scope("click_paths"):
+            paths = build_paths(ga4_client.get_client(), property_id, start_date, end_date, depth)
+        with _lock:
+            _results[key] = paths
+            _failures.pop(key, None)
+    except Exception as e:
+        print(f"Error calculando caminos de clicks {key}: {e}")
+        with _lock:
+            _failures[key] = f"{type(e).__name__}: {e}"
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+
+
+def get_paths(property_id, start_date, end_date, depth=DEFAULT_DEPTH):
+    """
+    (ClickPaths o None, stale, error). Si no hay resultado vigente lanza el
+    cálculo en segundo plano (una vez por clave) y retorna el último
+    disponible. error es el mensaje del último cálculo fallido (mientras no
+    pasen FAILURE_TTL segundos no se reintenta), o None.
+    """
+    start_date = ga4_cache.resolve_date(start_date)
+    end_date = ga4_cache.resolve_date(end_date)
+    key = (property_id, start_date, end_date, depth)
+
+    with _lock:
+        paths = _results.get(key)
+        error = _failures.get(key)
+        stale = paths is None or time.time() - paths.computed_at > _ttl(end_date)
+        if stale and error is None and key not in _inflight:
+            # Sin copiar el contexto del request: el cálculo se atribuye a "click_paths"
+            _inflight[key] = _executor.submit(_compute, key, property_id, start_date, end_date, depth)
+
+    return paths, stale, error
+
+
+def clear():
+    with _lock:
+        _results.clear()
+        _failures.clear()
+
+
+# ============================================================
+# Serialización
+# ============================================================
+def to_trie(paths, min_count):
+    """Árbol {"name", "count", "others", "children"} sin ramas con menos de min_count sesiones."""
+    def walk(name, node):
+        children = [
+            walk(step, child)
+            for step, child in sorted(node.children.items(), key=lambda item: item[1].count, reverse=True)
+            if child.count >= min_count
+        ]
+        return {
+            "name": name,
+            "count": node.count,
+            # Sesiones que terminan aquí o siguen por ramas podadas
+            "others": node.count - sum(child["count"] for child in children),
+            "children": children,
+        }
+
+    return walk(ROOT, paths.root)
+
+
+def to_sankey(paths, min_count):
+    """{"nodes": [{"name", "depth"}], "links": [{"source", "target", "value"}]} por nivel."""
+    nodes = {}
+    links = {}
+
+    def node_id(depth, name):
+        key = (depth, name)
+        if key not in nodes:
+            nodes[key] = len(nodes)
+        return nodes[key]
+
+    stack = [(0, ROOT, paths.root)]
+    while stack:
+        depth, name, node = stack.pop()
+        source = node_id(depth, name)
+        for step, child in node.children.items():
+            if child.count < min_count:
+                continue
+            link = (source, node_id(depth + 1, step))
+            links[link] = links.get(link, 0) + child.count
+            stack.append((depth + 1, step, child))
+
+    return {
+        "nodes": [{"name": name, "depth": depth} for depth, name in nodes],
+        "links": [
+            {"source": source, "target": target, "value": value}
+            for (source, target), value in sorted(links.items(), key=lambda item: item[1], reverse=True)
+        ],
+    }
@@ -0,0 +1,235 @@
+"""
+Almacén local de hechos GA4 particionado por día y por especificación de reporte.
+
+Un rango se sirve desde los días ya guardados y solo se piden a GA4 los días
+faltantes o aún en procesamiento (hoy y ayer). Así el costo de cada request
+crece con la cantidad de días nuevos y no con el largo del rango.
+
+Solo se guardan los días con filas (ReportDayFact); qué días ya se pidieron
+se guarda como rangos en ReportCoverage, así un reporte muy filtrado (p. ej.
+el flujo de una sola sesión sobre todo el histórico) ocupa una fila de
+cobertura y no una por día vacío. prune() borra los reportes cuya cobertura
+no se amplía hace más de RETENTION_DAYS.
+"""
+import os
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+from django.db import transaction
+from django.utils import timezone
+from google.analytics.data_v1beta.types import DateRange, Dimension, RunReportRequest
+
+from . import ga4_cache
+from .ga4_pagination import iter_report_rows
+from .models import ReportCoverage, ReportDayFact
+
+# Días recientes que GA4 todavía puede modificar: nunca se persisten
+SETTLING_DAYS = 2
+
+RETENTION_DAYS = int(os.getenv("GA4_FACT_RETENTION_DAYS", "90"))
+
+FactValue = namedtuple("FactValue", "value")
+
+
+class FactRow:
+    """Fila con la misma forma que las filas de GA4 (dimension_values/metric_values)."""
+
+    __slots__ = ("dimension_values", "metric_values")
+
+    def __init__(self, dimensions, metrics):
+        self.dimension_values = [FactValue(v) for v in dimensions]
+        self.metric_values = [FactValue(v) for v in metrics]
+
+
+def _parse_date(value):
+    return datetime.strptime(ga4_cache.resolve_date(value), "%Y-%m-%d").date()
+
+
+def _day_spec(request):
+    """Copia del request con la dimensión date al final y sin rango de fechas."""
+    spec = RunReportRequest(request)
+    spec.date_ranges = []
+    spec.limit = 0
+    spec.offset = 0
+    spec.dimensions.append(Dimension(name="date"))
+    return spec
+
+
+def _missing_ranges(days):
+    """Agrupa una lista ordenada de días en rangos contiguos [(inicio, fin)]."""
+    ranges = []
+    for day in days:
+        if ranges and ranges[-1][1] + timedelta(days=1) == day:
+            ranges[-1][1] = day
+        else:
+            ranges.append([day, day])
+    return ranges
+
+
+def _merge_ranges(ranges):
+    """Une rangos [(inicio, fin)] que se solapan o son contiguos, ordenados por inicio."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + timedelta(days=1):
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(r) for r in merged]
+
+
+def _load(spec_hashes, start, end):
+    """
+    {spec_hash: {date: rows}} de los días de [start, end] ya pedidos a GA4;
+    los días cubiertos sin ReportDayFact son días vacíos.
+    """
+    stored = {spec_hash: {} for spec_hash in spec_hashes}
+    if start > end:
+        return stored
+
+    for coverage in ReportCoverage.objects.filter(
+        spec_hash__in=spec_hashes, start_date__lte=end, end_date__gte=start
+    ):
+        day = max(coverage.start_date, start)
+        while day <= min(coverage.end_date, end):
+            stored[coverage.spec_hash][day] = []
+            day += timedelta(days=1)
+
+    for fact in ReportDayFact.objects.filter(spec_hash__in=spec_hashes, date__gte=start, date__lte=end):
+        days = stored[fact.spec_hash]
+        if fact.date in days:
+            days[fact.date] = fact.rows
+    return stored
+
+
+def _save(new_facts, new_coverage):
+    """
+    Guarda los días con filas y amplía la cobertura de cada reporte con los
+    rangos pedidos ({spec_hash: [(inicio, fin)]}), uniendo rangos contiguos.
+    """
+    new_coverage = {spec_hash: ranges for spec_hash, ranges in new_coverage.items() if ranges}
+    if not new_coverage:
+        return
+
+    with transaction.atomic():
+        ReportDayFact.objects.bulk_create(new_facts, batch_size=500, ignore_conflicts=True)
+        for spec_hash, ranges in new_coverage.items():
+            existing = ReportCoverage.objects.filter(spec_hash=spec_hash)
+            merged = _merge_ranges(list(existing.values_list("start_date", "end_date")) + ranges)
+            existing.delete()
+            ReportCoverage.objects.bulk_create(
+                [ReportCoverage(spec_hash=spec_hash, start_date=s, end_date=e) for s, e in merged]
+            )
+
+
+def prune(retention_days=RETENTION_DAYS):
+    """
+    Borra hechos y cobertura de los reportes que no piden días nuevos hace
+    más de retention_days. Retorna la cantidad de reportes borrados.
+    """
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    active = ReportCoverage.objects.filter(fetched_at__gte=cutoff).values("spec_hash")
+    stale = list(
+        ReportCoverage.objects.exclude(spec_hash__in=active).values_list("spec_hash", flat=True).distinct()
+    )
+
+    for i in range(0, len(stale), 500):
+        chunk = stale[i:i + 500]
+        with transaction.atomic():
+            ReportDayFact.objects.filter(spec_hash__in=chunk).delete()
+            ReportCoverage.objects.filter(spec_hash__in=chunk).delete()
+
+    # Hechos sin cobertura (no se pueden leer)
+    ReportDayFact.objects.exclude(spec_hash__in=ReportCoverage.objects.values("spec_hash")).delete()
+    return len(stale)
+
+
+def _range_request(spec, start, end):
+    request = RunReportRequest(spec)
+    request.date_ranges = [DateRange(start_date=start.isoformat(), end_date=end.isoformat())]
+    return request
+
+
+def _split_by_day(rows):
+    """Filas con la dimensión date al final -> {date: [[dims], [metrics]]}"""
+    by_day = {}
+    for row in rows:
+        dims = [v.value for v in row.dimension_values]
+        day = datetime.strptime(dims.pop(), "%Y%m%d").date()
+        by_day.setdefault(day, []).append([dims, [v.value for v in row.metric_values]])
+    return by_day
+
+
+def _fetch_by_day(client, spec, start, end):
+    """Consulta GA4 (todas las páginas) y reparte las filas por día: {date: [[dims], [metrics]]}."""
+    return _split_by_day(iter_report_rows(client, _range_request(spec, start, end)))
+
+
+def _format_metric(value):
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def fetch_days(client, request, start_date, end_date):
+    """
+    Retorna {date: [[dims], [metrics]]} para el rango, combinando días guardados
+    con días pedidos a GA4. Los días cerrados recién pedidos se persisten.
+    """
+    start = _parse_date(start_date)
+    end = _parse_date(end_date)
+    spec = _day_spec(request)
+    spec_hash = ga4_cache.request_key(spec)
+
+    settled_until = date.today() - timedelta(days=SETTLING_DAYS)
+
+    stored = _load([spec_hash], start, min(end, settled_until))[spec_hash]
+
+    all_days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    missing = [day for day in all_days if day not in stored]
+
+    result = dict(stored)
+    new_facts = []
+    new_coverage = []
+
+    for range_start, range_end in _missing_ranges(missing):
+        fetched = _fetch_by_day(client, spec, range_start, range_end)
+
+        day = range_start
+        while day <= range_end:
+            rows = fetched.get(day, [])
+            result[day] = rows
+            if day <= settled_until and rows:
+                new_facts.append(ReportDayFact(spec_hash=spec_hash, date=day, rows=rows))
+            day += timedelta(days=1)
+        if range_start <= settled_until:
+            new_coverage.append((range_start, min(range_end, settled_until)))
+
+    _save(new_facts, {spec_hash: new_coverage})
+
+    return result
+
+
+def _sum_days(days):
+    """{date: rows} -> [FactRow] con las métricas sumadas entre días por combinación de dimensiones."""
+    totals = {}
+    for day_rows in days.values():
+        for dims, metrics in day_rows:
+            key = tuple(dims)
+            current = totals.get(key)
+            if current is None:
+                totals[key] = [float(m or 0) for m in metrics]
+            else:
+                for i, m in enumerate(metrics):
+                    current[i] += float(m or 0)
+
+    return [
+        FactRow(dims, [_format_metric(m) for m in metrics])
+        for dims, metrics in totals.items()
+    ]
+
+
+def fetch_rows(client, request, start_date, end_date):
+    """
+    Equivalente a client.run_report(request).rows para el rango indicado,
+    servido desde el almacén por día. Las métricas se suman entre días para
+    cada combinación de dimensiones.
+    """
+    return _sum_days(fetch_days(client, request, start_date, end_date))
@@ -0,0 +1,245 @@
+"""
+Clasificación de páginas en etapas del embudo de marketing.
+
+Las reglas se compilan una sola vez en una expresión regular: una
+alternativa por etapa, cada una un lookahead con todos sus patrones. Las
+alternativas se prueban en orden desde el inicio del path, así que se
+respeta la prioridad original (Conversión > Consideración > Interés).
+El resultado se memoiza por path, de modo que el costo escala con la
+cantidad de paths distintos y no con la de filas.
+
+Los agregados diarios etapa × dispositivo × URL se materializan en
+FunnelDayAggregate, por propiedad: el job diario de resource_index guarda
+los últimos MATERIALIZE_DAYS días cerrados y el comando materialize_funnel
+sirve para rangos más largos o para reclasificar. Un rango se resuelve
+sumando los días guardados en la base; solo los días que GA4 aún puede
+modificar (hoy y ayer) se consultan en vivo, con el caché de ga4_cache.
+Solo se piden a GA4 los tramos contiguos de días faltantes, y cada día se
+materializa una sola vez aunque lleguen varios requests a la vez: los demás
+esperan al que lo está calculando.
+"""
+import os
+import re
+import threading
+from concurrent.futures import Future
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+from django.db import transaction
+from django.db.models import Sum
+from google.analytics.data_v1beta.types import DateRange, Dimension, Metric, RunReportRequest
+
+from . import ga4_cache
+from .fact_store import SETTLING_DAYS, _missing_ranges
+from .ga4_columns import decode_pages
+from .ga4_pagination import iter_report_pages
+from .models import FunnelDayAggregate
+
+ATRACCION = "Atracción"
+INTERES = "Interés"
+CONSIDERACION = "Consideración"
+CONVERSION = "Conversión"
+
+# Orden de presentación del embudo
+STAGES = (ATRACCION, INTERES, CONSIDERACION, CONVERSION)
+
+# Paths de la home (comparación exacta, en minúsculas)
+ATRACCION_PATHS = frozenset(["/", "", "tienda.claro.com.co"])
+
+# Patrones de substring por etapa, en orden de prioridad
+STAGE_PATTERNS = (
+    (CONVERSION, ["thankyou", "resumen-pedido-prepost", "resumen-pedido"]),
+    (CONSIDERACION, ["cart", "delivery", "payments", "pago-a-cuotas", "validacion-otp",
+                     "datos-personales-prepost", "postpago/cambiate-con-tu-mismo-numero/",
+                     "prepago/cambiate-con-tu-mismo-numero/datos-personales"]),
+    (INTERES, ["detalle-producto/", "claro/", "results", "login", "resetpassword"]),
+)
+
+STAGE_CACHE_SIZE = 16384
+
+# Días cerrados que el job diario mantiene materializados (ver resource_index)
+MATERIALIZE_DAYS = int(os.getenv("GA4_FUNNEL_MATERIALIZE_DAYS", "28"))
+
+
+def _compile(stage_patterns):
+    alternatives = []
+    for i, (_, patterns) in enumerate(stage_patterns):
+        alternatives.append(f"(?P<s{i}>(?=.*?(?:{'|'.join(map(re.escape, patterns))})))")
+    return re.compile("|".join(alternatives), re.DOTALL)
+
+
+_STAGE_RE = _compile(STAGE_PATTERNS)
+_STAGE_BY_GROUP = {f"s{i}": stage for i, (stage, _) in enumerate(STAGE_PATTERNS)}
+
+
+@lru_cache(maxsize=STAGE_CACHE_SIZE)
+def get_stage(page_path):
+    """Determina la etapa del funnel basándose en la URL"""
+    path_lower = page_path.lower()
+
+    if path_lower in ATRACCION_PATHS:
+        return ATRACCION
+
+    match = _STAGE_RE.match(path_lower)
+    if match:
+        return _STAGE_BY_GROUP[match.lastgroup]
+    return INTERES  # Por defecto
+
+
+# ============================================================
+# Agregados diarios materializados
+# ============================================================
+# Dispositivo que marca un día como materializado (ver FunnelDayAggregate)
+DAY_MARKER = ""
+
+# {(propiedad, día): Future} de los días que se están materializando
+_lock = threading.Lock()
+_inflight = {}
+
+
+def _parse_date(value):
+    return datetime.strptime(ga4_cache.resolve_date(value), "%Y-%m-%d").date()
+
+
+def _funnel_request(property_id, start, end):
+    return RunReportRequest(
+        property=f"properties/{property_id}",
+        dimensions=[
+            Dimension(name="date"),
+            Dimension(name="deviceCategory"),
+            Dimension(name="pagePath"),
+        ],
+        metrics=[
+            Metric(name="screenPageViews"),
+            Metric(name="eventCount"),
+            Metric(name="userEngagementDuration"),
+        ],
+        date_ranges=[DateRange(start_date=start.isoformat(), end_date=end.isoformat())],
+    )
+
+
+def _fetch_days(client, property_id, start, end):
+    """{date: [FunnelDayAggregate]} del rango (sin guardar), con la etapa ya clasificada."""
+    columns = decode_pages(iter_report_pages(client, _funnel_request(property_id, start, end)))
+    date_codes, dates = columns.codes("date")
+    device_codes, devices = columns.codes("deviceCategory")
+    path_codes, paths = columns.codes("pagePath")
+    stages = [get_stage(path) for path in paths]
+    days = [datetime.strptime(d, "%Y%m%d").date() for d in dates]
+    devices = [d.lower() for d in devices]
+
+    by_day = {}
+    for day, device, path, views, events, time in zip(
+        date_codes.tolist(),
+        device_codes.tolist(),
+        path_codes.tolist(),
+        columns.metric("screenPageViews").tolist(),
+        columns.metric("eventCount").tolist(),
+        columns.metric("userEngagementDuration").tolist(),
+    ):
+        rows = by_day.setdefault(days[day], {})
+        key = (devices[device], path)
+        row = rows.get(key)
+        if row is None:
+            row = rows[key] = FunnelDayAggregate(
+                property_id=property_id, date=days[day], stage=stages[path], device=devices[device], url=paths[path]
+            )
+        row.views += int(views)
+        row.events += int(events)
+        row.engagement_time += float(time)
+    return {day: list(rows.values()) for day, rows in by_day.items()}
+
+
+def materialize(client, property_id, start, end, force=False):
+    """
+    Guarda los agregados de los días cerrados de [start, end]. Sin force
+    solo se piden a GA4 los días aún no materializados. Retorna los días
+    materializados por este llamado.
+    """
+    end = min(end, date.today() - timedelta(days=SETTLING_DAYS))
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    if not force:
+        done = set(
+            FunnelDayAggregate.objects.filter(
+                property_id=property_id, date__gte=start, date__lte=end, device=DAY_MARKER
+            )
+            .values_list("date", flat=True)
+        )
+        days = [day for day in days if day not in done]
+    if not days:
+        return []
+
+    # Días de los que se encarga este llamado; los que ya calcula otro se esperan
+    owned, waiting = [], []
+    with _lock:
+        for day in days:
+            future = _inflight.get((property_id, day))
+            if future is None:
+                _inflight[(property_id, day)] = Future()
+                owned.append(day)
+            else:
+                waiting.append(future)
+
+    try:
+        for range_start, range_end in _missing_ranges(owned):
+            by_day = _fetch_days(client, property_id, range_start, range_end)
+            day = range_start
+            while day <= range_end:
+                rows = by_day.get(day, [])
+                rows.append(FunnelDayAggregate(property_id=property_id, date=day, device=DAY_MARKER))
+                with transaction.atomic():
+                    FunnelDayAggregate.objects.filter(property_id=property_id, date=day).delete()
+                    FunnelDayAggregate.objects.bulk_create(rows, batch_size=1000)
+                _inflight[(property_id, day)].set_result(day)
+                day += timedelta(days=1)
+    except Exception as e:
+        for day in owned:
+            future = _inflight[(property_id, day)]
+            if not future.done():
+                future.set_exception(e)
+        raise
+    finally:
+        with _lock:
+            for day in owned:
+                _inflight.pop((property_id, day), None)
+
+    for future in waiting:
+        future.result()
+    return owned
+
+
+def load_range(client, property_id, start_date, end_date):
+    """
+    [(etapa, dispositivo, url, vistas, eventos, tiempo)] sumados en el rango.
+    Los días cerrados que falten se materializan antes de leer.
+    """
+    start = _parse_date(start_date)
+    end = _parse_date(end_date)
+    settled_until = date.today() - timedelta(days=SETTLING_DAYS)
+
+    totals = {}
+    if start <= settled_until:
+        materialize(client, property_id, start, min(end, settled_until))
+        stored = (
+            FunnelDayAggregate.objects.filter(
+                property_id=property_id, date__gte=start, date__lte=min(end, settled_until)
+            )
+            .exclude(device=DAY_MARKER)
+            .values("stage", "device", "url")
+            .annotate(views=Sum("views"), events=Sum("events"), time=Sum("engagement_time"))
+            .values_list("stage", "device", "url", "views", "events", "time")
+        )
+        for stage, device, url, views, events, time in stored:
+            totals[(stage, device, url)] = [views, events, time]
+
+    # Días en procesamiento: consulta en vivo (cacheada con TTL corto por ga4_cache)
+    if end > settled_until:
+        recent = _fetch_days(client, property_id, max(start, settled_until + timedelta(days=1)), end)
+        for rows in recent.values():
+            for row in rows:
+                current = totals.setdefault((row.stage, row.device, row.url), [0, 0, 0.0])
+                current[0] += row.views
+                current[1] += row.events
+                current[2] += row.engagement_time
+
+    return [key + tuple(values) for key, values in totals.items()]
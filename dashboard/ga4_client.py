@@ -0,0 +1,156 @@
+"""
+Registro de clientes GA4 compartidos por proceso.
+
+Cada worker mantiene un único canal gRPC y un único token OAuth por archivo
+de credenciales, en lugar de reconstruir el cliente en cada request.
+Todos los run_report pasan por la caché de ga4_cache y se registran en
+ga4_metrics (duración, filas, bytes y cuota por endpoint), igual que la
+creación del canal y las renovaciones del token.
+
+El cliente es síncrono: cada request ocupa un hilo del worker gthread de
+gunicorn mientras espera a GA4 (el canal gRPC es seguro entre hilos).
+"""
+import os
+import threading
+import time
+
+import google.auth.transport.requests
+import grpc
+from google.auth.credentials import AnonymousCredentials
+from google.api_core import gapic_v1
+from google.oauth2 import service_account
+from google.analytics.data_v1beta import BetaAnalyticsDataClient
+from google.analytics.data_v1beta.services.beta_analytics_data.transports import BetaAnalyticsDataGrpcTransport
+from google.analytics.data_v1beta.types import BatchRunReportsRequest, RunReportRequest
+
+from . import ga4_cache, ga4_metrics
+
+GA4_SCOPES = ["https://www.googleapis.com/auth/analytics.readonly"]
+
+# Mismos límites que los canales que crea la librería (páginas de 100k filas superan 4 MB)
+STANDIN_CHANNEL_OPTIONS = [
+    ("grpc.max_send_message_length", -1),
+    ("grpc.max_receive_message_length", -1),
+]
+
+_registry_lock = threading.Lock()
+_clients = {}
+
+
+class GA4Client:
+    """
+    Envoltura del cliente GA4 reutilizada por todos los endpoints.
+    Expone la misma interfaz (run_report, batch_run_reports) que
+    BetaAnalyticsDataClient y mantiene el token vigente.
+    """
+
+    def __init__(self, credentials_path, standin_host=None):
+        self.credentials_path = credentials_path
+        self.standin_host = standin_host
+        self._token_lock = threading.Lock()
+
+        started = time.perf_counter()
+        if standin_host:
+            # Servidor local que imita GA4 (ver ga4_standin): canal sin TLS ni token
+            self._credentials = AnonymousCredentials()
+            transport = BetaAnalyticsDataGrpcTransport(
+                channel=grpc.insecure_channel(standin_host, options=STANDIN_CHANNEL_OPTIONS)
+            )
+        else:
+            self._credentials = service_account.Credentials.from_service_account_file(
+                credentials_path, scopes=GA4_SCOPES
+            )
+            transport = BetaAnalyticsDataGrpcTransport(credentials=self._credentials)
+        self._client = BetaAnalyticsDataClient(transport=transport)
+        elapsed = time.perf_counter() - started
+        ga4_metrics.observe_channel_setup(elapsed)
+        print(f"GA4 canal creado en {elapsed * 1000:.1f} ms (pid {os.getpid()})")
+
+        self._ensure_token()
+
+    def _ensure_token(self):
+        """Renueva el token OAuth solo cuando expiró o está por expirar."""
+        if self._credentials.valid:
+            return
+
+        with self._token_lock:
+            if self._credentials.valid:
+                return
+
+            started = time.perf_counter()
+            self._credentials.refresh(google.auth.transport.requests.Request())
+            elapsed = time.perf_counter() - started
+            ga4_metrics.observe_token_refresh(elapsed)
+            print(f"GA4 token renovado en {elapsed * 1000:.1f} ms")
+
+    def run_report(self, request, timeout=None):
+        """timeout=None usa el deadline por defecto de la librería."""
+        fetched = []
+
+        def fetch(req):
+            fetched.append(True)
+            return self._run_report_uncached(req, timeout=timeout)
+
+        started = time.perf_counter()
+        try:
+            response = ga4_cache.cached_run_report(fetch, request)
+        except Exception as e:
+            ga4_metrics.observe_error(e)
+            raise
+
+        ga4_metrics.observe_report(response, time.perf_counter() - started, from_cache=not fetched)
+        return response
+
+    def _run_report_uncached(self, request, timeout=None):
+        self._ensure_token()
+        # Copia: la clave de caché se calcula sobre el request original
+        request = RunReportRequest(request, return_property_quota=True)
+        return self._client.run_report(request, timeout=_deadline(timeout))
+
+    def batch_run_reports(self, request, timeout=None):
+        self._ensure_token()
+        request = BatchRunReportsRequest(request)
+        for report_request in request.requests:
+            report_request.return_property_quota = True
+
+        started = time.perf_counter()
+        try:
+            response = self._client.batch_run_reports(request, timeout=_deadline(timeout))
+        except Exception as e:
+            ga4_metrics.observe_error(e)
+            raise
+
+        # Los reportes del lote comparten un único viaje: todos registran su duración
+        elapsed = time.perf_counter() - started
+        for report in response.reports:
+            ga4_metrics.observe_report(report, elapsed, from_cache=False)
+        return response
+
+
+def _deadline(timeout):
+    return gapic_v1.method.DEFAULT if timeout is None else timeout
+
+
+def get_client(credentials_path=None):
+    """
+    Retorna el cliente GA4 del proceso actual, creándolo la primera vez.
+    La clave incluye el pid para no compartir canales gRPC tras un fork.
+    Con GA4_STANDIN_HOST definido se conecta al servidor local de ga4_standin.
+    """
+    credentials_path = credentials_path or os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+    if not credentials_path:
+        raise ValueError("GOOGLE_APPLICATION_CREDENTIALS no configurado")
+
+    standin_host = os.getenv("GA4_STANDIN_HOST")
+    key = (os.getpid(), credentials_path, standin_host)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _registry_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = GA4Client(credentials_path, standin_host)
+            _clients[key] = client
+    return client
+
@@ -0,0 +1,128 @@
+"""
+Decodificación columnar de respuestas GA4.
+
+Convierte un RunReportResponse en columnas en una sola pasada sobre el
+protobuf crudo (sin los wrappers de proto-plus por celda):
+- Dimensiones: códigos enteros (np.int32) más la lista de valores distintos
+  internados, como una columna categórica.
+- Métricas: arrays NumPy float64 (int64 si GA4 declara TYPE_INTEGER).
+
+Así las vistas suman o agrupan con operaciones vectorizadas en lugar de
+llamar float(row.metric_values[i].value) fila por fila.
+"""
+import sys
+
+import numpy as np
+from google.analytics.data_v1beta.types import MetricType, RunReportResponse
+
+
+class ReportColumns:
+    """Reporte GA4 decodificado por columnas."""
+
+    def __init__(self, dimension_names, metric_names, dimension_columns, metric_columns):
+        self.dimension_names = list(dimension_names)
+        self.metric_names = list(metric_names)
+        # {nombre: (códigos np.int32, valores distintos)}
+        self._dimensions = dict(zip(self.dimension_names, dimension_columns))
+        # {nombre: np.ndarray}
+        self._metrics = dict(zip(self.metric_names, metric_columns))
+
+    def __len__(self):
+        for codes, _ in self._dimensions.values():
+            return len(codes)
+        for values in self._metrics.values():
+            return len(values)
+        return 0
+
+    def codes(self, name):
+        """(códigos, valores distintos) de una dimensión."""
+        return self._dimensions[name]
+
+    def levels(self, name):
+        """Valores distintos presentes en una dimensión."""
+        return self._dimensions[name][1]
+
+    def dimension(self, name):
+        """Columna de una dimensión como lista de strings."""
+        codes, levels = self._dimensions[name]
+        return [levels[c] for c in codes.tolist()]
+
+    def metric(self, name):
+        return self._metrics[name]
+
+    def sum_by(self, dimension_name, metric_name):
+        """{valor de la dimensión: suma de la métrica}."""
+        codes, levels = self._dimensions[dimension_name]
+        totals = np.bincount(codes, weights=self._metrics[metric_name], minlength=len(levels))
+        return dict(zip(levels, totals.tolist()))
+
+    @classmethod
+    def concat(cls, parts):
+        """Une varias páginas del mismo reporte en un solo ReportColumns."""
+        parts = [p for p in parts if p is not None]
+        if not parts:
+            return cls([], [], [], [])
+        if len(parts) == 1:
+            return parts[0]
+
+        first = parts[0]
+        dimension_columns = []
+        for name in first.dimension_names:
+            index = {}
+            remapped = []
+            for part in parts:
+                codes, levels = part._dimensions[name]
+                mapping = np.fromiter(
+                    (index.setdefault(v, len(index)) for v in levels), dtype=np.int32, count=len(levels)
+                )
+                remapped.append(mapping[codes] if len(codes) else codes)
+            dimension_columns.append((np.concatenate(remapped), list(index)))
+
+        metric_columns = [
+            np.concatenate([part._metrics[name] for part in parts]) for name in first.metric_names
+        ]
+        return cls(first.dimension_names, first.metric_names, dimension_columns, metric_columns)
+
+
+def _decode_dimension(rows, position):
+    index = {}
+    codes = np.fromiter(
+        (index.setdefault(row.dimension_values[position].value, len(index)) for row in rows),
+        dtype=np.int32,
+        count=len(rows),
+    )
+    return codes, [sys.intern(value) for value in index]
+
+
+def _decode_metric(rows, position, metric_type):
+    raw = [row.metric_values[position].value for row in rows]
+    try:
+        values = np.array(raw, dtype=np.float64)
+    except ValueError:
+        # Celdas vacías: mismo criterio que float(value or 0) en las vistas
+        values = np.array([float(v or 0) for v in raw], dtype=np.float64)
+
+    if metric_type == MetricType.TYPE_INTEGER:
+        return values.astype(np.int64)
+    return values
+
+
+def decode_response(response):
+    """RunReportResponse -> ReportColumns."""
+    pb = RunReportResponse.pb(response)
+    rows = pb.rows
+
+    dimension_names = [h.name for h in pb.dimension_headers]
+    metric_headers = list(pb.metric_headers)
+
+    return ReportColumns(
+        dimension_names,
+        [h.name for h in metric_headers],
+        [_decode_dimension(rows, i) for i in range(len(dimension_names))],
+        [_decode_metric(rows, i, h.type_) for i, h in enumerate(metric_headers)],
+    )
+
+
+def decode_pages(responses):
+    """Decodifica y concatena las páginas de un reporte (p. ej. de iter_report_pages)."""
+    return ReportColumns.concat([decode_response(response) for response in responses])
@@ -0,0 +1,47 @@
+"""
+Ejecutor concurrente para endpoints que lanzan varios reportes GA4 independientes.
+
+La latencia del endpoint queda acotada por la consulta más lenta en lugar de la
+suma de todas. El canal gRPC del cliente compartido es seguro entre hilos.
+"""
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+MAX_WORKERS = int(os.getenv("GA4_MAX_CONCURRENCY", "8"))
+DEFAULT_TIMEOUT = float(os.getenv("GA4_CALL_TIMEOUT", "60"))
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="ga4")
+
+
+def run_parallel(calls, timeout=DEFAULT_TIMEOUT):
+    """
+    Ejecuta en paralelo un dict {nombre: callable(timeout)} y retorna
+    {nombre: resultado}.
+
+    Cada callable recibe su deadline en segundos para propagarlo a run_report.
+    Si alguna llamada falla o excede el deadline se lanza su excepción.
+    No anidar: los callables no deben invocar run_parallel.
+    """
+    deadline = time.monotonic() + timeout
+    # Cada hilo hereda el contexto (p. ej. el endpoint de ga4_metrics)
+    futures = {
+        name: _executor.submit(contextvars.copy_context().run, call, timeout)
+        for name, call in calls.items()
+    }
+
+    results = {}
+    try:
+        for name, future in futures.items():
+            remaining = max(deadline - time.monotonic(), 0)
+            try:
+                results[name] = future.result(timeout=remaining)
+            except FutureTimeoutError:
+                raise TimeoutError(f"Consulta GA4 '{name}' excedió {timeout:.0f}s")
+    finally:
+        for future in futures.values():
+            future.cancel()
+
+    return results
@@ -0,0 +1,66 @@
+"""
+Compila predicados que las vistas aplicaban en Python sobre cada fila
+en FilterExpressions de GA4, para que el filtrado ocurra en el servidor
+y GA4 devuelva solo las filas relevantes.
+"""
+import re
+from urllib.parse import urlparse
+
+from google.analytics.data_v1beta.types import Filter, FilterExpression, FilterExpressionList
+
+
+def event_name_filter(event_name):
+    """eventName == event_name"""
+    return FilterExpression(
+        filter=Filter(
+            field_name="eventName",
+            string_filter=Filter.StringFilter(
+                match_type=Filter.StringFilter.MatchType.EXACT,
+                value=event_name,
+            ),
+        )
+    )
+
+
+def in_list_filter(field_name, values):
+    """field_name IN values (coincidencia exacta)"""
+    return FilterExpression(
+        filter=Filter(
+            field_name=field_name,
+            in_list_filter=Filter.InListFilter(values=list(values)),
+        )
+    )
+
+
+def page_url_filter(field_name, search_url):
+    """
+    Equivalente en servidor de `_normalize_url(page.lower()) == _normalize_url(search_url.lower())`:
+    mismo esquema (https implícito si falta), host y path sin distinguir
+    mayúsculas, ignorando barras finales, query string y fragmento.
+    """
+    url = search_url.lower()
+    if not url.startswith("http"):
+        url = "https://" + url
+    parsed = urlparse(url)
+
+    scheme = "(https://)?" if parsed.scheme == "https" else re.escape(f"{parsed.scheme}://")
+    pattern = f"{scheme}{re.escape(parsed.netloc + parsed.path.rstrip('/'))}/*([?#;].*)?"
+
+    return FilterExpression(
+        filter=Filter(
+            field_name=field_name,
+            string_filter=Filter.StringFilter(
+                match_type=Filter.StringFilter.MatchType.FULL_REGEXP,
+                value=pattern,
+                case_sensitive=False,
+            ),
+        )
+    )
+
+
+def and_filters(*expressions):
+    """AND de varias FilterExpression (ignora las None)."""
+    expressions = [e for e in expressions if e is not None]
+    if len(expressions) == 1:
+        return expressions[0]
+    return FilterExpression(and_group=FilterExpressionList(expressions=expressions))
@@ -0,0 +1,231 @@
+"""
+Instrumentación de las llamadas run_report por endpoint del dashboard.
+
+GA4Client registra aquí cada reporte: duración (separando caché y GA4),
+filas devueltas, bytes decodificados y tokens de cuota consumidos según
+property_quota. Todo se agrega en histogramas por endpoint y se expone en
+formato de texto de Prometheus (ver views.ga4_prometheus_metrics).
+
+El endpoint actual viaja en un ContextVar que fija el decorador
+instrumented_view por request, de modo que lo heredan los hilos de
+ga4_executor y ga4_pagination.
+"""
+import contextvars
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+from google.analytics.data_v1beta.types import RunReportResponse
+
+from . import ga4_cache
+
+UNKNOWN_ENDPOINT = "unknown"
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+ROWS_BUCKETS = (0, 10, 100, 1000, 10000, 50000, 100000, 250000)
+BYTES_BUCKETS = (1024, 10240, 102400, 1048576, 10485760, 52428800, 104857600)
+QUOTA_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+_endpoint = contextvars.ContextVar("ga4_endpoint", default=UNKNOWN_ENDPOINT)
+
+
+class Histogram:
+    """Histograma acumulativo con etiquetas, seguro entre hilos."""
+
+    def __init__(self, name, help_text, buckets, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = {
+                    "counts": [0] * (len(self.buckets) + 1),
+                    "sum": 0.0,
+                }
+            series["counts"][bisect_left(self.buckets, value)] += 1
+            series["sum"] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {labels: (list(s["counts"]), s["sum"]) for labels, s in self._series.items()}
+
+        for labels, (counts, total) in sorted(snapshot.items()):
+            base = _format_labels(zip(self.label_names, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_with_le(base, _format_number(bound))} {cumulative}")
+            cumulative += counts[-1]
+            lines.append(f"{self.name}_bucket{_with_le(base, '+Inf')} {cumulative}")
+            lines.append(f"{self.name}_sum{base} {_format_number(total)}")
+            lines.append(f"{self.name}_count{base} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        for labels, value in snapshot:
+            lines.append(f"{self.name}{_format_labels(zip(self.label_names, labels))} {value}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(pairs):
+    pairs = list(pairs)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _with_le(base, le):
+    if not base:
+        return f'{{le="{le}"}}'
+    return base[:-1] + f',le="{le}"}}'
+
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+report_duration = Histogram(
+    "ga4_report_duration_seconds",
+    "Duración de run_report por endpoint (source=cache|ga4).",
+    DURATION_BUCKETS,
+    ("endpoint", "source"),
+)
+report_rows = Histogram(
+    "ga4_report_rows",
+    "Filas devueltas por GA4 en cada run_report.",
+    ROWS_BUCKETS,
+    ("endpoint",),
+)
+report_bytes = Histogram(
+    "ga4_report_bytes",
+    "Bytes de la respuesta protobuf decodificada.",
+    BYTES_BUCKETS,
+    ("endpoint",),
+)
+quota_tokens = Histogram(
+    "ga4_quota_tokens",
+    "Tokens de cuota diaria de la propiedad consumidos por run_report.",
+    QUOTA_BUCKETS,
+    ("endpoint",),
+)
+report_errors = Counter(
+    "ga4_report_errors_total",
+    "run_report que terminaron en excepción.",
+    ("endpoint", "error"),
+)
+channel_setup = Histogram(
+    "ga4_channel_setup_seconds",
+    "Creación del canal gRPC del cliente GA4 (una vez por worker y credencial).",
+    DURATION_BUCKETS,
+    (),
+)
+token_refresh = Histogram(
+    "ga4_token_refresh_seconds",
+    "Renovaciones del token OAuth del cliente GA4.",
+    DURATION_BUCKETS,
+    (),
+)
+
+
+# ============================================================
+# API usada por GA4Client y las vistas
+# ============================================================
+@contextmanager
+def endpoint_scope(name):
+    """Atribuye a `name` los reportes GA4 emitidos dentro del bloque."""
+    token = _endpoint.set(name)
+    try:
+        yield
+    finally:
+        _endpoint.reset(token)
+
+
+def instrumented_view(view):
+    """Decorador de vistas: atribuye sus reportes GA4 al nombre de la vista."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with endpoint_scope(view.__name__):
+            return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def current_endpoint():
+    return _endpoint.get()
+
+
+def observe_report(response, seconds, from_cache):
+    endpoint = _endpoint.get()
+    if from_cache:
+        report_duration.observe(seconds, endpoint, "cache")
+        return
+
+    report_duration.observe(seconds, endpoint, "ga4")
+    report_rows.observe(len(response.rows), endpoint)
+    report_bytes.observe(RunReportResponse.pb(response).ByteSize(), endpoint)
+    if "property_quota" in response:
+        quota_tokens.observe(response.property_quota.tokens_per_day.consumed, endpoint)
+
+
+def observe_error(exc):
+    report_errors.inc(_endpoint.get(), type(exc).__name__)
+
+
+def observe_channel_setup(seconds):
+    channel_setup.observe(seconds)
+
+
+def observe_token_refresh(seconds):
+    token_refresh.observe(seconds)
+
+
+def render_prometheus():
+    """Todas las series en formato de exposición de texto de Prometheus."""
+    lines = []
+    for metric in (
+        report_duration, report_rows, report_bytes, quota_tokens, report_errors, channel_setup, token_refresh
+    ):
+        lines.extend(metric.render())
+
+    cache_stats = ga4_cache.get_stats()
+    lines.append("# HELP ga4_cache_hits_total Aciertos de la caché de reportes.")
+    lines.append("# TYPE ga4_cache_hits_total counter")
+    lines.append(f"ga4_cache_hits_total {cache_stats['hits']}")
+    lines.append("# HELP ga4_cache_misses_total Fallos de la caché de reportes.")
+    lines.append("# TYPE ga4_cache_misses_total counter")
+    lines.append(f"ga4_cache_misses_total {cache_stats['misses']}")
+    lines.append("# HELP ga4_cache_entries Respuestas guardadas en la caché.")
+    lines.append("# TYPE ga4_cache_entries gauge")
+    lines.append(f"ga4_cache_entries {cache_stats['size']}")
+    lines.append("# HELP ga4_cache_bytes Memoria estimada de las respuestas en la caché.")
+    lines.append("# TYPE ga4_cache_bytes gauge")
+    lines.append(f"ga4_cache_bytes {cache_stats['bytes']}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,79 @@
+"""
+Iterador de filas para reportes GA4 paginados.
+
+Reemplaza el bucle offset/limit copiado en varias vistas:
+- La primera página se pide en el hilo del llamador; la página N+1 se pide
+  en segundo plano mientras se consume la página N, en un hilo propio del
+  iterador (sin pool compartido: no hay un tope global de páginas en vuelo
+  ni esperas entre pools cuando el llamador ya corre en run_parallel).
+- Ajusta el tamaño de las páginas siguientes con row_count de la respuesta.
+- No retiene las respuestas ya consumidas.
+
+iter_report_pages entrega las respuestas completas (p. ej. para ga4_columns).
+"""
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from google.analytics.data_v1beta.types import RunReportRequest
+
+PAGE_LIMIT = 100000
+
+
+def _page_request(request, offset, limit):
+    page = RunReportRequest(request)
+    page.offset = offset
+    page.limit = limit
+    return page
+
+
+def iter_report_pages(client, request, page_size=PAGE_LIMIT, timeout=None):
+    """
+    Genera las respuestas (páginas) del reporte, una a una.
+    El limit/offset del request original se ignoran. La primera página se
+    entrega aunque venga vacía, para conservar los headers.
+    """
+    context = contextvars.copy_context()
+    prefetch = None
+    future = None
+    response = client.run_report(_page_request(request, 0, page_size), timeout=timeout)
+    offset = 0
+
+    try:
+        while response is not None:
+            page_rows = len(response.rows)
+
+            if not page_rows and offset:
+                return
+
+            offset += page_rows
+            remaining = response.row_count - offset
+
+            # Se lanza la siguiente página antes de entregar la actual
+            future = None
+            if page_rows and remaining > 0:
+                if prefetch is None:
+                    prefetch = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ga4-prefetch")
+                future = prefetch.submit(
+                    context.copy().run,
+                    client.run_report,
+                    _page_request(request, offset, min(page_size, remaining)),
+                    timeout=timeout,
+                )
+
+            yield response
+            del response
+            response = future.result() if future is not None else None
+    finally:
+        if prefetch is not None:
+            if future is not None:
+                future.cancel()
+            prefetch.shutdown(wait=False)
+
+
+def iter_report_rows(client, request, page_size=PAGE_LIMIT, timeout=None):
+    """Genera todas las filas del reporte, página por página."""
+    for page in iter_report_pages(client, request, page_size=page_size, timeout=timeout):
+        rows = page.rows
+        del page
+        yield from rows
+        del rows
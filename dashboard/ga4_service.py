@@ -1,11 +1,12 @@
-from google.analytics.data_v1beta import BetaAnalyticsDataClient
 from google.analytics.data_v1beta.types import DateRange, Metric, Dimension, RunReportRequest
 import os
 
+from .ga4_client import get_client
+
 PROPERTY_ID = os.getenv("GA4_PROPERTY_ID")  # Lo agregaremos luego al .env
 
 def get_daily_users():
-    client = BetaAnalyticsDataClient()
+    client = get_client()
 
     request = RunReportRequest(
         property=f"properties/{PROPERTY_ID}",
@@ -0,0 +1,270 @@
+"""
+Servidor gRPC local que imita la GA4 Data API (RunReport y BatchRunReports).
+
+Sirve respuestas grabadas (un JSON de RunReportResponse por request, nombrado
+con ga4_cache.request_key) o sintéticas, con latencia y cantidad de filas
+configurables. Se usa para medir el backend sin GA4 real:
+
+    GA4_STANDIN_HOST=127.0.0.1:<puerto> hace que ga4_client se conecte aquí.
+"""
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import grpc
+from google.analytics.data_v1beta.types import (
+    BatchRunReportsRequest,
+    BatchRunReportsResponse,
+    DimensionHeader,
+    DimensionValue,
+    MetricHeader,
+    MetricValue,
+    PropertyQuota,
+    QuotaStatus,
+    Row,
+    RunReportRequest,
+    RunReportResponse,
+)
+
+from . import ga4_cache
+
+SERVICE_NAME = "google.analytics.data.v1beta.BetaAnalyticsData"
+
+DEFAULT_LIMIT = 10000
+
+SAMPLE_PAGES = [
+    "/",
+    "/detalle-producto/celular-1",
+    "/claro/planes",
+    "/cart",
+    "/delivery",
+    "/payments",
+    "/thankyou",
+    "/resumen-pedido",
+]
+
+SAMPLE_VALUES = {
+    "deviceCategory": ["mobile", "desktop", "tablet"],
+    "customEvent:resource_type_loadPage": ["script", "img", "css", "fetch"],
+    "customEvent:business_unit2": ["migracion"],
+    "sessionSourceMedium": ["google / cpc", "(direct) / (none)", "superapp / app", "sms / growth"],
+    "sessionCustomChannelGroup:7566460458": ["paid", "organic", "unassigned"],
+    "sessionCustomChannelGroup:8278048377": ["search", "social", "display"],
+}
+
+
+def _filter_values(expression, found=None):
+    """Valores exactos pedidos en filtros AND ({field_name: [valores]})."""
+    found = {} if found is None else found
+    if expression is None:
+        return found
+
+    if "and_group" in expression:
+        for child in expression.and_group.expressions:
+            _filter_values(child, found)
+    elif "filter" in expression:
+        flt = expression.filter
+        if "in_list_filter" in flt:
+            found[flt.field_name] = list(flt.in_list_filter.values)
+        elif "string_filter" in flt and flt.string_filter.match_type in (
+            flt.string_filter.MatchType.EXACT,
+            flt.string_filter.MatchType.MATCH_TYPE_UNSPECIFIED,
+        ):
+            found[flt.field_name] = [flt.string_filter.value]
+    return found
+
+
+def _date_span(request):
+    if not request.date_ranges:
+        today = datetime.today()
+        return today - timedelta(days=6), 7
+
+    start = ga4_cache.resolve_date(request.date_ranges[0].start_date)
+    end = ga4_cache.resolve_date(request.date_ranges[0].end_date)
+    try:
+        start_dt = datetime.strptime(start, "%Y-%m-%d")
+        days = (datetime.strptime(end, "%Y-%m-%d") - start_dt).days + 1
+    except ValueError:
+        start_dt, days = datetime.today() - timedelta(days=6), 7
+    return start_dt, max(days, 1)
+
+
+class StandinConfig:
+    def __init__(self, rows=1000, latency_ms=50, jitter_ms=0, seed=0, recordings_dir=None):
+        self.rows = rows
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.seed = seed
+        self.recordings_dir = recordings_dir
+
+
+class GA4Standin:
+    """Implementación de los métodos RPC; cuenta requests y filas servidas."""
+
+    def __init__(self, config):
+        self.config = config
+        self._lock = threading.Lock()
+        self.requests_served = 0
+        self.rows_served = 0
+
+    # ------------------------------------------------------------------
+    # RPC
+    # ------------------------------------------------------------------
+    def run_report(self, request, context=None):
+        self._sleep()
+        response = self._recorded(request) or self._synthetic(request)
+        with self._lock:
+            self.requests_served += 1
+            self.rows_served += len(response.rows)
+        return response
+
+    def batch_run_reports(self, request, context=None):
+        self._sleep()
+        reports = []
+        for report_request in request.requests:
+            report_request = RunReportRequest(report_request)
+            report_request.property = request.property
+            reports.append(self._recorded(report_request) or self._synthetic(report_request))
+        with self._lock:
+            self.requests_served += 1
+            self.rows_served += sum(len(r.rows) for r in reports)
+        return BatchRunReportsResponse(reports=reports)
+
+    # ------------------------------------------------------------------
+    # Respuestas
+    # ------------------------------------------------------------------
+    def _sleep(self):
+        latency = self.config.latency_ms
+        if self.config.jitter_ms:
+            latency += random.uniform(0, self.config.jitter_ms)
+        if latency > 0:
+            time.sleep(latency / 1000)
+
+    def _recorded(self, request):
+        if not self.config.recordings_dir:
+            return None
+        path = os.path.join(self.config.recordings_dir, f"{ga4_cache.request_key(request)}.json")
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            return RunReportResponse.from_json(f.read(), ignore_unknown_fields=True)
+
+    def _synthetic(self, request):
+        total = self.config.rows if request.dimensions else 1
+        limit = request.limit or DEFAULT_LIMIT
+        offset = request.offset
+        fixed = _filter_values(request.dimension_filter if "dimension_filter" in request else None)
+        start_dt, days = _date_span(request)
+        dimension_names = [d.name for d in request.dimensions]
+
+        order = [
+            o.dimension.dimension_name for o in request.order_bys
+            if "dimension" in o and o.dimension.dimension_name in dimension_names
+        ]
+        if order:
+            # Orden por dimensiones: se generan todas las filas y se entrega el tramo pedido
+            rows = [self._row(request, i, fixed, start_dt, days) for i in range(total)]
+            positions = [dimension_names.index(name) for name in order]
+            rows.sort(key=lambda row: [row.dimension_values[p].value for p in positions])
+            rows = rows[offset:offset + limit]
+        else:
+            rows = [self._row(request, i, fixed, start_dt, days) for i in range(offset, min(offset + limit, total))]
+
+        response = RunReportResponse(
+            dimension_headers=[DimensionHeader(name=d.name) for d in request.dimensions],
+            metric_headers=[MetricHeader(name=m.name) for m in request.metrics],
+            rows=rows,
+            row_count=total,
+        )
+        if request.return_property_quota:
+            response.property_quota = PropertyQuota(
+                tokens_per_day=QuotaStatus(consumed=1 + len(rows) // 1000, remaining=200000),
+                tokens_per_hour=QuotaStatus(consumed=1 + len(rows) // 1000, remaining=40000),
+            )
+        return response
+
+    def _row(self, request, i, fixed, start_dt, days):
+        rng = random.Random(self.config.seed * 1_000_003 + i)
+        return Row(
+            dimension_values=[
+                DimensionValue(value=self._dimension_value(d.name, i, rng, fixed, start_dt, days))
+                for d in request.dimensions
+            ],
+            metric_values=[
+                MetricValue(value=self._metric_value(m.name, rng))
+                for m in request.metrics
+            ],
+        )
+
+    @staticmethod
+    def _dimension_value(name, i, rng, fixed, start_dt, days):
+        if name in fixed:
+            return fixed[name][i % len(fixed[name])]
+
+        day = start_dt + timedelta(days=i % days)
+        if name == "date":
+            return day.strftime("%Y%m%d")
+        if name == "dateHourMinute":
+            return day.strftime("%Y%m%d") + f"{rng.randrange(24):02d}{rng.randrange(60):02d}"
+        if name == "hour":
+            return f"{i % 24:02d}"
+        if name == "pagePath":
+            return SAMPLE_PAGES[i % len(SAMPLE_PAGES)]
+        if name in ("pageLocation", "customEvent:page_location_loadPage"):
+            return "https://tienda.claro.com.co" + SAMPLE_PAGES[i % len(SAMPLE_PAGES)]
+        if name == "customEvent:resource_name_loadPage":
+            if i % 5 == 0:
+                return f"https://www.googletagmanager.com/gtm.js?id=GTM-{i % 7}"
+            return f"https://tienda.claro.com.co/_next/static/chunks/{i % 97}.js"
+        if name == "customEvent:session_id_final":
+            return f"s{i % max(days * 40, 1)}"
+        if name == "transactionId":
+            return f"T{i}"
+        if name in SAMPLE_VALUES:
+            values = SAMPLE_VALUES[name]
+            return values[i % len(values)]
+        return f"{name.split(':')[-1]}-{i % 50}"
+
+    @staticmethod
+    def _metric_value(name, rng):
+        lowered = name.lower()
+        if lowered.startswith("count") or lowered.startswith("keyevents"):
+            return str(rng.randint(1, 500))
+        if any(k in lowered for k in ("duration", "revenue", "time", "size")):
+            return f"{rng.uniform(0.1, 5000):.3f}"
+        return str(rng.randint(1, 500))
+
+
+def serve(config=None, host="127.0.0.1", port=0, max_workers=16):
+    """
+    Arranca el servidor y retorna (server, standin, dirección).
+    Llamar server.stop(0) al terminar.
+    """
+    standin = GA4Standin(config or StandinConfig())
+    handlers = {
+        "RunReport": grpc.unary_unary_rpc_method_handler(
+            standin.run_report,
+            request_deserializer=RunReportRequest.deserialize,
+            response_serializer=RunReportResponse.serialize,
+        ),
+        "BatchRunReports": grpc.unary_unary_rpc_method_handler(
+            standin.batch_run_reports,
+            request_deserializer=BatchRunReportsRequest.deserialize,
+            response_serializer=BatchRunReportsResponse.serialize,
+        ),
+    }
+
+    server = grpc.server(
+        ThreadPoolExecutor(max_workers=max_workers),
+        options=[
+            ("grpc.max_send_message_length", -1),
+            ("grpc.max_receive_message_length", -1),
+        ],
+    )
+    server.add_generic_rpc_handlers((grpc.method_handlers_generic_handler(SERVICE_NAME, handlers),))
+    bound_port = server.add_insecure_port(f"{host}:{port}")
+    server.start()
+    return server, standin, f"{host}:{bound_port}"
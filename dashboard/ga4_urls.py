@@ -0,0 +1,59 @@
+"""
+Normalización de URLs memoizada para los endpoints de recursos.
+
+Los reportes de recursos repiten pocas page_location y resource_name
+distintos en miles de filas. Cada función cachea su resultado (LRU acotado)
+para que una URL repetida cueste una búsqueda en diccionario y no un urlparse.
+"""
+from collections import namedtuple
+from functools import lru_cache
+from urllib.parse import urlparse
+
+URL_CACHE_SIZE = 16384
+
+PageEntry = namedtuple("PageEntry", ["normalized", "host"])
+
+
+@lru_cache(maxsize=URL_CACHE_SIZE)
+def normalize_url(url):
+    """Normaliza URL para comparación (esquema://host/path sin barra final)"""
+    try:
+        if not url.startswith("http"):
+            url = "https://" + url
+        p = urlparse(url)
+        return f"{p.scheme}://{p.netloc}{p.path.rstrip('/')}"
+    except:
+        return url.split("?")[0]
+
+
+@lru_cache(maxsize=URL_CACHE_SIZE)
+def page_entry(page_location):
+    """
+    Índice de páginas: page_location crudo -> (URL normalizada en minúsculas, host).
+    El host sale del valor original, como en la clasificación de recursos.
+    """
+    try:
+        host = urlparse(page_location).netloc
+    except:
+        host = None
+    return PageEntry(normalize_url(page_location.lower()), host)
+
+
+@lru_cache(maxsize=URL_CACHE_SIZE)
+def resource_host(resource_name):
+    """Host del recurso, o el nombre completo si no es una URL"""
+    try:
+        return urlparse(resource_name).netloc or resource_name
+    except:
+        return resource_name
+
+
+def resource_key(resource_name, page_location):
+    """Clave de agrupación: host si el recurso es externo a la página, nombre completo si es interno"""
+    host = resource_host(resource_name)
+    page_host = page_entry(page_location).host
+    if page_host is None:
+        return resource_name
+
+    is_external = host and page_host not in host and host != page_host
+    return host if is_external else resource_name
@@ -0,0 +1,296 @@
+"""
+Percentiles de tiempos (recursos y carga de página) a partir de DDSketches diarios.
+
+GA4 solo entrega sumas y conteos, así que cada sketch se alimenta con el
+promedio de la celda más fina disponible (hora para recursos, minuto para
+la carga de página) ponderado por su cantidad de eventos. Los percentiles
+resultantes son percentiles de esos promedios por celda, no de eventos
+individuales: por eso los campos se llaman p50_of_means, p90_of_means...
+
+Los sketches de días cerrados se guardan en LatencySketch; los de hoy y
+ayer se guardan en memoria con el TTL corto de ga4_cache. Un rango
+cualquiera se resuelve fusionando los sketches de sus días y solo se
+consulta GA4 por los días que faltan.
+
+Con local_only no se consulta GA4: si falta algún día se calcula en segundo
+plano y se retorna None (lo usa el endpoint de recursos cuando responde
+desde el índice local).
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from cachetools import TLRUCache
+from django.db import close_old_connections
+from google.analytics.data_v1beta.types import DateRange, Dimension, Metric, RunReportRequest
+
+from . import ga4_cache, ga4_metrics, ga4_urls, resource_cube
+from .ddsketch import DDSketch
+from .fact_store import SETTLING_DAYS
+from .ga4_columns import decode_pages
+from .ga4_pagination import iter_report_pages
+from .models import LatencySketch
+
+RESOURCE_DURATION = "resource_duration"
+PAGE_LOAD = "page_load"
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+# Segmento que marca un día ya calculado (aunque GA4 no haya devuelto filas)
+DAY_MARKER = ""
+
+RECENT_MAXSIZE = int(os.getenv("GA4_SKETCH_RECENT_MAXSIZE", "512"))
+
+# {(métrica, página, día): [(segmento, sketch)]} de los días aún en procesamiento
+_recent_lock = threading.Lock()
+_recent = TLRUCache(maxsize=RECENT_MAXSIZE, ttu=lambda key, value, now: now + ga4_cache.RECENT_DAYS_TTL)
+
+_warmup_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ga4-sketches")
+_warming = set()
+
+
+def _parse_date(value):
+    return datetime.strptime(ga4_cache.resolve_date(value), "%Y-%m-%d").date()
+
+
+def _sketch_cells(cell_codes, values, weights):
+    """Un DDSketch por código de celda, con los valores ponderados de sus filas."""
+    order = np.argsort(cell_codes, kind="stable")
+    cell_codes, values, weights = cell_codes[order], values[order], weights[order]
+    unique, starts = np.unique(cell_codes, return_index=True)
+    ends = np.append(starts[1:], len(cell_codes))
+
+    sketches = {}
+    for cell, start, end in zip(unique.tolist(), starts.tolist(), ends.tolist()):
+        sketch = DDSketch()
+        sketch.add_many(values[start:end], weights[start:end])
+        sketches[cell] = sketch
+    return sketches
+
+
+def _mean_per_event(totals, events):
+    events = events.astype(np.float64)
+    return np.divide(totals, events, out=np.zeros_like(events), where=events > 0), events
+
+
+def _percentiles(sketch):
+    """{"p50_of_means", "p90_of_means", "p99_of_means"} (ver docstring del módulo)."""
+    return {f"{name}_of_means": value for name, value in sketch.percentiles(QUANTILES).items()}
+
+
+def _load(metric, page, start, end, build, local_only=False):
+    """
+    [(segmento, día, sketch)] del rango. Los días cerrados se leen de la base
+    y los recientes de la memoria; los faltantes se calculan con
+    build(inicio, fin) y se guardan. Con local_only retorna None si falta algún día.
+    """
+    settled_until = date.today() - timedelta(days=SETTLING_DAYS)
+
+    stored = LatencySketch.objects.filter(
+        metric=metric, page=page, date__gte=start, date__lte=min(end, settled_until)
+    ).values_list("segment", "date", "sketch")
+
+    result = []
+    done = set()
+    for segment, day, data in stored:
+        done.add(day)
+        if segment != DAY_MARKER:
+            result.append((segment, day, DDSketch.from_dict(data)))
+
+    with _recent_lock:
+        day = max(start, settled_until + timedelta(days=1))
+        while day <= end:
+            cached = _recent.get((metric, page, day))
+            if cached is not None:
+                done.add(day)
+                result.extend((segment, day, sketch) for segment, sketch in cached)
+            day += timedelta(days=1)
+
+    missing = [
+        start + timedelta(days=i)
+        for i in range((end - start).days + 1)
+        if start + timedelta(days=i) not in done
+    ]
+    if not missing:
+        return result
+    if local_only:
+        return None
+
+    built = build(missing[0], missing[-1])
+    missing = set(missing)
+
+    new_rows = []
+    recent = {day: [] for day in missing if day > settled_until}
+    for (segment, day), sketch in built.items():
+        if day not in missing:
+            continue
+        result.append((segment, day, sketch))
+        if day <= settled_until:
+            new_rows.append(LatencySketch(metric=metric, page=page, segment=segment, date=day, sketch=sketch.to_dict()))
+        else:
+            recent[day].append((segment, sketch))
+
+    with _recent_lock:
+        for day, sketches in recent.items():
+            _recent[(metric, page, day)] = sketches
+
+    new_rows.extend(
+        LatencySketch(metric=metric, page=page, segment=DAY_MARKER, date=day, sketch={})
+        for day in missing
+        if day <= settled_until
+    )
+    LatencySketch.objects.bulk_create(new_rows, ignore_conflicts=True)
+
+    return result
+
+
+def _merge_by(items, key):
+    merged = {}
+    for segment, day, sketch in items:
+        k = key(segment, day)
+        current = merged.get(k)
+        if current is None:
+            merged[k] = current = DDSketch(sketch.relative_accuracy)
+        current.merge(sketch)
+    return merged
+
+
+# ============================================================
+# Recursos de una página (duración por recurso)
+# ============================================================
+def _build_resource_sketches(client, property_id, search_url):
+    def build(start, end):
+        # El cubo del rango ya trae página × recurso × fecha × hora
+        cube = resource_cube.get_cube(client, property_id, search_url, start.isoformat(), end.isoformat())
+        values, weights = _mean_per_event(cube.duration, cube.events)
+
+        n_dates = max(len(cube.date_levels), 1)
+        cells = cube.key_codes.astype(np.int64) * n_dates + cube.date_codes
+        sketches = {}
+        for cell, sketch in _sketch_cells(cells, values, weights).items():
+            key, day = divmod(cell, n_dates)
+            day = datetime.strptime(cube.date_levels[day], "%Y%m%d").date()
+            sketches[(cube.key_levels[key], day)] = sketch
+        return sketches
+
+    return build
+
+
+def _warm_resource_sketches(key, client, property_id, search_url, start_date, end_date):
+    try:
+        with ga4_metrics.endpoint_scope("latency_sketches"):
+            resource_percentiles(client, property_id, search_url, start_date, end_date)
+    except Exception as e:
+        print(f"Error calculando sketches de recursos {key}: {e}")
+    finally:
+        close_old_connections()
+        with _recent_lock:
+            _warming.discard(key)
+
+
+def resource_percentiles(client, property_id, search_url, start_date, end_date, local_only=False):
+    """
+    {clave de recurso: {"p50_of_means", "p90_of_means", "p99_of_means"}} de
+    la duración por evento. Con local_only retorna None (y calcula en segundo
+    plano) si algún día del rango aún no tiene sketch.
+    """
+    page = ga4_urls.normalize_url(search_url.lower())
+    items = _load(
+        RESOURCE_DURATION,
+        page,
+        _parse_date(start_date),
+        _parse_date(end_date),
+        _build_resource_sketches(client, property_id, search_url),
+        local_only=local_only,
+    )
+    if items is None:
+        key = (property_id, page, start_date, end_date)
+        with _recent_lock:
+            if key not in _warming:
+                _warming.add(key)
+                _warmup_executor.submit(
+                    _warm_resource_sketches, key, client, property_id, search_url, start_date, end_date
+                )
+        return None
+
+    merged = _merge_by(items, lambda segment, day: segment)
+    return {key: _percentiles(sketch) for key, sketch in merged.items()}
+
+
+# ============================================================
+# Carga de página (todo el sitio, por dispositivo y hora)
+# ============================================================
+def _build_page_load_sketches(client, property_id):
+    def build(start, end):
+        request = RunReportRequest(
+            property=f"properties/{property_id}",
+            dimensions=[
+                Dimension(name="dateHourMinute"),
+                Dimension(name="deviceCategory"),
+            ],
+            metrics=[
+                Metric(name="customEvent:loading_time_sec"),
+                Metric(name="countCustomEvent:loading_time_sec"),
+            ],
+            date_ranges=[DateRange(start_date=start.isoformat(), end_date=end.isoformat())],
+        )
+        columns = decode_pages(iter_report_pages(client, request))
+        minute_codes, minutes = columns.codes("dateHourMinute")
+        device_codes, devices = columns.codes("deviceCategory")
+        values, weights = _mean_per_event(
+            columns.metric("customEvent:loading_time_sec"),
+            columns.metric("countCustomEvent:loading_time_sec"),
+        )
+
+        # Celda: (día, hora, dispositivo)
+        slots = {}
+        slot_of_minute = np.array(
+            [slots.setdefault((m[:8], m[8:10]), len(slots)) for m in minutes], dtype=np.int64
+        )
+        slot_levels = list(slots)
+        n_devices = max(len(devices), 1)
+        cells = slot_of_minute[minute_codes] * n_devices + device_codes
+
+        sketches = {}
+        for cell, sketch in _sketch_cells(cells, values, weights).items():
+            slot, device = divmod(cell, n_devices)
+            day, hour = slot_levels[slot]
+            sketches[(f"{devices[device]}|{hour}", datetime.strptime(day, "%Y%m%d").date())] = sketch
+        return sketches
+
+    return build
+
+
+def _page_load_items(client, property_id, start_date, end_date):
+    return _load(
+        PAGE_LOAD,
+        "",
+        _parse_date(start_date),
+        _parse_date(end_date),
+        _build_page_load_sketches(client, property_id),
+    )
+
+
+def page_load_percentiles_by_day(client, property_id, start_date, end_date):
+    """{"YYYYMMDD": {"p50_of_means", "p90_of_means", "p99_of_means"}} del tiempo de carga."""
+    merged = _merge_by(
+        _page_load_items(client, property_id, start_date, end_date),
+        lambda segment, day: day.strftime("%Y%m%d"),
+    )
+    return {day: _percentiles(sketch) for day, sketch in merged.items()}
+
+
+def page_load_percentiles_by_device_hour(client, property_id, start_date, end_date):
+    """{(dispositivo, "HH"): {"p50_of_means", "p90_of_means", "p99_of_means"}} del tiempo de carga."""
+    merged = _merge_by(
+        _page_load_items(client, property_id, start_date, end_date),
+        lambda segment, day: tuple(segment.rsplit("|", 1)),
+    )
+    return {key: _percentiles(sketch) for key, sketch in merged.items()}
+
+
+def clear():
+    with _recent_lock:
+        _recent.clear()
@@ -0,0 +1,55 @@
+"""
+Job diario de regresiones de recursos (ver dashboard/resource_regressions.py).
+
+    python manage.py detect_resource_regressions
+    python manage.py detect_resource_regressions --date 2025-11-20 --baseline-days 21
+
+Guarda las estadísticas del último día cerrado (y las que falten de la
+línea base) y recalcula sus regresiones. En producción el job corre solo,
+una vez al día, en el hilo del índice de recursos de uno de los workers web
+(que comparten la base SQLite local); este comando sirve para recalcular a
+mano, p. ej. un día pasado o con otra línea base.
+"""
+import os
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard import ga4_client, resource_regressions
+
+
+class Command(BaseCommand):
+    help = "Calcula estadísticas diarias de recursos y marca regresiones frente a la línea base"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date", help="Día a evaluar (YYYY-MM-DD); por defecto el último día cerrado")
+        parser.add_argument("--baseline-days", type=int, default=resource_regressions.BASELINE_DAYS)
+        parser.add_argument("--force", action="store_true", help="Recalcula también los días ya guardados")
+
+    def handle(self, *args, **options):
+        property_id = os.getenv("GA4_PROPERTY_ID")
+        if not os.getenv("GOOGLE_APPLICATION_CREDENTIALS") or not property_id:
+            raise CommandError("Credenciales o property ID no definidas")
+
+        day = None
+        if options["date"]:
+            try:
+                day = date.fromisoformat(options["date"])
+            except ValueError:
+                raise CommandError("--date debe tener formato YYYY-MM-DD")
+
+        processed, regressions = resource_regressions.run(
+            ga4_client.get_client(),
+            property_id,
+            day=day,
+            baseline_days=options["baseline_days"],
+            force=options["force"],
+        )
+
+        self.stdout.write(f"Días procesados: {len(processed)}")
+        for r in sorted(regressions, key=lambda r: r.zscore, reverse=True):
+            self.stdout.write(
+                f"⚠️ {r.date} {r.metric} {r.page} {r.resource}: "
+                f"{r.value:.3f} vs {r.baseline_mean:.3f} (z={r.zscore:.1f})"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Regresiones: {len(regressions)}"))
@@ -0,0 +1,244 @@
+"""
+Benchmark de los endpoints del dashboard contra el servidor local de ga4_standin.
+
+    python manage.py ga4_benchmark --latency-ms 80 --rows 5000 --iterations 20
+
+Recorre todas las rutas de dashboard/urls.py por la pila WSGI completa
+(middlewares, vistas, cliente gRPC real) y reporta por endpoint la
+latencia p50/p95, filas GA4 procesadas por segundo y el pico de memoria.
+
+Sin --warm-cache cada iteración parte en frío: se vacían todas las cachés en
+memoria (reportes, cubo e índice de recursos, sketches, pertenencia de
+sesiones, caminos de clicks) y las tablas locales que alimentan. Las rutas
+que responden 202 (cálculo en segundo plano) se consultan hasta obtener el
+resultado, y la latencia medida es la de esa espera completa.
+"""
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.test import Client
+from django.test.utils import setup_databases, teardown_databases
+
+from dashboard import (
+    click_paths,
+    ga4_cache,
+    ga4_standin,
+    latency_sketches,
+    resource_cube,
+    resource_index,
+    session_flows,
+)
+from dashboard.models import (
+    FunnelDayAggregate,
+    LatencySketch,
+    ReportCoverage,
+    ReportDayFact,
+    ResourceDailyStat,
+    ResourceRegression,
+    SessionLocator,
+)
+from dashboard.urls import urlpatterns
+
+URL_PREFIX = "/api/"
+
+# Espera entre consultas a una ruta que respondió 202, y máximo total
+PENDING_POLL_SECONDS = 0.05
+PENDING_TIMEOUT_SECONDS = 120
+
+# Parámetros de query por ruta; las rutas sin entrada se llaman sin parámetros
+ROUTE_PARAMS = {
+    "dashboard/click_detail/<str:elemento>/": {"_path": {"elemento": "btn_comprar"}},
+    "dashboard/user_click_flow/": {"session_id": "s1"},
+    "dashboard/user_click_flows/": {"session_ids": "s1,s2,s3"},
+    "dashboard/click_paths/": {"start": "2025-01-01", "end": "2025-01-07"},
+    "dashboard/resources/general/": {"url": "tienda.claro.com.co/cart"},
+    "dashboard/resources/hourly/": {
+        "url": "tienda.claro.com.co/cart",
+        "resources": "https://tienda.claro.com.co/_next/static/chunks/1.js",
+    },
+    "dashboard/resources/daily/": {
+        "url": "tienda.claro.com.co/cart",
+        "resources": "https://tienda.claro.com.co/_next/static/chunks/1.js",
+    },
+    "dashboard/resources/cube/": {"url": "tienda.claro.com.co/cart"},
+    "dashboard/sesiones-vs-compras-comparacion/": {
+        "p1_start": "2025-01-01", "p1_end": "2025-01-07",
+        "p2_start": "2025-02-01", "p2_end": "2025-02-07",
+    },
+    "dashboard/traffic-channel-summary/": {"start_date": "2025-01-01", "end_date": "2025-01-07"},
+    "dashboard/ga4-traffic-detail-summary/": {"start_date": "2025-01-01", "end_date": "2025-01-07"},
+    "dashboard/ga4_subcanal_owned_view/": {
+        "period_1_start": "2025-01-01", "period_1_end": "2025-01-07",
+        "period_2_start": "2025-02-01", "period_2_end": "2025-02-07",
+    },
+}
+
+
+def _route_url(route):
+    params = dict(ROUTE_PARAMS.get(route, {}))
+    path = route
+    for name, value in params.pop("_path", {}).items():
+        path = path.replace(f"<str:{name}>", value)
+    return URL_PREFIX + path, params
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = "Mide latencia, filas/s y memoria de cada endpoint contra un GA4 simulado"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--latency-ms", type=float, default=50, help="Latencia simulada por RPC")
+        parser.add_argument("--jitter-ms", type=float, default=0, help="Latencia adicional aleatoria por RPC")
+        parser.add_argument("--rows", type=int, default=1000, help="Filas totales por reporte sintético")
+        parser.add_argument("--iterations", type=int, default=10)
+        parser.add_argument("--concurrency", type=int, default=1, help="Requests simultáneos por iteración")
+        parser.add_argument("--recordings", help="Directorio con respuestas grabadas (<request_key>.json)")
+        parser.add_argument("--warm-cache", action="store_true", help="No limpiar caché ni fact store entre iteraciones")
+        parser.add_argument("--only", nargs="*", help="Subcadenas de las rutas a medir")
+        parser.add_argument("--json", dest="json_path", help="Guardar resultados en este archivo")
+
+    def handle(self, *args, **options):
+        config = ga4_standin.StandinConfig(
+            rows=options["rows"],
+            latency_ms=options["latency_ms"],
+            jitter_ms=options["jitter_ms"],
+            recordings_dir=options["recordings"],
+        )
+        server, standin, address = ga4_standin.serve(config)
+
+        os.environ["GA4_STANDIN_HOST"] = address
+        os.environ.setdefault("GOOGLE_APPLICATION_CREDENTIALS", "ga4-standin")
+        os.environ.setdefault("GA4_PROPERTY_ID", "0")
+
+        # SQLite en memoria bloquea la tabla completa ante escrituras concurrentes;
+        # un archivo temporal se comporta como la base de producción
+        database = settings.DATABASES["default"]
+        if database["ENGINE"].endswith("sqlite3"):
+            database.setdefault("TEST", {})["NAME"] = os.path.join(tempfile.mkdtemp(), "benchmark.sqlite3")
+
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            # Las vistas imprimen trazas de depuración por cada request
+            with contextlib.redirect_stdout(io.StringIO()):
+                results = self._run(standin, options)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            server.stop(0)
+
+        self._report(results)
+        if options["json_path"]:
+            with open(options["json_path"], "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Resultados guardados en {options['json_path']}")
+
+    def _run(self, standin, options):
+        client = Client()
+        # Un hilo por request simultáneo, como los hilos de un worker gthread
+        pool = ThreadPoolExecutor(max_workers=options["concurrency"])
+        routes = [str(p.pattern) for p in urlpatterns]
+        if options["only"]:
+            routes = [r for r in routes if any(s in r for s in options["only"])]
+
+        results = []
+        for route in routes:
+            url, params = _route_url(route)
+            latencies, statuses = [], set()
+            rows_before = standin.rows_served
+            elapsed_total = 0.0
+
+            for _ in range(options["iterations"]):
+                if not options["warm_cache"]:
+                    self._reset_caches()
+
+                started = time.perf_counter()
+                timings = list(pool.map(
+                    lambda _: self._timed_get(Client(), url, params), range(options["concurrency"])
+                ))
+                elapsed_total += time.perf_counter() - started
+
+                for status, ms in timings:
+                    statuses.add(status)
+                    latencies.append(ms)
+
+            rows = standin.rows_served - rows_before
+
+            # Memoria en una pasada aparte: tracemalloc distorsiona la latencia
+            if not options["warm_cache"]:
+                self._reset_caches()
+            tracemalloc.start()
+            self._timed_get(client, url, params)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            results.append({
+                "route": route,
+                "status": sorted(statuses),
+                "p50_ms": round(_percentile(latencies, 50), 2),
+                "p95_ms": round(_percentile(latencies, 95), 2),
+                "rows_per_s": round(rows / elapsed_total, 1) if elapsed_total else 0.0,
+                "peak_mb": round(peak / 1024 / 1024, 2),
+            })
+
+        pool.shutdown()
+        return results
+
+    @staticmethod
+    def _timed_get(client, url, params):
+        started = time.perf_counter()
+        try:
+            response = client.get(url, params)
+            while response.status_code == 202 and time.perf_counter() - started < PENDING_TIMEOUT_SECONDS:
+                time.sleep(PENDING_POLL_SECONDS)
+                response = client.get(url, params)
+        finally:
+            # El Client de pruebas no cierra las conexiones de los hilos del pool
+            close_old_connections()
+        return response.status_code, (time.perf_counter() - started) * 1000
+
+    @staticmethod
+    def _reset_caches():
+        ga4_cache.clear()
+        resource_cube.clear()
+        resource_index.clear()
+        latency_sketches.clear()
+        session_flows.clear()
+        click_paths.clear()
+        for model in (
+            ReportDayFact,
+            ReportCoverage,
+            FunnelDayAggregate,
+            LatencySketch,
+            ResourceDailyStat,
+            ResourceRegression,
+            SessionLocator,
+        ):
+            model.objects.all().delete()
+
+    def _report(self, results):
+        header = f"{'endpoint':<48} {'status':>8} {'p50 ms':>9} {'p95 ms':>9} {'filas/s':>11} {'pico MB':>8}"
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for r in results:
+            status = ",".join(str(s) for s in r["status"])
+            line = (
+                f"{r['route']:<48} {status:>8} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} "
+                f"{r['rows_per_s']:>11.0f} {r['peak_mb']:>8.2f}"
+            )
+            if any(s >= 400 for s in r["status"]):
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(line)
@@ -0,0 +1,43 @@
+"""
+Materializa los agregados diarios del embudo (ver dashboard/funnel.py).
+
+    python manage.py materialize_funnel
+    python manage.py materialize_funnel --days 90
+    python manage.py materialize_funnel --start 2025-10-01 --end 2025-10-31 --force
+
+El job diario de resource_index ya mantiene materializados los últimos
+funnel.MATERIALIZE_DAYS días cerrados; este comando sirve para llenar rangos
+más largos de una vez o, con --force, para reclasificar los días ya
+guardados tras cambiar las reglas de etapas.
+"""
+import os
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard import funnel, ga4_client
+from dashboard.fact_store import SETTLING_DAYS
+
+
+class Command(BaseCommand):
+    help = "Materializa los agregados diarios etapa × dispositivo × URL del embudo"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=funnel.MATERIALIZE_DAYS, help="Días hacia atrás desde el último día cerrado")
+        parser.add_argument("--start", help="Inicio (YYYY-MM-DD); reemplaza a --days")
+        parser.add_argument("--end", help="Fin (YYYY-MM-DD); por defecto el último día cerrado")
+        parser.add_argument("--force", action="store_true", help="Vuelve a pedir y reclasificar los días ya guardados")
+
+    def handle(self, *args, **options):
+        property_id = os.getenv("GA4_PROPERTY_ID")
+        if not os.getenv("GOOGLE_APPLICATION_CREDENTIALS") or not property_id:
+            raise CommandError("Credenciales o property ID no definidas")
+
+        try:
+            end = date.fromisoformat(options["end"]) if options["end"] else date.today() - timedelta(days=SETTLING_DAYS)
+            start = date.fromisoformat(options["start"]) if options["start"] else end - timedelta(days=options["days"])
+        except ValueError:
+            raise CommandError("--start y --end deben tener formato YYYY-MM-DD")
+
+        days = funnel.materialize(ga4_client.get_client(), property_id, start, end, force=options["force"])
+        self.stdout.write(self.style.SUCCESS(f"Días materializados: {len(days)} ({start} a {end})"))
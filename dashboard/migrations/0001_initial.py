@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-17 14:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportDayFact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('spec_hash', models.CharField(max_length=64)),
+                ('date', models.DateField()),
+                ('rows', models.JSONField(default=list)),
+                ('fetched_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('spec_hash', 'date'), name='unique_report_day_fact')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-17 14:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatencySketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(max_length=32)),
+                ('page', models.CharField(blank=True, default='', max_length=512)),
+                ('segment', models.CharField(blank=True, default='', max_length=512)),
+                ('date', models.DateField()),
+                ('sketch', models.JSONField(default=dict)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['metric', 'page', 'date'], name='latency_sketch_lookup')],
+                'constraints': [models.UniqueConstraint(fields=('metric', 'page', 'segment', 'date'), name='unique_latency_sketch')],
+            },
+        ),
+    ]
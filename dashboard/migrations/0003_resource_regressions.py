@@ -0,0 +1,52 @@
+# Generated by Django 5.2.8 on 2026-10-17 15:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0002_latency_sketch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResourceDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page', models.CharField(max_length=512)),
+                ('resource', models.CharField(max_length=512)),
+                ('resource_type', models.CharField(blank=True, default='', max_length=64)),
+                ('date', models.DateField()),
+                ('events', models.FloatField(default=0)),
+                ('duration_avg', models.FloatField(default=0)),
+                ('size_avg', models.FloatField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date'], name='resource_daily_stat_date')],
+                'constraints': [models.UniqueConstraint(fields=('page', 'resource', 'date'), name='unique_resource_daily_stat')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ResourceRegression',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page', models.CharField(max_length=512)),
+                ('resource', models.CharField(max_length=512)),
+                ('resource_type', models.CharField(blank=True, default='', max_length=64)),
+                ('metric', models.CharField(max_length=16)),
+                ('date', models.DateField()),
+                ('value', models.FloatField()),
+                ('baseline_mean', models.FloatField()),
+                ('baseline_std', models.FloatField()),
+                ('baseline_days', models.IntegerField()),
+                ('zscore', models.FloatField()),
+                ('events', models.FloatField(default=0)),
+                ('detected_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date', 'page'], name='resource_regression_lookup')],
+                'constraints': [models.UniqueConstraint(fields=('page', 'resource', 'metric', 'date'), name='unique_resource_regression')],
+            },
+        ),
+    ]
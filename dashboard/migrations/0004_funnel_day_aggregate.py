@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-17 15:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0003_resource_regressions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FunnelDayAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('stage', models.CharField(blank=True, default='', max_length=32)),
+                ('device', models.CharField(blank=True, default='', max_length=32)),
+                ('url', models.CharField(blank=True, default='', max_length=1024)),
+                ('views', models.BigIntegerField(default=0)),
+                ('events', models.BigIntegerField(default=0)),
+                ('engagement_time', models.FloatField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date', 'stage'], name='funnel_day_lookup')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'device', 'url'), name='unique_funnel_day_aggregate')],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.8 on 2026-10-17 15:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0004_funnel_day_aggregate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SessionLocator',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_id', models.CharField(max_length=255, unique=True)),
+                ('first_date', models.DateField()),
+                ('last_date', models.DateField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.8 on 2026-10-17 16:20
+
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def coverage_from_facts(apps, schema_editor):
+    """Un rango de cobertura por tramo contiguo de días guardados; los días vacíos se borran."""
+    ReportDayFact = apps.get_model('dashboard', 'ReportDayFact')
+    ReportCoverage = apps.get_model('dashboard', 'ReportCoverage')
+
+    ranges = {}
+    empty = []
+    for fact_id, spec_hash, day, rows in ReportDayFact.objects.order_by('spec_hash', 'date').values_list(
+        'id', 'spec_hash', 'date', 'rows'
+    ).iterator():
+        spec_ranges = ranges.setdefault(spec_hash, [])
+        if spec_ranges and spec_ranges[-1][1] + timedelta(days=1) == day:
+            spec_ranges[-1][1] = day
+        else:
+            spec_ranges.append([day, day])
+        if not rows:
+            empty.append(fact_id)
+
+    ReportCoverage.objects.bulk_create(
+        [
+            ReportCoverage(spec_hash=spec_hash, start_date=start, end_date=end)
+            for spec_hash, spec_ranges in ranges.items()
+            for start, end in spec_ranges
+        ],
+        batch_size=1000,
+    )
+    for i in range(0, len(empty), 500):
+        ReportDayFact.objects.filter(id__in=empty[i:i + 500]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0005_session_locator'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportCoverage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('spec_hash', models.CharField(max_length=64)),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+                ('fetched_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['spec_hash', 'start_date'], name='report_coverage_lookup')],
+            },
+        ),
+        migrations.RunPython(coverage_from_facts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-17 17:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0006_report_coverage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyJobRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64)),
+                ('date', models.DateField()),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('name', 'date'), name='unique_daily_job_run')],
+            },
+        ),
+    ]
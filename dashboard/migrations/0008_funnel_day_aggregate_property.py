@@ -0,0 +1,41 @@
+# Generated by Django 5.2.8 on 2026-10-17 18:05
+
+from django.db import migrations, models
+
+
+def drop_aggregates(apps, schema_editor):
+    """Los agregados existentes no dicen de qué propiedad son: se vuelven a materializar."""
+    apps.get_model('dashboard', 'FunnelDayAggregate').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0007_daily_job_run'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_aggregates, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='funneldayaggregate',
+            name='unique_funnel_day_aggregate',
+        ),
+        migrations.RemoveIndex(
+            model_name='funneldayaggregate',
+            name='funnel_day_lookup',
+        ),
+        migrations.AddField(
+            model_name='funneldayaggregate',
+            name='property_id',
+            field=models.CharField(default='', max_length=32),
+            preserve_default=False,
+        ),
+        migrations.AddConstraint(
+            model_name='funneldayaggregate',
+            constraint=models.UniqueConstraint(fields=('property_id', 'date', 'device', 'url'), name='unique_funnel_day_aggregate'),
+        ),
+        migrations.AddIndex(
+            model_name='funneldayaggregate',
+            index=models.Index(fields=['property_id', 'date', 'stage'], name='funnel_day_lookup'),
+        ),
+    ]
@@ -1,3 +1,191 @@
 from django.db import models
 
-# Create your models here.
+
+class ReportDayFact(models.Model):
+    """
+    Filas de un reporte GA4 para un único día cerrado con datos.
+    spec_hash identifica el reporte (propiedad, dimensiones, métricas, filtros)
+    sin el rango de fechas. Qué días se pidieron se guarda en ReportCoverage.
+    """
+    spec_hash = models.CharField(max_length=64)
+    date = models.DateField()
+    rows = models.JSONField(default=list)
+    fetched_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["spec_hash", "date"], name="unique_report_day_fact"),
+        ]
+
+    def __str__(self):
+        return f"{self.spec_hash[:12]} {self.date}"
+
+
+class ReportCoverage(models.Model):
+    """
+    Rango de días cerrados [start_date, end_date] ya pedido a GA4 para un
+    reporte. Solo los días con filas tienen ReportDayFact: un día cubierto
+    sin hecho guardado es un día vacío.
+    """
+    spec_hash = models.CharField(max_length=64)
+    start_date = models.DateField()
+    end_date = models.DateField()
+    fetched_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["spec_hash", "start_date"], name="report_coverage_lookup"),
+        ]
+
+    def __str__(self):
+        return f"{self.spec_hash[:12]} {self.start_date}..{self.end_date}"
+
+
+class LatencySketch(models.Model):
+    """
+    DDSketch (ver ddsketch.py) de una métrica de tiempo para un día cerrado.
+    - metric: "resource_duration" o "page_load"
+    - page: URL normalizada de la página ("" para todo el sitio)
+    - segment: clave del recurso, o "dispositivo|hora" para page_load.
+      El segmento "" marca el día como calculado aunque no tenga datos.
+    """
+    metric = models.CharField(max_length=32)
+    page = models.CharField(max_length=512, blank=True, default="")
+    segment = models.CharField(max_length=512, blank=True, default="")
+    date = models.DateField()
+    sketch = models.JSONField(default=dict)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["metric", "page", "segment", "date"], name="unique_latency_sketch"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["metric", "page", "date"], name="latency_sketch_lookup"),
+        ]
+
+    def __str__(self):
+        return f"{self.metric} {self.page} {self.segment} {self.date}"
+
+
+class ResourceDailyStat(models.Model):
+    """
+    Estadísticas de un recurso en una página para un día cerrado
+    (evento resource_performance). Base de la detección de regresiones.
+    - resource: clave de agrupación (host externo o nombre completo)
+    - duration_avg / size_avg: por evento, en segundos y bytes
+    """
+    page = models.CharField(max_length=512)
+    resource = models.CharField(max_length=512)
+    resource_type = models.CharField(max_length=64, blank=True, default="")
+    date = models.DateField()
+    events = models.FloatField(default=0)
+    duration_avg = models.FloatField(default=0)
+    size_avg = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["page", "resource", "date"], name="unique_resource_daily_stat"),
+        ]
+        indexes = [
+            models.Index(fields=["date"], name="resource_daily_stat_date"),
+        ]
+
+    def __str__(self):
+        return f"{self.page} {self.resource} {self.date}"
+
+
+class ResourceRegression(models.Model):
+    """
+    Recurso cuyo promedio del día supera de forma significativa su línea
+    base de días anteriores (ver resource_regressions.py).
+    - metric: "duration" (segundos) o "size" (bytes)
+    """
+    page = models.CharField(max_length=512)
+    resource = models.CharField(max_length=512)
+    resource_type = models.CharField(max_length=64, blank=True, default="")
+    metric = models.CharField(max_length=16)
+    date = models.DateField()
+    value = models.FloatField()
+    baseline_mean = models.FloatField()
+    baseline_std = models.FloatField()
+    baseline_days = models.IntegerField()
+    zscore = models.FloatField()
+    events = models.FloatField(default=0)
+    detected_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["page", "resource", "metric", "date"], name="unique_resource_regression"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["date", "page"], name="resource_regression_lookup"),
+        ]
+
+    def __str__(self):
+        return f"{self.metric} {self.page} {self.resource} {self.date}"
+
+
+class FunnelDayAggregate(models.Model):
+    """
+    Vistas, eventos y tiempo de interacción de una URL por dispositivo para
+    un día cerrado de una propiedad GA4, con su etapa del embudo ya
+    clasificada (ver funnel.py). La fila con device "" marca el día como
+    materializado aunque no tenga datos.
+    """
+    property_id = models.CharField(max_length=32)
+    date = models.DateField()
+    stage = models.CharField(max_length=32, blank=True, default="")
+    device = models.CharField(max_length=32, blank=True, default="")
+    url = models.CharField(max_length=1024, blank=True, default="")
+    views = models.BigIntegerField(default=0)
+    events = models.BigIntegerField(default=0)
+    engagement_time = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["property_id", "date", "device", "url"], name="unique_funnel_day_aggregate"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["property_id", "date", "stage"], name="funnel_day_lookup"),
+        ]
+
+    def __str__(self):
+        return f"{self.property_id} {self.date} {self.stage} {self.device} {self.url}"
+
+
+class SessionLocator(models.Model):
+    """
+    Primer y último día en que se vio un session_id_final (en compras del
+    detalle de clicks o de Genia). Permite acotar la consulta del flujo de
+    clicks de una sesión a sus propios días.
+    """
+    session_id = models.CharField(max_length=255, unique=True)
+    first_date = models.DateField()
+    last_date = models.DateField()
+
+    def __str__(self):
+        return f"{self.session_id} {self.first_date}..{self.last_date}"
+
+
+class DailyJobRun(models.Model):
+    """
+    Turno de un job diario ya tomado por algún proceso. La restricción única
+    hace que, con varios workers, solo uno corra el job de cada día.
+    """
+    name = models.CharField(max_length=64)
+    date = models.DateField()
+    started_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["name", "date"], name="unique_daily_job_run"),
+        ]
+
+    def __str__(self):
+        return f"{self.name} {self.date}"
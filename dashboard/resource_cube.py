@@ -0,0 +1,221 @@
+"""
+Cubo de recursos de una página: página × recurso × tipo × fecha × hora.
+
+Se consulta a GA4 una sola vez por (página, rango) y se guarda en memoria.
+El ranking general, el perfil por hora y la serie diaria se derivan del
+cubo localmente, así que los tres endpoints de recursos (y el detalle de
+cada recurso en la UI) comparten una única consulta.
+"""
+import os
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+from cachetools import TLRUCache
+from google.analytics.data_v1beta.types import DateRange, Dimension, Metric, RunReportRequest
+
+from . import ga4_cache, ga4_filters, ga4_urls, resource_index
+from .aggregates import ResourceTotals
+from .ga4_columns import decode_pages
+from .ga4_pagination import iter_report_pages
+
+CUBE_CACHE_MAXSIZE = int(os.getenv("GA4_RESOURCE_CUBE_MAXSIZE", "32"))
+
+PAGE = "customEvent:page_location_loadPage"
+RESOURCE = "customEvent:resource_name_loadPage"
+RESOURCE_TYPE = "customEvent:resource_type_loadPage"
+
+EVENTS = "eventCount"
+DURATION = "customEvent:resource_total_duration_loadPage"
+SIZE = "customEvent:resource_total_size_loadPage"
+REPEAT = "customEvent:resource_repeat_count_loadPage"
+
+_lock = threading.Lock()
+_cache = TLRUCache(
+    maxsize=CUBE_CACHE_MAXSIZE,
+    ttu=lambda key, value, now: now + value[1],
+)
+# Cubos en construcción: los requests simultáneos de la misma página esperan al primero
+_inflight = {}
+
+
+def _group(codes, size, *weights):
+    """Suma cada array de `weights` por código."""
+    return [np.bincount(codes, weights=w, minlength=size) for w in weights]
+
+
+def _first_seen(codes):
+    """(código, fila de su primera aparición) en orden de aparición."""
+    unique, first = np.unique(codes, return_index=True)
+    order = np.argsort(first, kind="stable")
+    return zip(unique[order].tolist(), first[order].tolist())
+
+
+class ResourceCube:
+    """Filas de la página buscada, agregables por recurso, hora o fecha."""
+
+    def __init__(self, columns, normalized_search):
+        page_codes, page_levels = columns.codes(PAGE)
+        page_match = np.array(
+            [ga4_urls.page_entry(p).normalized == normalized_search for p in page_levels], dtype=bool
+        )
+        mask = page_match[page_codes]
+
+        resource_codes, self.resource_levels = columns.codes(RESOURCE)
+        type_codes, self.type_levels = columns.codes(RESOURCE_TYPE)
+        date_codes, self.date_levels = columns.codes("date")
+        hour_codes, self.hour_levels = columns.codes("hour")
+
+        page_codes = page_codes[mask]
+        self.resource_codes = resource_codes[mask]
+        self.type_codes = type_codes[mask]
+        self.date_codes = date_codes[mask]
+        self.hour_codes = hour_codes[mask]
+
+        self.events = columns.metric(EVENTS)[mask].astype(np.float64)
+        self.duration = columns.metric(DURATION)[mask].astype(np.float64)
+        self.size = columns.metric(SIZE)[mask].astype(np.float64)
+        self.repeat = columns.metric(REPEAT)[mask].astype(np.float64)
+
+        # Clave de agrupación (host externo o nombre) por par (página, recurso)
+        pairs = page_codes.astype(np.int64) * max(len(self.resource_levels), 1) + self.resource_codes
+        unique_pairs, pair_codes = np.unique(pairs, return_inverse=True)
+        key_index = {}
+        pair_keys = np.empty(len(unique_pairs), dtype=np.int32)
+        for i, pair in enumerate(unique_pairs.tolist()):
+            page, resource = divmod(pair, max(len(self.resource_levels), 1))
+            key = ga4_urls.resource_key(self.resource_levels[resource], page_levels[page])
+            pair_keys[i] = key_index.setdefault(key, len(key_index))
+        self.key_codes = pair_keys[pair_codes]
+        self.key_levels = list(key_index)
+
+    def __len__(self):
+        return len(self.events)
+
+    def totals(self):
+        """
+        {clave: ResourceTotals}, mismo formato que resource_index.
+        El tipo es el de la primera fila de cada clave.
+        """
+        size = len(self.key_levels)
+        events, duration, repeat, transfer = _group(
+            self.key_codes, size, self.events, self.duration, self.repeat, self.size
+        )
+        rows = np.bincount(self.key_codes, minlength=size)
+
+        totals = {}
+        for key, row in _first_seen(self.key_codes):
+            totals[self.key_levels[key]] = ResourceTotals(
+                self.type_levels[self.type_codes[row]],
+                float(events[key]),
+                float(duration[key]),
+                float(repeat[key]),
+                float(transfer[key]),
+                int(rows[key]),
+            )
+        return totals
+
+    def general(self):
+        """Promedios por recurso (por evento), ordenados por duración descendente."""
+        return resource_index.rank_resources(self.totals())
+
+    def hourly(self, resource_names=None):
+        """
+        {clave: {hora: duración promedio}}.
+        Filtra por nombre de recurso exacto (como ga4_resources_hourly).
+        """
+        mask = None
+        if resource_names is not None:
+            wanted = np.array([name in resource_names for name in self.resource_levels], dtype=bool)
+            mask = wanted[self.resource_codes]
+        return self._profile(self.hour_codes, self.hour_levels, mask)
+
+    def daily(self, resource_names=None):
+        """
+        {clave: {fecha: duración promedio}}.
+        Filtra por clave de agrupación (como ga4_resources_daily).
+        """
+        mask = None
+        if resource_names is not None:
+            wanted = np.array([key in resource_names for key in self.key_levels], dtype=bool)
+            mask = wanted[self.key_codes]
+        return self._profile(self.date_codes, self.date_levels, mask)
+
+    def _profile(self, time_codes, time_levels, mask):
+        key_codes, events, duration = self.key_codes, self.events, self.duration
+        if mask is not None:
+            key_codes, time_codes = key_codes[mask], time_codes[mask]
+            events, duration = events[mask], duration[mask]
+
+        cells = key_codes.astype(np.int64) * max(len(time_levels), 1) + time_codes
+        unique, cell_codes = np.unique(cells, return_inverse=True)
+        cell_events, cell_duration = _group(cell_codes, len(unique), events, duration)
+
+        result = {}
+        for cell, count, total in zip(unique.tolist(), cell_events.tolist(), cell_duration.tolist()):
+            key, moment = divmod(cell, max(len(time_levels), 1))
+            values = result.setdefault(self.key_levels[key], {})
+            if count > 0:
+                values[time_levels[moment]] = round(total / count, 3)
+        return result
+
+
+def _cube_request(property_id, search_url, start_date, end_date):
+    return RunReportRequest(
+        property=f"properties/{property_id}",
+        dimensions=[
+            Dimension(name=PAGE),
+            Dimension(name=RESOURCE),
+            Dimension(name=RESOURCE_TYPE),
+            Dimension(name="date"),
+            Dimension(name="hour"),
+        ],
+        metrics=[
+            Metric(name=EVENTS),
+            Metric(name=DURATION),
+            Metric(name=SIZE),
+            Metric(name=REPEAT),
+        ],
+        date_ranges=[DateRange(start_date=start_date, end_date=end_date)],
+        dimension_filter=ga4_filters.and_filters(
+            ga4_filters.event_name_filter("resource_performance"),
+            ga4_filters.page_url_filter(PAGE, search_url),
+        ),
+    )
+
+
+def get_cube(client, property_id, search_url, start_date, end_date):
+    """Cubo de recursos de la página en el rango (una consulta GA4 por página y rango)."""
+    normalized_search = ga4_urls.normalize_url(search_url.lower())
+    key = (property_id, normalized_search, ga4_cache.resolve_date(start_date), ga4_cache.resolve_date(end_date))
+
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            return entry[0]
+        future = _inflight.get(key)
+        owner = future is None
+        if owner:
+            future = _inflight[key] = Future()
+
+    if not owner:
+        return future.result()
+
+    try:
+        request = _cube_request(property_id, search_url, start_date, end_date)
+        cube = ResourceCube(decode_pages(iter_report_pages(client, request)), normalized_search)
+        with _lock:
+            _cache[key] = (cube, ga4_cache.request_ttl(request))
+        future.set_result(cube)
+        return cube
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+
+
+def clear():
+    with _lock:
+        _cache.clear()
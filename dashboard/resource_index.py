@@ -0,0 +1,288 @@
+"""
+Índice invertido página -> estadísticas de recursos, construido en segundo plano.
+
+Un hilo consulta los eventos resource_performance de todas las páginas día
+por día (vía fact_store, que persiste los días cerrados) y agrega, para cada
+página normalizada, los totales por recurso de la ventana de fechas por
+defecto de los endpoints de recursos. Consultar una página es una lectura
+local en un diccionario.
+
+El refresco es incremental: solo se piden a GA4 los días nuevos y los que
+aún están en procesamiento (hoy y ayer); los días que salen de la ventana se
+restan de los totales.
+
+Tras el primer refresco de cada día el hilo corre el mantenimiento de la
+base local (detección de regresiones de recursos, materialización del
+embudo y depuración del almacén de hechos). Cada worker de gunicorn tiene su hilo (ver gunicorn.conf.py),
+pero solo el que toma el turno del día en DailyJobRun corre el
+mantenimiento.
+"""
+import heapq
+import os
+import threading
+from datetime import date, timedelta
+
+from django.db import close_old_connections
+from google.analytics.data_v1beta.types import Dimension, Metric, RunReportRequest
+
+from . import fact_store, funnel, ga4_client, ga4_filters, ga4_metrics, ga4_urls, resource_regressions
+from .aggregates import ResourceTotals
+from .models import DailyJobRun
+
+WINDOW_DAYS = int(os.getenv("GA4_RESOURCE_INDEX_DAYS", "28"))
+REFRESH_SECONDS = int(os.getenv("GA4_RESOURCE_INDEX_REFRESH", "900"))
+
+DAILY_JOB = "resource_index_daily"
+
+
+def resource_request(property_id):
+    """Eventos resource_performance de todo el sitio por página, recurso y tipo."""
+    return RunReportRequest(
+        property=f"properties/{property_id}",
+        dimensions=[
+            Dimension(name="customEvent:page_location_loadPage"),
+            Dimension(name="customEvent:resource_name_loadPage"),
+            Dimension(name="customEvent:resource_type_loadPage"),
+        ],
+        metrics=[
+            Metric(name="eventCount"),
+            Metric(name="customEvent:resource_total_duration_loadPage"),
+            Metric(name="customEvent:resource_repeat_count_loadPage"),
+            Metric(name="customEvent:resource_total_size_loadPage"),
+        ],
+        dimension_filter=ga4_filters.event_name_filter("resource_performance"),
+    )
+
+
+def aggregate_day(rows):
+    """Filas de un día -> {página normalizada: {clave de recurso: totales}}"""
+    pages = {}
+    for (page_location, resource_name, resource_type), metrics in rows:
+        page = ga4_urls.page_entry(page_location).normalized
+        key = ga4_urls.resource_key(resource_name, page_location)
+
+        resources = pages.setdefault(page, {})
+        totals = resources.get(key)
+        if totals is None:
+            totals = resources[key] = ResourceTotals(resource_type)
+        totals.add(
+            float(metrics[0] or 0),
+            float(metrics[1] or 0),
+            float(metrics[2] or 0),
+            float(metrics[3] or 0),
+        )
+    return pages
+
+
+def _merge(target, day_pages, sign=1):
+    """Suma (o resta con sign=-1) los totales de un día sobre target."""
+    for page, resources in day_pages.items():
+        page_totals = target.setdefault(page, {})
+        for key, totals in resources.items():
+            current = page_totals.get(key)
+            if current is None:
+                current = page_totals[key] = ResourceTotals(totals.type)
+            current.merge(totals, sign)
+            if current.rows <= 0:
+                del page_totals[key]
+        if not page_totals:
+            del target[page]
+
+
+def _entry(name, totals):
+    avg_duration, avg_repeat, avg_size = totals.averages()
+    return {
+        "name": name,
+        "type": totals.type,
+        "duration_avg": round(avg_duration, 3),
+        "repeat_avg": round(avg_repeat, 2),
+        "size_avg": round(avg_size / 1024, 2) if avg_size > 0 else 0,
+    }
+
+
+def rank_resources(resources):
+    """Totales por recurso -> lista con promedios por evento, como ga4_resources_general."""
+    ranked = [_entry(name, totals) for name, totals in resources.items()]
+    ranked.sort(key=lambda x: x["duration_avg"], reverse=True)
+    return ranked
+
+
+def top_resources(resources, top):
+    """
+    Los `top` recursos más lentos (heap acotado, sin ordenar la lista completa)
+    y un resumen "others" con el resto, o None si no sobra ninguno.
+    """
+    slowest = heapq.nlargest(top, resources.items(), key=lambda item: item[1].averages()[0])
+    ranked = rank_resources(dict(slowest))
+
+    if len(slowest) == len(resources):
+        return ranked, None
+
+    rest = ResourceTotals()
+    kept = {name for name, _ in slowest}
+    count = 0
+    for name, totals in resources.items():
+        if name in kept:
+            continue
+        count += 1
+        rest.merge(totals)
+
+    others = _entry("others", rest)
+    others["resources"] = count
+    return ranked, others
+
+
+class ResourceIndex:
+    def __init__(self, property_id, window_days=WINDOW_DAYS):
+        self.property_id = property_id
+        self.window_days = window_days
+        self._lock = threading.Lock()
+        self._days = {}     # {date: {página: {clave: totales}}}
+        self._window = {}   # {página: {clave: totales}} para [start, end]
+        self.start = None
+        self.end = None
+        self.refreshed_on = None
+        self.pid = os.getpid()
+        self.stop = threading.Event()
+
+    @property
+    def ready(self):
+        return self.refreshed_on is not None
+
+    def refresh(self, client, today=None):
+        """Pide a GA4 solo los días nuevos o en procesamiento y actualiza los totales."""
+        today = today or date.today()
+        start = today - timedelta(days=self.window_days)
+        settled_until = today - timedelta(days=fact_store.SETTLING_DAYS)
+
+        window_days = [start + timedelta(days=i) for i in range(self.window_days + 1)]
+        stale = [day for day in window_days if day not in self._days or day > settled_until]
+
+        fetched = {}
+        if stale:
+            rows_by_day = fact_store.fetch_days(
+                client, resource_request(self.property_id), stale[0].isoformat(), stale[-1].isoformat()
+            )
+            fetched = {day: aggregate_day(rows_by_day.get(day, [])) for day in stale}
+
+        with self._lock:
+            for day in [d for d in self._days if d < start or d > today]:
+                _merge(self._window, self._days.pop(day), sign=-1)
+            for day, day_pages in fetched.items():
+                if day in self._days:
+                    _merge(self._window, self._days[day], sign=-1)
+                self._days[day] = day_pages
+                _merge(self._window, day_pages)
+
+            self.start, self.end = start, today
+            self.refreshed_on = today
+
+        return len(stale)
+
+    def lookup(self, normalized_page, start_date, end_date):
+        """
+        Totales por recurso de la página para el rango, o None si el rango
+        no está cubierto por el índice (el llamador consulta GA4).
+        """
+        try:
+            start = date.fromisoformat(start_date)
+            end = date.fromisoformat(end_date)
+        except (TypeError, ValueError):
+            return None
+
+        with self._lock:
+            if not self.ready or start < self.start or end > self.end:
+                return None
+
+            if (start, end) == (self.start, self.end):
+                return {key: totals.copy() for key, totals in self._window.get(normalized_page, {}).items()}
+
+            resources = {}
+            day = start
+            while day <= end:
+                _merge(resources, {normalized_page: self._days.get(day, {}).get(normalized_page, {})})
+                day += timedelta(days=1)
+            return resources.get(normalized_page, {})
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def _claim_daily_jobs(day):
+    """True si este proceso tomó el turno del día (otro worker puede haberlo tomado antes)."""
+    _, created = DailyJobRun.objects.get_or_create(name=DAILY_JOB, date=day)
+    return created
+
+
+def _daily_jobs(index):
+    """Mantenimiento que corre una vez por día, tras el primer refresco del día."""
+    day = index.refreshed_on
+    if not _claim_daily_jobs(day):
+        return
+
+    try:
+        processed, regressions = resource_regressions.run(ga4_client.get_client(), index.property_id)
+        print(f"Regresiones de recursos: {len(regressions)} ({len(processed)} días procesados)")
+
+        end = resource_regressions.last_settled_day()
+        materialized = funnel.materialize(
+            ga4_client.get_client(), index.property_id, end - timedelta(days=funnel.MATERIALIZE_DAYS), end
+        )
+        print(f"Embudo materializado ({len(materialized)} días)")
+
+        pruned = fact_store.prune()
+        print(f"Almacén de hechos depurado ({pruned} reportes sin uso borrados)")
+    except Exception:
+        # Libera el turno para reintentar en el próximo refresco
+        DailyJobRun.objects.filter(name=DAILY_JOB, date=day).delete()
+        raise
+
+
+def _refresh_loop(index):
+    last_daily = None
+    with ga4_metrics.endpoint_scope("resource_index"):
+        while True:
+            try:
+                refreshed = index.refresh(ga4_client.get_client())
+                print(f"Índice de recursos actualizado ({refreshed} días pedidos a GA4)")
+                if index.refreshed_on != last_daily:
+                    _daily_jobs(index)
+                    last_daily = index.refreshed_on
+            except Exception as e:
+                print(f"Error actualizando índice de recursos: {e}")
+            finally:
+                close_old_connections()
+
+            if index.stop.wait(REFRESH_SECONDS):
+                return
+
+
+def get_index(property_id):
+    """
+    Índice del proceso; el primer llamado arranca el hilo de refresco
+    (gunicorn.conf.py lo llama al iniciar cada worker). Tras un fork cada
+    proceso construye el suyo.
+    """
+    global _index
+    with _index_lock:
+        if _index is None or _index.property_id != property_id or _index.pid != os.getpid():
+            if _index is not None:
+                _index.stop.set()
+            _index = ResourceIndex(property_id)
+            threading.Thread(
+                target=_refresh_loop,
+                args=(_index,),
+                name="ga4-resource-index",
+                daemon=True,
+            ).start()
+        return _index
+
+
+def clear():
+    """Detiene el hilo de refresco y descarta el índice (el próximo get_index lo reconstruye)."""
+    global _index
+    with _index_lock:
+        if _index is not None:
+            _index.stop.set()
+        _index = None
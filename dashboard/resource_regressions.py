@@ -0,0 +1,151 @@
+"""
+Detección diaria de regresiones de recursos (scripts, imágenes, fetch...).
+
+Una vez al día (en un solo worker, desde el hilo del índice de recursos;
+ver resource_index) se guardan en ResourceDailyStat la duración y el tamaño
+promedio por evento de cada recurso de cada página para el último día
+cerrado, y se compara ese día con su línea base: los promedios diarios de
+los BASELINE_DAYS días anteriores. Un recurso se marca cuando su valor
+supera la media de la línea base en más de Z_THRESHOLD desviaciones
+estándar y además en al menos MIN_CHANGE relativo (para no marcar saltos
+estadísticamente significativos pero irrelevantes en recursos muy estables).
+
+El endpoint de regresiones solo lee ResourceRegression: no consulta GA4.
+"""
+import os
+from datetime import date, timedelta
+
+import numpy as np
+from django.db import transaction
+
+from . import fact_store, resource_index
+from .models import ResourceDailyStat, ResourceRegression
+
+BASELINE_DAYS = int(os.getenv("GA4_REGRESSION_BASELINE_DAYS", "14"))
+MIN_BASELINE_DAYS = int(os.getenv("GA4_REGRESSION_MIN_BASELINE_DAYS", "7"))
+Z_THRESHOLD = float(os.getenv("GA4_REGRESSION_Z", "3.0"))
+MIN_CHANGE = float(os.getenv("GA4_REGRESSION_MIN_CHANGE", "0.2"))
+# Eventos mínimos de un día para que su promedio cuente (hoy o en la línea base)
+MIN_EVENTS = float(os.getenv("GA4_REGRESSION_MIN_EVENTS", "20"))
+
+# Métrica -> campo de ResourceDailyStat
+METRICS = {
+    "duration": "duration_avg",
+    "size": "size_avg",
+}
+
+
+def last_settled_day(today=None):
+    """Último día que GA4 ya no modifica."""
+    return (today or date.today()) - timedelta(days=fact_store.SETTLING_DAYS)
+
+
+# ============================================================
+# Estadísticas diarias
+# ============================================================
+def _day_stats(day, day_pages):
+    """{página: {clave: ResourceTotals}} de un día -> filas ResourceDailyStat."""
+    stats = []
+    for page, resources in day_pages.items():
+        for key, totals in resources.items():
+            avg_duration, _, avg_size = totals.averages()
+            stats.append(ResourceDailyStat(
+                page=page,
+                resource=key,
+                resource_type=totals.type or "",
+                date=day,
+                events=totals.events,
+                duration_avg=avg_duration,
+                size_avg=avg_size,
+            ))
+    return stats
+
+
+def store_daily_stats(client, property_id, start, end, force=False):
+    """
+    Calcula y guarda las estadísticas de [start, end]. Sin force solo se
+    procesan los días que aún no tienen filas. Retorna los días procesados.
+    """
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    if not force:
+        done = set(
+            ResourceDailyStat.objects.filter(date__gte=start, date__lte=end)
+            .values_list("date", flat=True).distinct()
+        )
+        days = [day for day in days if day not in done]
+    if not days:
+        return []
+
+    # Un único rango a GA4 (fact_store guarda los días cerrados: repetir es barato)
+    rows_by_day = fact_store.fetch_days(
+        client, resource_index.resource_request(property_id), days[0].isoformat(), days[-1].isoformat()
+    )
+    for day in days:
+        stats = _day_stats(day, resource_index.aggregate_day(rows_by_day.get(day, [])))
+        with transaction.atomic():
+            ResourceDailyStat.objects.filter(date=day).delete()
+            ResourceDailyStat.objects.bulk_create(stats, batch_size=1000)
+    return days
+
+
+# ============================================================
+# Detección
+# ============================================================
+def _detect_metric(value, baseline):
+    """(media, desviación, z) si value es una regresión frente a baseline, si no None."""
+    baseline = np.asarray(baseline, dtype=np.float64)
+    mean = float(baseline.mean())
+    # Piso para la desviación: evita z infinitos en recursos de duración constante
+    std = max(float(baseline.std(ddof=1)), abs(mean) * 0.01, 1e-9)
+    zscore = (value - mean) / std
+
+    if zscore >= Z_THRESHOLD and value >= mean * (1 + MIN_CHANGE):
+        return mean, std, zscore
+    return None
+
+
+def detect(day, baseline_days=BASELINE_DAYS):
+    """Compara el día con su línea base y reemplaza las regresiones guardadas de ese día."""
+    start = day - timedelta(days=baseline_days)
+    history = {}
+    for stat in ResourceDailyStat.objects.filter(date__gte=start, date__lte=day, events__gte=MIN_EVENTS).iterator():
+        history.setdefault((stat.page, stat.resource), []).append(stat)
+
+    regressions = []
+    for (page, resource), stats in history.items():
+        current = next((s for s in stats if s.date == day), None)
+        baseline = [s for s in stats if s.date < day]
+        if current is None or len(baseline) < MIN_BASELINE_DAYS:
+            continue
+
+        for metric, field in METRICS.items():
+            value = getattr(current, field)
+            found = _detect_metric(value, [getattr(s, field) for s in baseline])
+            if found is None:
+                continue
+            mean, std, zscore = found
+            regressions.append(ResourceRegression(
+                page=page,
+                resource=resource,
+                resource_type=current.resource_type,
+                metric=metric,
+                date=day,
+                value=value,
+                baseline_mean=mean,
+                baseline_std=std,
+                baseline_days=len(baseline),
+                zscore=zscore,
+                events=current.events,
+            ))
+
+    with transaction.atomic():
+        ResourceRegression.objects.filter(date=day).delete()
+        ResourceRegression.objects.bulk_create(regressions, batch_size=1000)
+    return regressions
+
+
+def run(client, property_id, day=None, baseline_days=BASELINE_DAYS, force=False):
+    """Job diario: completa las estadísticas de la ventana y detecta regresiones del día."""
+    day = day or last_settled_day()
+    processed = store_daily_stats(client, property_id, day - timedelta(days=baseline_days), day, force=force)
+    return processed, detect(day, baseline_days)
@@ -0,0 +1,236 @@
+"""
+Servicio de pertenencia: ¿qué session_id_final tienen flujo de clicks
+(eventos user_click_event) en un rango de fechas?
+
+- Las listas de session_id se parten en bloques de CHUNK_SIZE y cada bloque
+  se consulta en paralelo con su propio in_list_filter, con la dimensión
+  date para saber en qué días tuvo clicks cada sesión.
+- Por cada sesión se guarda el rango de días ya consultado y los días en
+  que tuvo clicks (no una copia por día: la memoria crece con las sesiones,
+  no con sesiones × días). Una sesión consultada para un rango que cubre el
+  pedido se resuelve localmente, así que reabrir el mismo modal no consulta
+  GA4.
+- La caché se acota por tamaño (una unidad por sesión más una por día con
+  clicks). Las sesiones consultadas hasta días cerrados se guardan por mucho
+  tiempo; las que incluyen hoy o ayer, con TTL corto (mismas reglas que
+  ga4_cache).
+
+fetch_by_session usa el mismo esquema de bloques para traer los eventos de
+muchas sesiones a la vez (flujo de clicks en lote). fetch_by_ranges agrupa
+antes las sesiones por sus propios rangos de días (ver session_locator), de
+modo que una sesión antigua no amplía la consulta de las recientes.
+"""
+import os
+import threading
+from datetime import date, datetime, timedelta
+
+from cachetools import TLRUCache
+from google.analytics.data_v1beta.types import DateRange, Dimension, RunReportRequest
+
+from . import ga4_cache
+from .ga4_executor import run_parallel
+from .ga4_pagination import iter_report_rows
+
+CHUNK_SIZE = int(os.getenv("GA4_SESSION_FLOW_CHUNK", "250"))
+CACHE_MAXSIZE = int(os.getenv("GA4_SESSION_FLOW_MAXSIZE", "200000"))
+# Días máximos de un grupo de sesiones consultado con un mismo rango
+BUCKET_DAYS = int(os.getenv("GA4_CLICK_FLOW_BUCKET_DAYS", "7"))
+
+SESSION_DIMENSION = "customEvent:session_id_final"
+
+
+class SessionFlow:
+    """Rango de días ya consultado de una sesión y los días en que tuvo clicks."""
+
+    __slots__ = ("start", "end", "flow_days")
+
+    def __init__(self, start, end, flow_days=()):
+        self.start = start
+        self.end = end
+        self.flow_days = frozenset(flow_days)
+
+    def has_flow(self, start, end):
+        return any(start <= day <= end for day in self.flow_days)
+
+    def covers(self, start, end):
+        return self.start <= start and end <= self.end
+
+    def extend(self, start, end, flow_days):
+        """Entrada nueva con el rango consultado (unido al anterior si se tocan) y los días con clicks."""
+        if start <= self.end + timedelta(days=1) and self.start <= end + timedelta(days=1):
+            start, end = min(start, self.start), max(end, self.end)
+        return SessionFlow(start, end, self.flow_days | set(flow_days))
+
+
+def _ttl(flow):
+    if flow.end >= date.today() - timedelta(days=1):
+        return ga4_cache.RECENT_DAYS_TTL
+    return ga4_cache.CLOSED_DAYS_TTL
+
+
+_lock = threading.Lock()
+# {(propiedad, session_id): SessionFlow}
+_sessions = TLRUCache(
+    maxsize=CACHE_MAXSIZE,
+    ttu=lambda key, value, now: now + _ttl(value),
+    getsizeof=lambda flow: 1 + len(flow.flow_days),
+)
+
+
+def _parse_date(value):
+    return datetime.strptime(ga4_cache.resolve_date(value), "%Y-%m-%d").date()
+
+
+def _chunk_request(property_id, session_ids, start, end):
+    return RunReportRequest(
+        property=f"properties/{property_id}",
+        dimensions=[
+            Dimension(name=SESSION_DIMENSION),
+            Dimension(name="date"),
+        ],
+        metrics=[],
+        date_ranges=[DateRange(start_date=start.isoformat(), end_date=end.isoformat())],
+        dimension_filter={
+            "and_group": {
+                "expressions": [
+                    {
+                        "filter": {
+                            "field_name": "eventName",
+                            "string_filter": {"value": "user_click_event", "match_type": "EXACT"}
+                        }
+                    },
+                    session_list_filter(session_ids),
+                ]
+            }
+        },
+    )
+
+
+def _chunks(session_ids):
+    ordered = sorted(session_ids)
+    return [ordered[i:i + CHUNK_SIZE] for i in range(0, len(ordered), CHUNK_SIZE)]
+
+
+def session_list_filter(session_ids):
+    """Filtro in_list por session_id_final (para usar como dimension_filter o dentro de un and_group)."""
+    return {
+        "filter": {
+            "field_name": SESSION_DIMENSION,
+            "in_list_filter": {"values": list(session_ids)}
+        }
+    }
+
+
+def _fetch_chunk(client, property_id, session_ids, start, end, timeout):
+    """[(session_id, date)] con clicks para un bloque de sesiones."""
+    request = _chunk_request(property_id, session_ids, start, end)
+    return [
+        (row.dimension_values[0].value, datetime.strptime(row.dimension_values[1].value, "%Y%m%d").date())
+        for row in iter_report_rows(client, request, timeout=timeout)
+    ]
+
+
+def sessions_with_flow(client, property_id, session_ids, start_date, end_date):
+    """Subconjunto de session_ids con eventos user_click_event en el rango."""
+    start = _parse_date(start_date)
+    end = _parse_date(end_date)
+    session_ids = {s for s in session_ids if s}
+
+    # 1. Resolver localmente: con clicks en algún día del rango ya es positiva;
+    #    sin clicks solo si su rango consultado cubre el pedido
+    with _lock:
+        cached = {s: _sessions.get((property_id, s)) for s in session_ids}
+    found = {s for s, flow in cached.items() if flow is not None and flow.has_flow(start, end)}
+    pending = {
+        s for s in session_ids - found
+        if cached[s] is None or not cached[s].covers(start, end)
+    }
+
+    if not pending:
+        return found
+
+    # 2. Consultar en paralelo las faltantes, en bloques acotados
+    results = run_parallel({
+        i: (lambda timeout, chunk=chunk: _fetch_chunk(client, property_id, chunk, start, end, timeout))
+        for i, chunk in enumerate(_chunks(pending))
+    })
+
+    flow_days = {}
+    for pairs in results.values():
+        for session_id, day in pairs:
+            found.add(session_id)
+            flow_days.setdefault(session_id, set()).add(day)
+
+    # 3. Recordar por sesión el rango consultado y sus días con clicks
+    with _lock:
+        for session_id in pending:
+            days = flow_days.get(session_id, ())
+            flow = _sessions.get((property_id, session_id))
+            if flow is None:
+                flow = SessionFlow(start, end, days)
+            else:
+                flow = flow.extend(start, end, days)
+            _sessions[(property_id, session_id)] = flow
+
+    return found
+
+
+def _buckets(ranges, max_days=BUCKET_DAYS):
+    """
+    {session_id: (inicio, fin)} -> [(inicio, fin, [session_ids])]. Las
+    sesiones, ordenadas por inicio, se juntan mientras el tramo del grupo no
+    supere max_days días (o el tramo de una de sus sesiones, si es mayor).
+    """
+    buckets = []
+    for session_id, (start, end) in sorted(ranges.items(), key=lambda item: (item[1], item[0])):
+        start, end = _parse_date(start), _parse_date(end)
+        if buckets:
+            bucket = buckets[-1]
+            merged_end = max(bucket[1], end)
+            limit = max(max_days, (bucket[1] - bucket[0]).days + 1, (end - start).days + 1)
+            if (merged_end - bucket[0]).days + 1 <= limit:
+                bucket[1] = merged_end
+                bucket[2].append(session_id)
+                continue
+        buckets.append([start, end, [session_id]])
+    return [(start.isoformat(), end.isoformat(), session_ids) for start, end, session_ids in buckets]
+
+
+def fetch_by_ranges(client, request, ranges):
+    """
+    {session_id: [filas]} de request (su primera dimensión debe ser
+    session_id_final) para sesiones con su propio rango de días
+    ({session_id: (inicio, fin)}). Cada grupo de _buckets se consulta sobre
+    su tramo, con un in_list_filter por bloque de CHUNK_SIZE ids; todos los
+    bloques van en paralelo. El dimension_filter de request se ignora.
+    """
+    def fetch(chunk, start_date, end_date, timeout):
+        chunk_request = RunReportRequest(request)
+        chunk_request.date_ranges = [DateRange(start_date=start_date, end_date=end_date)]
+        chunk_request.dimension_filter = session_list_filter(chunk)
+        return list(iter_report_rows(client, chunk_request, timeout=timeout))
+
+    calls = {}
+    for start_date, end_date, session_ids in _buckets({s: r for s, r in ranges.items() if s}):
+        for chunk in _chunks(session_ids):
+            calls[len(calls)] = (
+                lambda timeout, chunk=chunk, start_date=start_date, end_date=end_date:
+                fetch(chunk, start_date, end_date, timeout)
+            )
+    results = run_parallel(calls)
+
+    by_session = {}
+    for rows in results.values():
+        for row in rows:
+            by_session.setdefault(row.dimension_values[0].value, []).append(row)
+    return by_session
+
+
+def fetch_by_session(client, request, session_ids, start_date, end_date):
+    """fetch_by_ranges con el mismo rango [start_date, end_date] para todas las sesiones."""
+    return fetch_by_ranges(client, request, {s: (start_date, end_date) for s in session_ids})
+
+
+def clear():
+    with _lock:
+        _sessions.clear()
@@ -0,0 +1,104 @@
+"""
+Índice persistido session_id_final -> (primer día, último día).
+
+Se alimenta como efecto secundario de los endpoints que ya ven sesiones con
+fecha (detalle de clicks, ingresos de Genia) y del propio flujo de clicks.
+ga4_click_flow lo usa para consultar solo los días de la sesión en vez de
+todo el histórico; si la sesión no está indexada se usa el rango amplio.
+"""
+from datetime import date, datetime, timedelta
+
+from django.db import transaction
+
+from .models import SessionLocator
+
+# Margen alrededor de los días conocidos (sesiones que cruzan la medianoche)
+MARGIN_DAYS = 1
+
+# Máximo de variables por consulta IN (límite de SQLite)
+QUERY_CHUNK = 500
+
+
+def _as_date(value):
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value[:8], "%Y%m%d").date()
+
+
+def record(pairs):
+    """
+    Registra [(session_id, fecha)] con fecha date o "YYYYMMDD..." (también
+    dateHourMinute). Solo escribe las sesiones nuevas o cuyo rango se amplía.
+    """
+    try:
+        seen = {}
+        for session_id, value in pairs:
+            if not session_id or session_id == "(not set)":
+                continue
+            try:
+                day = _as_date(value)
+            except (TypeError, ValueError):
+                continue
+            bounds = seen.get(session_id)
+            if bounds is None:
+                seen[session_id] = [day, day]
+            else:
+                bounds[0] = min(bounds[0], day)
+                bounds[1] = max(bounds[1], day)
+
+        if not seen:
+            return
+
+        ids = list(seen)
+        existing = {}
+        for i in range(0, len(ids), QUERY_CHUNK):
+            for locator in SessionLocator.objects.filter(session_id__in=ids[i:i + QUERY_CHUNK]):
+                existing[locator.session_id] = locator
+
+        new, changed = [], []
+        for session_id, (first, last) in seen.items():
+            locator = existing.get(session_id)
+            if locator is None:
+                new.append(SessionLocator(session_id=session_id, first_date=first, last_date=last))
+            elif first < locator.first_date or last > locator.last_date:
+                locator.first_date = min(first, locator.first_date)
+                locator.last_date = max(last, locator.last_date)
+                changed.append(locator)
+
+        with transaction.atomic():
+            SessionLocator.objects.bulk_create(new, batch_size=QUERY_CHUNK, ignore_conflicts=True)
+            SessionLocator.objects.bulk_update(changed, ["first_date", "last_date"], batch_size=QUERY_CHUNK)
+    except Exception as e:
+        # El índice es una optimización: nunca debe romper el endpoint que lo alimenta
+        print(f"Error actualizando SessionLocator: {e}")
+
+
+def _clamp(locator, start_date, end_date):
+    start = max(locator.first_date - timedelta(days=MARGIN_DAYS), date.fromisoformat(start_date))
+    end = min(locator.last_date + timedelta(days=MARGIN_DAYS), date.fromisoformat(end_date))
+    if start > end:
+        return None
+    return start.isoformat(), end.isoformat()
+
+
+def narrow_range(session_id, start_date, end_date):
+    """
+    (inicio, fin) en YYYY-MM-DD con los días conocidos de la sesión (más el
+    margen) dentro de [start_date, end_date], o None si no está indexada.
+    """
+    locator = SessionLocator.objects.filter(session_id=session_id).first()
+    if locator is None:
+        return None
+    return _clamp(locator, start_date, end_date)
+
+
+def narrow_ranges(session_ids, start_date, end_date):
+    """narrow_range para varias sesiones: {session_id: (inicio, fin)} de las indexadas."""
+    session_ids = list(session_ids)
+    ranges = {}
+    for i in range(0, len(session_ids), QUERY_CHUNK):
+        for locator in SessionLocator.objects.filter(session_id__in=session_ids[i:i + QUERY_CHUNK]):
+            found = _clamp(locator, start_date, end_date)
+            if found:
+                ranges[locator.session_id] = found
+    return ranges
@@ -1,3 +1,1256 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.test import SimpleTestCase, TestCase
+from django.urls import resolve
+from google.analytics.data_v1beta.types import (
+    DateRange,
+    Dimension,
+    DimensionHeader,
+    DimensionValue,
+    Metric,
+    MetricHeader,
+    MetricType,
+    MetricValue,
+    Row,
+    RunReportRequest,
+    RunReportResponse,
+)
+
+from . import click_paths, fact_store, funnel, ga4_cache, ga4_client, ga4_columns, ga4_filters, ga4_metrics, ga4_standin, ga4_urls
+from . import latency_sketches, resource_cube, resource_index, resource_regressions, session_flows, session_locator, views
+from .aggregates import ClickStats, PurchaseStats, ResourceTotals, StageStats
+from .ddsketch import DDSketch
+from .ga4_executor import run_parallel
+from .ga4_pagination import iter_report_pages, iter_report_rows
+from .models import DailyJobRun, FunnelDayAggregate, ReportCoverage, ReportDayFact, ResourceDailyStat, SessionLocator
+
+
+# ============================================================
+# ga4_client
+# ============================================================
+@mock.patch.dict(os.environ, {"GOOGLE_APPLICATION_CREDENTIALS": "tests", "GA4_STANDIN_HOST": "127.0.0.1:1"})
+class GA4ClientRegistryTests(SimpleTestCase):
+    def tearDown(self):
+        ga4_client._clients.clear()
+
+    def test_one_client_per_process(self):
+        client = ga4_client.get_client()
+        self.assertIs(ga4_client.get_client(), client)
+        self.assertIs(ga4_client.get_client("tests"), client)
+
+        # Tras un fork el worker no reutiliza el canal del padre
+        with mock.patch.object(ga4_client.os, "getpid", return_value=os.getpid() + 1):
+            self.assertIsNot(ga4_client.get_client(), client)
+
+    def test_channel_setup_is_exported(self):
+        ga4_client.get_client()
+        self.assertIn("ga4_channel_setup_seconds_count", ga4_metrics.render_prometheus())
+
+
+def _request(start_date, end_date, **kwargs):
+    return RunReportRequest(
+        property="properties/1",
+        dimensions=[Dimension(name="pagePath")],
+        metrics=[Metric(name="eventCount")],
+        date_ranges=[DateRange(start_date=start_date, end_date=end_date)],
+        **kwargs,
+    )
+
+
+# ============================================================
+# Embudo de migración
+# ============================================================
+@mock.patch.dict(os.environ, {"GOOGLE_APPLICATION_CREDENTIALS": "tests", "GA4_PROPERTY_ID": "1"})
+class MigrationFunnelViewTests(SimpleTestCase):
+    def test_all_steps_come_from_one_report(self):
+        ga4 = _ReportClient([
+            (["20250301", "migracion", "view_item_list"], [10]),
+            (["20250301", "migracion", "purchase"], [2]),
+            (["20250302", "migracion", "select_item"], [4]),
+        ])
+        with mock.patch.object(views, "_get_ga4_client", return_value=ga4):
+            response = self.client.get("/api/dashboard/embudo_migra/", {"start_date": "2025-03-01", "end_date": "2025-03-02"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(ga4.requests), 1)
+        series = {day["date"]: day for day in response.json()["series"]}
+        self.assertEqual(
+            (series["2025-03-01"]["Visualización de planes"], series["2025-03-01"]["Resumen de compra"]), (10, 2)
+        )
+        self.assertEqual(series["2025-03-02"]["Clic en comprar"], 4)
+        self.assertEqual(series["2025-03-02"]["Datos personales"], 0)
+
+
+# ============================================================
+# ga4_cache
+# ============================================================
+class GA4CacheTests(SimpleTestCase):
+    today = date(2025, 3, 10)
+
+    def setUp(self):
+        ga4_cache.clear()
+
+    def tearDown(self):
+        ga4_cache.clear()
+
+    def test_resolve_date(self):
+        self.assertEqual(ga4_cache.resolve_date("today", self.today), "2025-03-10")
+        self.assertEqual(ga4_cache.resolve_date("yesterday", self.today), "2025-03-09")
+        self.assertEqual(ga4_cache.resolve_date("30daysAgo", self.today), "2025-02-08")
+        self.assertEqual(ga4_cache.resolve_date("2025-01-01", self.today), "2025-01-01")
+
+    def test_request_key_resolves_relative_dates(self):
+        today = date.today()
+        relative = _request("7daysAgo", "today")
+        absolute = _request((today - timedelta(days=7)).isoformat(), today.isoformat())
+        self.assertEqual(ga4_cache.request_key(relative), ga4_cache.request_key(absolute))
+        self.assertNotEqual(
+            ga4_cache.request_key(absolute), ga4_cache.request_key(_request("7daysAgo", "today", limit=10))
+        )
+
+    def test_request_ttl(self):
+        closed = _request("2025-03-01", "2025-03-08")
+        recent = _request("2025-03-01", "yesterday")
+        self.assertEqual(ga4_cache.request_ttl(closed, self.today), ga4_cache.CLOSED_DAYS_TTL)
+        self.assertEqual(ga4_cache.request_ttl(recent, self.today), ga4_cache.RECENT_DAYS_TTL)
+
+    def cached(self, request, response):
+        calls = []
+
+        def fetch(req):
+            calls.append(req)
+            return response
+
+        ga4_cache.cached_run_report(fetch, request)
+        ga4_cache.cached_run_report(fetch, request)
+        return len(calls)
+
+    def response(self, rows, row_count=None):
+        return RunReportResponse(
+            rows=[Row(dimension_values=[DimensionValue(value=f"/{i}")]) for i in range(rows)],
+            row_count=rows if row_count is None else row_count,
+        )
+
+    def test_complete_reports_are_cached_by_estimated_memory(self):
+        response = self.response(3)
+        self.assertEqual(self.cached(_request("2020-01-01", "2020-01-02"), response), 1)
+        serialized = RunReportResponse.pb(response).ByteSize()
+        self.assertEqual(ga4_cache.get_stats()["bytes"], int(serialized * ga4_cache.RESIDENT_FACTOR))
+
+    def test_pages_of_larger_reports_are_not_cached(self):
+        first_page = _request("2020-01-01", "2020-01-02", limit=ga4_cache.PAGE_LIMIT)
+        self.assertEqual(self.cached(first_page, self.response(3, row_count=10)), 2)
+        next_page = _request("2020-01-01", "2020-01-02", limit=ga4_cache.PAGE_LIMIT, offset=3)
+        self.assertEqual(self.cached(next_page, self.response(3, row_count=10)), 2)
+        # Un top N truncado a propósito sí se guarda
+        top = _request("2020-01-01", "2020-01-02", limit=3)
+        self.assertEqual(self.cached(top, self.response(3, row_count=10)), 1)
+
+    def test_responses_larger_than_the_budget_are_not_cached(self):
+        with mock.patch.object(ga4_cache, "RESIDENT_FACTOR", ga4_cache.CACHE_MAX_BYTES):
+            self.assertEqual(self.cached(_request("2020-01-01", "2020-01-02"), self.response(50)), 2)
+
+
+# ============================================================
+# ga4_standin
+# ============================================================
+class GA4StandinTests(SimpleTestCase):
+    def setUp(self):
+        self.server, self.standin, address = ga4_standin.serve(ga4_standin.StandinConfig(rows=250, latency_ms=0))
+        self.addCleanup(self.server.stop, 0)
+        patcher = mock.patch.dict(os.environ, {"GOOGLE_APPLICATION_CREDENTIALS": "tests", "GA4_STANDIN_HOST": address})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(ga4_client._clients.clear)
+        self.addCleanup(ga4_cache.clear)
+        ga4_client._clients.clear()
+        ga4_cache.clear()
+
+    def test_paginated_report_through_grpc(self):
+        request = _request(
+            "2025-01-01", "2025-01-07",
+            dimension_filter=ga4_filters.in_list_filter("pagePath", ["/cart", "/"]),
+        )
+        rows = list(iter_report_rows(ga4_client.get_client(), request, page_size=100))
+
+        self.assertEqual(len(rows), 250)
+        self.assertEqual({r.dimension_values[0].value for r in rows}, {"/cart", "/"})
+        self.assertEqual(self.standin.requests_served, 3)
+
+    def test_dimension_order_bys_are_honored(self):
+        request = _request(
+            "2025-01-01", "2025-01-07",
+            order_bys=[{"dimension": {"dimension_name": "pagePath"}}],
+        )
+        pages = [r.dimension_values[0].value for r in iter_report_rows(ga4_client.get_client(), request, page_size=100)]
+        self.assertEqual(pages, sorted(pages))
+
+    def test_recorded_responses_are_served(self):
+        request = _request("2025-01-01", "2025-01-07")
+        recorded = RunReportResponse(rows=[Row(dimension_values=[DimensionValue(value="/grabada")])], row_count=1)
+        with tempfile.TemporaryDirectory() as recordings:
+            with open(os.path.join(recordings, f"{ga4_cache.request_key(request)}.json"), "w", encoding="utf-8") as f:
+                f.write(RunReportResponse.to_json(recorded))
+            standin = ga4_standin.GA4Standin(ga4_standin.StandinConfig(latency_ms=0, recordings_dir=recordings))
+            self.assertEqual(standin.run_report(request), recorded)
+
+
+# ============================================================
+# ga4_executor
+# ============================================================
+class RunParallelTests(SimpleTestCase):
+    def test_calls_run_concurrently_with_their_deadline(self):
+        barrier = threading.Barrier(2, timeout=5)
+
+        def call(value):
+            def run(timeout):
+                barrier.wait()
+                return value, timeout
+            return run
+
+        # Ambas llamadas deben estar en vuelo a la vez para pasar la barrera
+        results = run_parallel({"a": call(1), "b": call(2)}, timeout=10)
+        self.assertEqual(results, {"a": (1, 10), "b": (2, 10)})
+
+    def test_deadline_is_shared_by_all_calls(self):
+        started = time.monotonic()
+        with self.assertRaises(TimeoutError):
+            run_parallel({"slow": lambda timeout: time.sleep(1)}, timeout=0.1)
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    def test_errors_propagate(self):
+        def fail(timeout):
+            raise ValueError("GA4")
+
+        with self.assertRaises(ValueError):
+            run_parallel({"ok": lambda timeout: 1, "fail": fail})
+
+    def test_calls_inherit_the_endpoint(self):
+        with ga4_metrics.endpoint_scope("some_view"):
+            results = run_parallel({"endpoint": lambda timeout: ga4_metrics.current_endpoint()})
+        self.assertEqual(results, {"endpoint": "some_view"})
+
+
+# ============================================================
+# fact_store
+# ============================================================
+class FactStoreHelperTests(SimpleTestCase):
+    def test_missing_ranges(self):
+        d = date(2025, 1, 1)
+        days = [d, d + timedelta(days=1), d + timedelta(days=2), d + timedelta(days=5)]
+        self.assertEqual(
+            fact_store._missing_ranges(days),
+            [[d, d + timedelta(days=2)], [d + timedelta(days=5), d + timedelta(days=5)]],
+        )
+        self.assertEqual(fact_store._missing_ranges([]), [])
+
+    def test_merge_ranges(self):
+        d = date(2025, 1, 1)
+        ranges = [
+            (d + timedelta(days=10), d + timedelta(days=12)),
+            (d, d + timedelta(days=3)),
+            (d + timedelta(days=4), d + timedelta(days=6)),
+            (d + timedelta(days=2), d + timedelta(days=5)),
+        ]
+        self.assertEqual(
+            fact_store._merge_ranges(ranges),
+            [(d, d + timedelta(days=6)), (d + timedelta(days=10), d + timedelta(days=12))],
+        )
+
+    def test_sum_days(self):
+        days = {
+            date(2025, 1, 1): [[["a"], ["1", "2.5"]], [["b"], ["3", ""]]],
+            date(2025, 1, 2): [[["a"], ["4", "0.5"]]],
+        }
+        rows = {
+            tuple(v.value for v in row.dimension_values): [v.value for v in row.metric_values]
+            for row in fact_store._sum_days(days)
+        }
+        self.assertEqual(rows, {("a",): ["5", "3"], ("b",): ["3", "0"]})
+
+
+class FactStoreTests(TestCase):
+    def setUp(self):
+        self.calls = []
+
+        def fake_rows(client, request, **kwargs):
+            date_range = request.date_ranges[0]
+            self.calls.append((date_range.start_date, date_range.end_date))
+            yield fact_store.FactRow(["/", "20250103"], ["5"])
+
+        patcher = mock.patch.object(fact_store, "iter_report_rows", fake_rows)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_empty_days_are_stored_as_coverage(self):
+        request = _request("2025-01-01", "2025-01-31")
+        days = fact_store.fetch_days(None, request, "2025-01-01", "2025-01-31")
+
+        self.assertEqual(len(days), 31)
+        self.assertEqual(days[date(2025, 1, 3)], [[["/"], ["5"]]])
+        self.assertEqual(ReportDayFact.objects.count(), 1)
+        self.assertEqual(
+            list(ReportCoverage.objects.values_list("start_date", "end_date")),
+            [(date(2025, 1, 1), date(2025, 1, 31))],
+        )
+
+        # Un sub-rango ya cubierto no consulta GA4 y conserva los días vacíos
+        again = fact_store.fetch_days(None, request, "2025-01-02", "2025-01-04")
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(again[date(2025, 1, 2)], [])
+        self.assertEqual(again[date(2025, 1, 3)], [[["/"], ["5"]]])
+
+    def test_only_missing_days_are_requested(self):
+        fact_store.fetch_days(None, _request("2025-01-01", "2025-01-05"), "2025-01-01", "2025-01-05")
+        fact_store.fetch_days(None, _request("2025-01-01", "2025-01-08"), "2025-01-01", "2025-01-08")
+        self.assertEqual(self.calls, [("2025-01-01", "2025-01-05"), ("2025-01-06", "2025-01-08")])
+
+    def test_prune_removes_unused_specs(self):
+        fact_store.fetch_days(None, _request("2025-01-01", "2025-01-05"), "2025-01-01", "2025-01-05")
+        self.assertEqual(fact_store.prune(retention_days=1), 0)
+
+        ReportCoverage.objects.update(fetched_at=ReportCoverage.objects.first().fetched_at - timedelta(days=2))
+        self.assertEqual(fact_store.prune(retention_days=1), 1)
+        self.assertFalse(ReportDayFact.objects.exists())
+        self.assertFalse(ReportCoverage.objects.exists())
+
+
+# ============================================================
+# ga4_pagination
+# ============================================================
+class _PagedClient:
+    """Cliente falso: entrega `rows` en páginas de page_size filas según el offset pedido."""
+
+    def __init__(self, headers, rows, page_size):
+        self.headers = headers
+        self.rows = rows
+        self.page_size = page_size
+        self.requests = []
+
+    def run_report(self, request, timeout=None):
+        self.requests.append(request)
+        page = self.rows[request.offset:request.offset + self.page_size]
+        return RunReportResponse(
+            dimension_headers=[DimensionHeader(name=name) for name in self.headers],
+            rows=[Row(dimension_values=[DimensionValue(value=v) for v in row]) for row in page],
+            row_count=len(self.rows),
+        )
+
+
+class PaginationTests(SimpleTestCase):
+    rows = [[f"/{i}"] for i in range(7)]
+
+    def test_iterates_every_page(self):
+        client = _PagedClient(["pagePath"], self.rows, page_size=3)
+        rows = [r.dimension_values[0].value for r in iter_report_rows(client, _request("2025-01-01", "2025-01-07"), 3)]
+
+        self.assertEqual(rows, [row[0] for row in self.rows])
+        self.assertEqual([(r.offset, r.limit) for r in client.requests], [(0, 3), (3, 3), (6, 1)])
+
+    def test_empty_report_keeps_headers(self):
+        client = _PagedClient(["pagePath"], [], page_size=3)
+        pages = list(iter_report_pages(client, _request("2025-01-01", "2025-01-07")))
+        self.assertEqual([len(p.rows) for p in pages], [0])
+        self.assertEqual(pages[0].dimension_headers[0].name, "pagePath")
+
+    def test_closing_early_stops_fetching(self):
+        client = _PagedClient(["pagePath"], self.rows, page_size=2)
+        pages = iter_report_pages(client, _request("2025-01-01", "2025-01-07"), 2)
+        next(pages)
+        pages.close()
+        # Solo la primera página y, a lo sumo, la siguiente ya lanzada
+        self.assertLessEqual(len(client.requests), 2)
+
+
+# ============================================================
+# ga4_filters
+# ============================================================
+class PageUrlFilterTests(SimpleTestCase):
+    def matches(self, search_url, page):
+        """Evalúa el FULL_REGEXP sin distinguir mayúsculas, como GA4."""
+        string_filter = ga4_filters.page_url_filter("customEvent:page_location_loadPage", search_url).filter.string_filter
+        return re.fullmatch(string_filter.value, page, re.IGNORECASE | re.DOTALL) is not None
+
+    def test_matches_the_python_comparison(self):
+        searches = ["tienda.claro.com.co/cart", "https://tienda.claro.com.co/Cart/", "http://tienda.claro.com.co/cart"]
+        pages = [
+            "https://tienda.claro.com.co/cart",
+            "https://TIENDA.claro.com.co/cart/",
+            "tienda.claro.com.co/cart?utm=1",
+            "https://tienda.claro.com.co/cart#top",
+            "http://tienda.claro.com.co/cart",
+            "https://tienda.claro.com.co/cart/delivery",
+            "https://tienda.claro.com.co/carts",
+            "https://otra.claro.com.co/cart",
+        ]
+        for search in searches:
+            for page in pages:
+                expected = ga4_urls.normalize_url(page.lower()) == ga4_urls.normalize_url(search.lower())
+                self.assertEqual(self.matches(search, page), expected, (search, page))
+
+    def test_special_characters_are_escaped(self):
+        self.assertTrue(self.matches("tienda.claro.com.co/a+b", "https://tienda.claro.com.co/a+b"))
+        self.assertFalse(self.matches("tienda.claro.com.co/a+b", "https://tienda.claro.com.co/aab"))
+        self.assertFalse(self.matches("tienda.claro.com.co/cart", "https://tiendaxclaro.com.co/cart"))
+
+    def test_and_filters_skips_missing_expressions(self):
+        event = ga4_filters.event_name_filter("resource_performance")
+        self.assertIs(ga4_filters.and_filters(event, None), event)
+        combined = ga4_filters.and_filters(event, ga4_filters.in_list_filter("eventName", ["a", "b"]))
+        self.assertEqual(len(combined.and_group.expressions), 2)
+
+
+# ============================================================
+# ga4_metrics
+# ============================================================
+class PrometheusTests(SimpleTestCase):
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = ga4_metrics.Histogram("test_seconds", "Prueba.", (0.1, 1), ("endpoint",))
+        for value in (0.05, 0.5, 5):
+            histogram.observe(value, 'vista "x"')
+
+        self.assertEqual(histogram.render(), [
+            "# HELP test_seconds Prueba.",
+            "# TYPE test_seconds histogram",
+            'test_seconds_bucket{endpoint="vista \\"x\\"",le="0.1"} 1',
+            'test_seconds_bucket{endpoint="vista \\"x\\"",le="1"} 2',
+            'test_seconds_bucket{endpoint="vista \\"x\\"",le="+Inf"} 3',
+            'test_seconds_sum{endpoint="vista \\"x\\""} 5.55',
+            'test_seconds_count{endpoint="vista \\"x\\""} 3',
+        ])
+
+    def test_reports_are_exported_per_endpoint(self):
+        response = RunReportResponse(rows=[Row(dimension_values=[DimensionValue(value="/")])], row_count=1)
+        with ga4_metrics.endpoint_scope("prometheus_test_view"):
+            ga4_metrics.observe_report(response, 0.2, from_cache=False)
+            ga4_metrics.observe_error(TimeoutError())
+
+        response = self.client.get("/api/dashboard/metrics/prometheus/")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        body = response.content.decode()
+        self.assertIn('ga4_report_duration_seconds_count{endpoint="prometheus_test_view",source="ga4"} 1', body)
+        self.assertIn('ga4_report_rows_count{endpoint="prometheus_test_view"} 1', body)
+        self.assertIn('ga4_report_errors_total{endpoint="prometheus_test_view",error="TimeoutError"} 1', body)
+        self.assertIn("ga4_cache_bytes ", body)
+
+
+# ============================================================
+# ga4_columns
+# ============================================================
+def _response(rows, metric_type=MetricType.TYPE_FLOAT):
+    return RunReportResponse(
+        dimension_headers=[DimensionHeader(name="device"), DimensionHeader(name="page")],
+        metric_headers=[MetricHeader(name="value", type_=metric_type)],
+        rows=[
+            Row(
+                dimension_values=[DimensionValue(value=device), DimensionValue(value=page)],
+                metric_values=[MetricValue(value=value)],
+            )
+            for device, page, value in rows
+        ],
+        row_count=len(rows),
+    )
+
+
+class GA4ColumnsTests(SimpleTestCase):
+    def test_decode_and_sum_by(self):
+        columns = ga4_columns.decode_response(_response([
+            ("mobile", "/a", "1.5"),
+            ("desktop", "/a", "2"),
+            ("mobile", "/b", ""),
+        ]))
+
+        self.assertEqual(len(columns), 3)
+        self.assertEqual(columns.dimension("page"), ["/a", "/a", "/b"])
+        self.assertEqual(columns.levels("device"), ["mobile", "desktop"])
+        self.assertEqual(columns.metric("value").tolist(), [1.5, 2.0, 0.0])
+        self.assertEqual(columns.sum_by("device", "value"), {"mobile": 1.5, "desktop": 2.0})
+
+    def test_integer_metrics(self):
+        columns = ga4_columns.decode_response(_response([("mobile", "/a", "3")], MetricType.TYPE_INTEGER))
+        self.assertEqual(columns.metric("value").dtype, np.int64)
+
+    def test_decode_pages_remaps_levels(self):
+        columns = ga4_columns.decode_pages([
+            _response([("mobile", "/a", "1"), ("desktop", "/b", "2")]),
+            _response([("desktop", "/c", "3"), ("tablet", "/a", "4")]),
+        ])
+        self.assertEqual(columns.dimension("device"), ["mobile", "desktop", "desktop", "tablet"])
+        self.assertEqual(columns.sum_by("page", "value"), {"/a": 5.0, "/b": 2.0, "/c": 3.0})
+
+    def test_decode_pages_empty(self):
+        self.assertEqual(len(ga4_columns.decode_pages([])), 0)
+
+
+# ============================================================
+# ga4_urls
+# ============================================================
+class GA4UrlsTests(SimpleTestCase):
+    def test_normalize_url(self):
+        self.assertEqual(ga4_urls.normalize_url("tienda.claro.com.co/cart/?a=1"), "https://tienda.claro.com.co/cart")
+        self.assertEqual(ga4_urls.normalize_url("http://tienda.claro.com.co/"), "http://tienda.claro.com.co")
+
+    def test_page_entry_keeps_the_original_host(self):
+        entry = ga4_urls.page_entry("https://Tienda.Claro.com.co/Cart/")
+        self.assertEqual(entry, ga4_urls.PageEntry("https://tienda.claro.com.co/cart", "Tienda.Claro.com.co"))
+
+    def test_resource_key_groups_external_resources_by_host(self):
+        page = "https://tienda.claro.com.co/cart"
+        self.assertEqual(ga4_urls.resource_key("https://cdn.example.com/a.js?v=1", page), "cdn.example.com")
+        self.assertEqual(
+            ga4_urls.resource_key("https://tienda.claro.com.co/app.js", page), "https://tienda.claro.com.co/app.js"
+        )
+        self.assertEqual(ga4_urls.resource_key("inline-script", page), "inline-script")
+
+
+# ============================================================
+# resource_cube
+# ============================================================
+class _ReportClient:
+    """Cliente falso: responde cualquier reporte con las filas (dims, métricas) dadas, en una página."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.requests = []
+
+    def run_report(self, request, timeout=None):
+        self.requests.append(request)
+        return RunReportResponse(
+            dimension_headers=[DimensionHeader(name=d.name) for d in request.dimensions],
+            metric_headers=[MetricHeader(name=m.name, type_=MetricType.TYPE_FLOAT) for m in request.metrics],
+            rows=[
+                Row(
+                    dimension_values=[DimensionValue(value=v) for v in dims],
+                    metric_values=[MetricValue(value=str(v)) for v in metrics],
+                )
+                for dims, metrics in self.rows
+            ],
+            row_count=len(self.rows),
+        )
+
+
+class ResourceCubeTests(SimpleTestCase):
+    page = "https://tienda.claro.com.co/cart"
+    # eventos, duración total, tamaño total, repeticiones
+    rows = [
+        ([page, "https://tienda.claro.com.co/app.js", "script", "20250301", "09"], [2, 4.0, 2048, 2]),
+        ([page + "/", "https://tienda.claro.com.co/app.js", "script", "20250302", "10"], [2, 8.0, 2048, 2]),
+        ([page, "https://cdn.example.com/a.png", "img", "20250301", "09"], [1, 0.5, 1024, 1]),
+        ([page, "https://cdn.example.com/b.png", "img", "20250301", "10"], [1, 1.5, 1024, 1]),
+        (["https://tienda.claro.com.co/otra", "https://tienda.claro.com.co/app.js", "script", "20250301", "09"],
+         [5, 50.0, 1024, 5]),
+    ]
+
+    def setUp(self):
+        resource_cube.clear()
+        self.addCleanup(resource_cube.clear)
+        self.ga4 = _ReportClient(self.rows)
+        self.cube = resource_cube.get_cube(self.ga4, "1", "tienda.claro.com.co/cart", "2025-03-01", "2025-03-02")
+
+    def test_general_groups_external_resources_by_host(self):
+        general = {r["name"]: r for r in self.cube.general()}
+        self.assertEqual(list(general), ["https://tienda.claro.com.co/app.js", "cdn.example.com"])
+        self.assertEqual(general["https://tienda.claro.com.co/app.js"]["duration_avg"], 3.0)
+        self.assertEqual(general["cdn.example.com"]["duration_avg"], 1.0)
+        self.assertEqual(general["cdn.example.com"]["size_avg"], 1.0)
+
+    def test_hourly_and_daily_profiles(self):
+        self.assertEqual(self.cube.hourly()["cdn.example.com"], {"09": 0.5, "10": 1.5})
+        self.assertEqual(
+            self.cube.hourly(["https://cdn.example.com/a.png"]), {"cdn.example.com": {"09": 0.5}}
+        )
+        self.assertEqual(
+            self.cube.daily(["https://tienda.claro.com.co/app.js"]),
+            {"https://tienda.claro.com.co/app.js": {"20250301": 2.0, "20250302": 4.0}},
+        )
+
+    def test_one_query_per_page_and_range(self):
+        again = resource_cube.get_cube(self.ga4, "1", "https://Tienda.claro.com.co/cart/", "2025-03-01", "2025-03-02")
+        self.assertIs(again, self.cube)
+        self.assertEqual(len(self.ga4.requests), 1)
+
+
+# ============================================================
+# resource_index
+# ============================================================
+class ResourceIndexTests(SimpleTestCase):
+    page = "https://tienda.claro.com.co/cart"
+
+    def setUp(self):
+        self.ranges = []
+
+        def fetch_days(client, request, start_date, end_date):
+            """Un evento de app.js por día, con duración igual al número del día."""
+            self.ranges.append((start_date, end_date))
+            start, end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+            days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+            return {
+                day: [[[self.page, "https://tienda.claro.com.co/app.js", "script"], ["1", str(day.day), "0", "0"]]]
+                for day in days
+            }
+
+        patcher = mock.patch.object(resource_index.fact_store, "fetch_days", fetch_days)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def lookup(self, index, start, end):
+        totals = index.lookup(self.page, start, end)
+        return None if totals is None else {key: (t.events, t.duration) for key, t in totals.items()}
+
+    def test_refresh_only_fetches_new_and_unsettled_days(self):
+        index = resource_index.ResourceIndex("1", window_days=3)
+        self.assertIsNone(self.lookup(index, "2025-03-07", "2025-03-10"))
+
+        self.assertEqual(index.refresh(None, today=date(2025, 3, 10)), 4)
+        self.assertEqual(self.lookup(index, "2025-03-07", "2025-03-10"), {"https://tienda.claro.com.co/app.js": (4, 34)})
+
+        # Al día siguiente: solo hoy y ayer (GA4 aún los modifica); el 7 sale de la ventana
+        self.assertEqual(index.refresh(None, today=date(2025, 3, 11)), 2)
+        self.assertEqual(self.ranges[-1], ("2025-03-10", "2025-03-11"))
+        self.assertEqual(self.lookup(index, "2025-03-08", "2025-03-11"), {"https://tienda.claro.com.co/app.js": (4, 38)})
+
+    def test_lookup_sub_ranges_and_uncovered_ranges(self):
+        index = resource_index.ResourceIndex("1", window_days=3)
+        index.refresh(None, today=date(2025, 3, 10))
+
+        self.assertEqual(self.lookup(index, "2025-03-08", "2025-03-09"), {"https://tienda.claro.com.co/app.js": (2, 17)})
+        self.assertIsNone(self.lookup(index, "2025-03-01", "2025-03-10"))
+        self.assertIsNone(self.lookup(index, "7daysAgo", "today"))
+        self.assertEqual(index.lookup("https://tienda.claro.com.co/otra", "2025-03-08", "2025-03-09"), {})
+
+
+@mock.patch.dict(os.environ, {"GOOGLE_APPLICATION_CREDENTIALS": "tests", "GA4_PROPERTY_ID": "1"})
+class TopResourcesTests(SimpleTestCase):
+    resources = {
+        "a.js": ResourceTotals("script", events=2, duration=10, size=2048),
+        "b.js": ResourceTotals("script", events=1, duration=1),
+        "c.png": ResourceTotals("img", events=1, duration=7),
+        "d.css": ResourceTotals("css", events=3, duration=3, size=1024),
+    }
+
+    def test_top_keeps_the_slowest_and_summarizes_the_rest(self):
+        ranked, others = resource_index.top_resources(self.resources, 2)
+        self.assertEqual([r["name"] for r in ranked], ["c.png", "a.js"])
+        self.assertEqual(others["resources"], 2)
+        self.assertEqual(others["duration_avg"], 1.0)
+        self.assertEqual(others["size_avg"], 0.25)
+
+    def test_top_larger_than_the_list_has_no_others(self):
+        ranked, others = resource_index.top_resources(self.resources, 10)
+        self.assertEqual(ranked, resource_index.rank_resources(self.resources))
+        self.assertIsNone(others)
+
+    def test_invalid_top_is_rejected(self):
+        for top in ("0", "-1", "abc", ""):
+            response = self.client.get("/api/dashboard/resources/general/", {"url": "tienda.claro.com.co", "top": top})
+            self.assertEqual(response.status_code, 400, top)
+
+
+# ============================================================
+# ddsketch / latency_sketches
+# ============================================================
+class DDSketchTests(SimpleTestCase):
+    def test_quantiles_within_relative_accuracy(self):
+        rng = np.random.default_rng(7)
+        values = rng.lognormal(mean=0.0, sigma=1.5, size=20000)
+        sketch = DDSketch(0.01)
+        sketch.add_many(values, np.ones_like(values))
+
+        for q in (0.5, 0.9, 0.99):
+            expected = float(np.quantile(values, q, method="inverted_cdf"))
+            self.assertAlmostEqual(sketch.quantile(q) / expected, 1.0, delta=0.011)
+
+    def test_merge_equals_single_sketch(self):
+        rng = random.Random(3)
+        values = [rng.uniform(0.01, 50) for _ in range(5000)]
+        whole = DDSketch()
+        left, right = DDSketch(), DDSketch()
+        for i, value in enumerate(values):
+            whole.add(value)
+            (left if i % 2 else right).add(value)
+
+        merged = DDSketch().merge(left).merge(right)
+        self.assertEqual(merged.count, whole.count)
+        self.assertEqual(merged.percentiles(), whole.percentiles())
+
+    def test_serialization_and_zero_values(self):
+        sketch = DDSketch()
+        sketch.add(0, 3)
+        sketch.add(2.0, 1)
+        restored = DDSketch.from_dict(sketch.to_dict())
+        self.assertEqual(restored.quantile(0.5), 0.0)
+        self.assertAlmostEqual(restored.quantile(1.0), 2.0, delta=0.02 * 2.0)
+        self.assertIsNone(DDSketch().quantile(0.5))
+
+    def test_merge_rejects_different_accuracy(self):
+        with self.assertRaises(ValueError):
+            DDSketch(0.01).merge(DDSketch(0.02))
+
+
+class ResourcePercentilesTests(TestCase):
+    def setUp(self):
+        resource_cube.clear()
+        self.addCleanup(resource_cube.clear)
+
+    def test_closed_days_are_stored_and_served_locally(self):
+        ga4 = _ReportClient(ResourceCubeTests.rows)
+        args = ("1", "tienda.claro.com.co/cart", "2025-03-01", "2025-03-02")
+        percentiles = latency_sketches.resource_percentiles(ga4, *args)
+
+        app = percentiles["https://tienda.claro.com.co/app.js"]
+        self.assertEqual(set(app), {"p50_of_means", "p90_of_means", "p99_of_means"})
+        self.assertAlmostEqual(app["p50_of_means"], 2.0, delta=0.02 * 2.0)
+        self.assertAlmostEqual(app["p99_of_means"], 4.0, delta=0.02 * 4.0)
+
+        resource_cube.clear()
+        self.assertEqual(latency_sketches.resource_percentiles(ga4, *args, local_only=True), percentiles)
+        self.assertEqual(len(ga4.requests), 1)
+
+
+# ============================================================
+# Vistas (atribución por endpoint)
+# ============================================================
+class InstrumentedViewTests(SimpleTestCase):
+    def test_view_reports_are_attributed_to_the_view(self):
+        @ga4_metrics.instrumented_view
+        def some_view(request):
+            return ga4_metrics.current_endpoint()
+
+        self.assertEqual(some_view(None), "some_view")
+        self.assertEqual(ga4_metrics.current_endpoint(), ga4_metrics.UNKNOWN_ENDPOINT)
+
+    def test_routes_use_sync_views(self):
+        match = resolve("/api/dashboard/funnel-data/")
+        self.assertEqual(match.func.__name__, "ga4_funnel_data")
+        self.assertFalse(asyncio.iscoroutinefunction(match.func))
+
+
+# ============================================================
+# aggregates
+# ============================================================
+class AggregatesTests(SimpleTestCase):
+    def test_records_have_no_instance_dict(self):
+        for record in (StageStats(), ResourceTotals(), ClickStats("banner", "img.png"), PurchaseStats()):
+            self.assertFalse(hasattr(record, "__dict__"), type(record).__name__)
+
+    def test_stage_times_by_device(self):
+        stage = StageStats()
+        stage.add_time("desktop", 4)
+        stage.add_time("mobile", 2)
+        stage.add_time("tablet", 6)
+        stage.url("/cart").vistas += 3
+        self.assertEqual(stage.averages(), (4, 4, 2))
+        self.assertIs(stage.url("/cart"), stage.urls["/cart"])
+        self.assertEqual(stage.url("/cart").vistas, 3)
+
+    def test_resource_totals_merge_and_averages(self):
+        totals = ResourceTotals("script", events=2, duration=6, repeat=2, size=100, rows=1)
+        totals.merge(ResourceTotals("script", events=2, duration=2, repeat=0, size=100, rows=1))
+        self.assertEqual(totals.averages(), (2, 0.5, 50))
+        totals.merge(ResourceTotals("script", events=4, duration=8, repeat=2, size=200, rows=2), sign=-1)
+        self.assertEqual((totals.rows, totals.averages()), (0, (0, 0, 0)))
+
+
+# ============================================================
+# resource_regressions
+# ============================================================
+class ResourceRegressionTests(TestCase):
+    day = date(2025, 3, 20)
+
+    def add_stat(self, day, duration, size=1000.0, events=100, resource="app.js"):
+        ResourceDailyStat.objects.create(
+            page="tienda.claro.com.co/cart", resource=resource, date=day,
+            events=events, duration_avg=duration, size_avg=size,
+        )
+
+    def test_detect_flags_only_the_metric_that_regressed(self):
+        for i in range(1, 11):
+            self.add_stat(self.day - timedelta(days=i), 1.0 + 0.01 * (i % 3))
+        self.add_stat(self.day, 2.0)
+
+        regressions = resource_regressions.detect(self.day, baseline_days=14)
+
+        self.assertEqual([(r.resource, r.metric) for r in regressions], [("app.js", "duration")])
+        self.assertEqual(regressions[0].baseline_days, 10)
+        self.assertGreater(regressions[0].zscore, resource_regressions.Z_THRESHOLD)
+
+    def test_detect_ignores_short_baselines_and_low_traffic_days(self):
+        for i in range(1, 4):
+            self.add_stat(self.day - timedelta(days=i), 1.0)
+        self.add_stat(self.day, 5.0)
+        for i in range(1, 11):
+            self.add_stat(self.day - timedelta(days=i), 1.0, resource="poco.js")
+        self.add_stat(self.day, 5.0, events=1, resource="poco.js")
+
+        self.assertEqual(resource_regressions.detect(self.day, baseline_days=14), [])
+
+    def test_small_relative_change_is_not_a_regression(self):
+        self.assertIsNone(resource_regressions._detect_metric(1.05, [1.0] * 10))
+        self.assertIsNotNone(resource_regressions._detect_metric(1.5, [1.0] * 10))
+
+
+class DailyJobsTests(TestCase):
+    def test_only_one_worker_runs_the_daily_jobs(self):
+        index = SimpleNamespace(property_id="1", refreshed_on=date(2025, 3, 20))
+        with mock.patch.object(resource_regressions, "run", return_value=([], [])) as run, \
+                mock.patch.object(funnel, "materialize", return_value=[]) as materialize, \
+                mock.patch.object(resource_index.fact_store, "prune", return_value=0), \
+                mock.patch.object(resource_index.ga4_client, "get_client"):
+            resource_index._daily_jobs(index)
+            resource_index._daily_jobs(SimpleNamespace(**vars(index)))
+
+        self.assertEqual(run.call_count, 1)
+        self.assertEqual(materialize.call_count, 1)
+
+    def test_failed_daily_jobs_release_the_day(self):
+        index = SimpleNamespace(property_id="1", refreshed_on=date(2025, 3, 20))
+        with mock.patch.object(resource_regressions, "run", side_effect=RuntimeError("GA4")), \
+                mock.patch.object(resource_index.ga4_client, "get_client"):
+            with self.assertRaises(RuntimeError):
+                resource_index._daily_jobs(index)
+
+        self.assertFalse(DailyJobRun.objects.exists())
+
+
+# ============================================================
+# funnel
+# ============================================================
+def _legacy_stage(page_path):
+    """Reglas originales de ga4_funnel_data (una búsqueda de substring por patrón)."""
+    path_lower = page_path.lower()
+    patterns = dict(funnel.STAGE_PATTERNS)
+    if path_lower in ["/", "", "tienda.claro.com.co"]:
+        return funnel.ATRACCION
+    elif any(p in path_lower for p in patterns[funnel.CONVERSION]):
+        return funnel.CONVERSION
+    elif any(p in path_lower for p in patterns[funnel.CONSIDERACION]):
+        return funnel.CONSIDERACION
+    elif any(p in path_lower for p in patterns[funnel.INTERES]):
+        return funnel.INTERES
+    return funnel.INTERES
+
+
+class FunnelStageTests(SimpleTestCase):
+    def test_known_paths(self):
+        self.assertEqual(funnel.get_stage("/"), funnel.ATRACCION)
+        self.assertEqual(funnel.get_stage("Tienda.Claro.com.co"), funnel.ATRACCION)
+        self.assertEqual(funnel.get_stage("/checkout/ThankYou"), funnel.CONVERSION)
+        self.assertEqual(funnel.get_stage("/cart/resumen-pedido"), funnel.CONVERSION)
+        self.assertEqual(funnel.get_stage("/tienda/cart"), funnel.CONSIDERACION)
+        self.assertEqual(funnel.get_stage("/detalle-producto/123"), funnel.INTERES)
+        self.assertEqual(funnel.get_stage("/otra\npagina"), funnel.INTERES)
+
+    def test_matches_legacy_rules(self):
+        fragments = [p for _, patterns in funnel.STAGE_PATTERNS for p in patterns]
+        fragments += ["/", "home", "CART", "Pago", "x", "\n", "?q=1", "resumen", "-prepost"]
+        rng = random.Random(42)
+        for _ in range(5000):
+            path = "".join(rng.choice(fragments) for _ in range(rng.randint(0, 4)))
+            self.assertEqual(funnel.get_stage(path), _legacy_stage(path), path)
+
+
+class _FunnelClient:
+    """Cliente falso: filas (fecha, dispositivo, path, vistas) filtradas por el rango pedido."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.ranges = []
+
+    def run_report(self, request, timeout=None):
+        date_range = request.date_ranges[0]
+        self.ranges.append((date_range.start_date, date_range.end_date))
+        start, end = (date_range.start_date.replace("-", ""), date_range.end_date.replace("-", ""))
+        page = [row for row in self.rows if start <= row[0] <= end]
+        return RunReportResponse(
+            dimension_headers=[DimensionHeader(name=d.name) for d in request.dimensions],
+            metric_headers=[
+                MetricHeader(name=m.name, type_=MetricType.TYPE_INTEGER) for m in request.metrics
+            ],
+            rows=[
+                Row(
+                    dimension_values=[DimensionValue(value=v) for v in row[:3]],
+                    metric_values=[MetricValue(value=str(row[3])), MetricValue(value="1"), MetricValue(value="2")],
+                )
+                for row in page
+            ],
+            row_count=len(page),
+        )
+
+
+class FunnelMaterializeTests(TestCase):
+    def test_aggregates_are_kept_per_property(self):
+        funnel.materialize(_FunnelClient([["20250301", "Mobile", "/cart", 5]]), "1", date(2025, 3, 1), date(2025, 3, 1))
+        funnel.materialize(_FunnelClient([["20250301", "Mobile", "/cart", 7]]), "2", date(2025, 3, 1), date(2025, 3, 1))
+
+        self.assertEqual(
+            funnel.load_range(_FunnelClient([]), "1", "2025-03-01", "2025-03-01"),
+            [(funnel.CONSIDERACION, "mobile", "/cart", 5, 1, 2.0)],
+        )
+        self.assertEqual(
+            funnel.load_range(_FunnelClient([]), "2", "2025-03-01", "2025-03-01"),
+            [(funnel.CONSIDERACION, "mobile", "/cart", 7, 1, 2.0)],
+        )
+
+    def test_only_missing_days_are_requested(self):
+        client = _FunnelClient([["20250302", "desktop", "/", 3], ["20250304", "desktop", "/", 4]])
+        self.assertEqual(len(funnel.materialize(client, "1", date(2025, 3, 1), date(2025, 3, 5))), 5)
+        FunnelDayAggregate.objects.filter(property_id="1", date__in=[date(2025, 3, 3), date(2025, 3, 4)]).delete()
+
+        self.assertEqual(funnel.materialize(client, "1", date(2025, 3, 1), date(2025, 3, 5)), [date(2025, 3, 3), date(2025, 3, 4)])
+        self.assertEqual(client.ranges, [("2025-03-01", "2025-03-05"), ("2025-03-03", "2025-03-04")])
+        self.assertEqual(
+            funnel.load_range(client, "1", "2025-03-01", "2025-03-05"),
+            [(funnel.ATRACCION, "desktop", "/", 7, 2, 4.0)],
+        )
+
+
+# ============================================================
+# click_relation
+# ============================================================
+class _ClickRelationClient:
+    """Cliente falso: sesiones del rango completo y compras repartidas por día."""
+
+    def __init__(self):
+        self.requests = []
+
+    def run_report(self, request, timeout=None):
+        self.requests.append(request)
+        names = [d.name for d in request.dimensions]
+        if "date" in names:
+            rows = [
+                (["banner", "20250301"], ["1", "100"]),
+                (["banner", "20250302"], ["2", "50.5"]),
+            ]
+        else:
+            # La misma sesión clickeó los dos días: el rango tiene 3, no 2 + 2
+            rows = [(["banner", "img.png"], ["3", "4"])]
+        return RunReportResponse(
+            dimension_headers=[DimensionHeader(name=name) for name in names],
+            rows=[
+                Row(
+                    dimension_values=[DimensionValue(value=v) for v in dims],
+                    metric_values=[MetricValue(value=v) for v in metrics],
+                )
+                for dims, metrics in rows
+            ],
+            row_count=len(rows),
+        )
+
+
+@mock.patch.dict(os.environ, {"GOOGLE_APPLICATION_CREDENTIALS": "tests", "GA4_PROPERTY_ID": "1"})
+class ClickRelationViewTests(TestCase):
+    def test_sessions_come_from_the_whole_range_and_purchases_from_day_facts(self):
+        client = _ClickRelationClient()
+        with mock.patch.object(views, "_get_ga4_client", return_value=client):
+            response = self.client.get("/api/dashboard/click_relation/?start=2025-03-01&end=2025-03-02")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["data"], [{
+            "elemento": "banner",
+            "img_click_home": "img.png",
+            "sesiones": 3,
+            "carritos": 4,
+            "compras": 3,
+            "ingresos": 150.5,
+        }])
+        sessions_request = next(r for r in client.requests if "sessions" in [m.name for m in r.metrics])
+        self.assertEqual(
+            (sessions_request.date_ranges[0].start_date, sessions_request.date_ranges[0].end_date),
+            ("2025-03-01", "2025-03-02"),
+        )
+
+
+# ============================================================
+# session_flows (has_click_flow del detalle de clicks)
+# ============================================================
+class _ChunkClient:
+    """Cliente falso: un día con clicks por sesión listada en `clicks`; registra los bloques pedidos."""
+
+    def __init__(self, clicks):
+        self.clicks = clicks
+        self.chunks = []
+        self._lock = threading.Lock()
+
+    def run_report(self, request, timeout=None):
+        ids = list(request.dimension_filter.and_group.expressions[1].filter.in_list_filter.values)
+        with self._lock:
+            self.chunks.append(sorted(ids))
+        rows = [
+            Row(dimension_values=[DimensionValue(value=s), DimensionValue(value=self.clicks[s])])
+            for s in ids if s in self.clicks
+        ]
+        return RunReportResponse(rows=rows, row_count=len(rows))
+
+
+class SessionFlowTests(SimpleTestCase):
+    def setUp(self):
+        session_flows.clear()
+        self.addCleanup(session_flows.clear)
+
+    def test_covers_and_has_flow(self):
+        d = date(2025, 1, 1)
+        flow = session_flows.SessionFlow(d, d + timedelta(days=9), [d + timedelta(days=4)])
+        self.assertTrue(flow.covers(d + timedelta(days=1), d + timedelta(days=9)))
+        self.assertFalse(flow.covers(d, d + timedelta(days=10)))
+        self.assertTrue(flow.has_flow(d + timedelta(days=4), d + timedelta(days=20)))
+        self.assertFalse(flow.has_flow(d + timedelta(days=5), d + timedelta(days=9)))
+
+    def test_extend(self):
+        d = date(2025, 1, 1)
+        flow = session_flows.SessionFlow(d, d + timedelta(days=4), [d])
+        joined = flow.extend(d + timedelta(days=5), d + timedelta(days=9), [d + timedelta(days=7)])
+        self.assertEqual((joined.start, joined.end), (d, d + timedelta(days=9)))
+        self.assertEqual(joined.flow_days, {d, d + timedelta(days=7)})
+
+        # Rangos que no se tocan: queda el consultado, pero se conservan los días con clicks
+        apart = flow.extend(d + timedelta(days=30), d + timedelta(days=40), [])
+        self.assertEqual((apart.start, apart.end), (d + timedelta(days=30), d + timedelta(days=40)))
+        self.assertEqual(apart.flow_days, {d})
+
+    def test_sessions_are_checked_in_chunks_and_remembered(self):
+        ga4 = _ChunkClient({"s1": "20250105", "s4": "20250120"})
+        with mock.patch.object(session_flows, "CHUNK_SIZE", 2):
+            found = session_flows.sessions_with_flow(ga4, "1", ["s1", "s2", "s3", "s4", ""], "2025-01-01", "2025-01-31")
+            self.assertEqual(found, {"s1", "s4"})
+            self.assertEqual(sorted(ga4.chunks), [["s1", "s2"], ["s3", "s4"]])
+
+            # Un sub-rango ya consultado se resuelve sin GA4
+            found = session_flows.sessions_with_flow(ga4, "1", ["s1", "s2", "s4"], "2025-01-01", "2025-01-10")
+            self.assertEqual(found, {"s1"})
+            self.assertEqual(len(ga4.chunks), 2)
+
+
+# ============================================================
+# session_locator
+# ============================================================
+class SessionLocatorTests(TestCase):
+    def locator(self, first, last):
+        return SessionLocator(session_id="s", first_date=date.fromisoformat(first), last_date=date.fromisoformat(last))
+
+    def test_clamp_adds_margin_inside_range(self):
+        self.assertEqual(
+            session_locator._clamp(self.locator("2025-02-10", "2025-02-11"), "2025-01-01", "2025-12-31"),
+            ("2025-02-09", "2025-02-12"),
+        )
+
+    def test_clamp_limits_to_range(self):
+        self.assertEqual(
+            session_locator._clamp(self.locator("2025-01-01", "2025-01-05"), "2025-01-03", "2025-01-04"),
+            ("2025-01-03", "2025-01-04"),
+        )
+
+    def test_clamp_outside_range(self):
+        self.assertIsNone(
+            session_locator._clamp(self.locator("2025-01-01", "2025-01-02"), "2025-03-01", "2025-03-31")
+        )
+
+    def test_record_only_widens_known_ranges(self):
+        session_locator.record([("a", "20250210"), ("a", "2025021123"), ("(not set)", "20250210"), ("b", "x")])
+        session_locator.record([("a", date(2025, 2, 10)), ("a", "20250215")])
+
+        self.assertEqual(
+            list(SessionLocator.objects.values_list("session_id", "first_date", "last_date")),
+            [("a", date(2025, 2, 10), date(2025, 2, 15))],
+        )
+        self.assertEqual(session_locator.narrow_range("a", "2025-01-01", "2025-12-31"), ("2025-02-09", "2025-02-16"))
+        self.assertIsNone(session_locator.narrow_range("b", "2025-01-01", "2025-12-31"))
+
+
+# ============================================================
+# click_paths
+# ============================================================
+def _paths(sequences, depth=3):
+    """ClickPaths construido a mano con el mismo conteo que build_paths."""
+    root = click_paths.PathNode()
+    for steps in sequences:
+        root.count += 1
+        node = root
+        for step in steps[:depth]:
+            node = node.child(step)
+            node.count += 1
+    return click_paths.ClickPaths(root, depth, "2025-01-01", "2025-01-07")
+
+
+class ClickPathsBuildTests(SimpleTestCase):
+    headers = [click_paths.SESSION, click_paths.EVENT, click_paths.CLICK, click_paths.PAGE, click_paths.TIMESTAMP]
+    home = "https://tienda.claro.com.co/"
+    cart = "https://tienda.claro.com.co/cart"
+
+    def test_sessions_split_across_pages_are_counted_once(self):
+        rows = [
+            ["s1", "page_view", "(not set)", self.home, "202501010900"],
+            ["s1", "user_click_event", "comprar", self.home, "202501010901"],
+            # Cambio de página del reporte en medio de s1
+            ["s1", "page_view", "(not set)", self.cart, "202501010902"],
+            ["s2", "page_view", "(not set)", self.home, "202501011000"],
+            ["s2", "user_click_event", "comprar", self.home, "202501011001"],
+            ["(not set)", "page_view", "(not set)", self.home, "202501011100"],
+        ]
+        client = _PagedClient(self.headers, rows, page_size=2)
+
+        with mock.patch.object(click_paths, "MIN_COUNT_FLOOR", 1):
+            paths = click_paths.build_paths(client, "1", "2025-01-01", "2025-01-07", depth=4)
+
+        trie = click_paths.to_trie(paths, min_count=1)
+        self.assertEqual(trie["count"], 2)
+        home = trie["children"][0]
+        self.assertEqual((home["name"], home["count"]), ("page: https://tienda.claro.com.co", 2))
+        click = home["children"][0]
+        self.assertEqual((click["name"], click["count"]), ("click: comprar", 2))
+        self.assertEqual([c["name"] for c in click["children"]], ["page: https://tienda.claro.com.co"])
+        self.assertEqual(len(client.requests), 3)
+
+    def test_request_keeps_only_path_events_ordered_by_session(self):
+        request = click_paths._paths_request("1", "2025-01-01", "2025-01-07")
+        flt = request.dimension_filter.filter
+        self.assertEqual(flt.field_name, click_paths.EVENT)
+        self.assertEqual(list(flt.in_list_filter.values), list(click_paths.PATH_EVENTS))
+        self.assertEqual(
+            [o.dimension.dimension_name for o in request.order_bys],
+            [click_paths.SESSION, click_paths.TIMESTAMP],
+        )
+
+
+class ClickPathsCacheTests(SimpleTestCase):
+    def tearDown(self):
+        click_paths.clear()
+
+    def test_failures_are_remembered_instead_of_pending_forever(self):
+        with mock.patch.object(click_paths, "build_paths", side_effect=RuntimeError("cuota")), \
+                mock.patch.object(click_paths.ga4_client, "get_client"):
+            self.assertEqual(click_paths.get_paths("1", "2025-01-01", "2025-01-07")[:2], (None, True))
+            click_paths._executor.submit(lambda: None).result()
+            paths, stale, error = click_paths.get_paths("1", "2025-01-01", "2025-01-07")
+
+        self.assertIsNone(paths)
+        self.assertEqual(error, "RuntimeError: cuota")
+
+
+class ClickPathsSerializationTests(SimpleTestCase):
+    def setUp(self):
+        self.paths = _paths([
+            ["page: /", "click: comprar", "page: /cart"],
+            ["page: /", "click: comprar"],
+            ["page: /", "page: /planes"],
+            ["page: /planes"],
+        ])
+
+    def test_to_trie(self):
+        trie = click_paths.to_trie(self.paths, min_count=1)
+        self.assertEqual((trie["name"], trie["count"], trie["others"]), (click_paths.ROOT, 4, 0))
+        home = trie["children"][0]
+        self.assertEqual((home["name"], home["count"], home["others"]), ("page: /", 3, 0))
+        self.assertEqual([c["name"] for c in home["children"]], ["click: comprar", "page: /planes"])
+
+    def test_to_trie_prunes(self):
+        trie = click_paths.to_trie(self.paths, min_count=2)
+        home = trie["children"][0]
+        self.assertEqual([c["name"] for c in trie["children"]], ["page: /"])
+        self.assertEqual(trie["others"], 1)
+        self.assertEqual([c["name"] for c in home["children"]], ["click: comprar"])
+        self.assertEqual(home["others"], 1)
+
+    def test_to_sankey(self):
+        sankey = click_paths.to_sankey(self.paths, min_count=2)
+        names = [(n["depth"], n["name"]) for n in sankey["nodes"]]
+        links = {
+            (names[link["source"]], names[link["target"]]): link["value"]
+            for link in sankey["links"]
+        }
+        self.assertEqual(links, {
+            ((0, click_paths.ROOT), (1, "page: /")): 3,
+            ((1, "page: /"), (2, "click: comprar")): 2,
+        })
+
+
+# ============================================================
+# Flujo de clicks en lote
+# ============================================================
+class _FlowClient:
+    """Cliente falso: filas de flujo de las sesiones del in_list_filter; registra cada consulta."""
+
+    def __init__(self, events):
+        self.events = events
+        self.queries = []
+
+    def run_report(self, request, timeout=None):
+        ids = list(request.dimension_filter.filter.in_list_filter.values)
+        date_range = request.date_ranges[0]
+        self.queries.append((date_range.start_date, date_range.end_date, sorted(ids)))
+        rows = [
+            Row(dimension_values=[DimensionValue(value=v) for v in (s, "user_click_event", "comprar", "https://tienda.claro.com.co/", ts)])
+            for s in ids
+            for ts in self.events.get(s, [])
+        ]
+        return RunReportResponse(rows=rows, row_count=len(rows))
+
+
+class SessionBucketTests(SimpleTestCase):
+    def test_buckets_group_nearby_sessions_only(self):
+        buckets = session_flows._buckets({
+            "a": ("2025-11-01", "2025-11-03"),
+            "b": ("2025-11-02", "2025-11-05"),
+            "old": ("2025-10-16", "2025-10-18"),
+            "c": ("2025-11-20", "2025-11-21"),
+        }, max_days=7)
+        self.assertEqual(buckets, [
+            ("2025-10-16", "2025-10-18", ["old"]),
+            ("2025-11-01", "2025-11-05", ["a", "b"]),
+            ("2025-11-20", "2025-11-21", ["c"]),
+        ])
+
+    def test_same_wide_range_is_one_bucket(self):
+        ranges = {s: ("2025-01-01", "2025-12-31") for s in ("a", "b", "c")}
+        self.assertEqual(session_flows._buckets(ranges, max_days=7), [("2025-01-01", "2025-12-31", ["a", "b", "c"])])
+
+
+@mock.patch.dict(os.environ, {"GOOGLE_APPLICATION_CREDENTIALS": "tests", "GA4_PROPERTY_ID": "1"})
+class ClickFlowsViewTests(TestCase):
+    url = "/api/dashboard/user_click_flows/"
+
+    def post(self, body):
+        return self.client.post(self.url, body, content_type="application/json")
+
+    def test_each_bucket_is_queried_over_its_own_days(self):
+        SessionLocator.objects.create(session_id="reciente", first_date=date(2025, 11, 2), last_date=date(2025, 11, 2))
+        SessionLocator.objects.create(session_id="antigua", first_date=date(2025, 10, 20), last_date=date(2025, 10, 20))
+        client = _FlowClient({
+            "reciente": ["202511021000"],
+            "antigua": ["202510201000"],
+            "nueva": ["202511101000"],
+        })
+
+        with mock.patch.object(views, "_get_ga4_client", return_value=client):
+            response = self.post({"session_ids": ["reciente", "antigua", "nueva"]})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()["data"]), {"reciente", "antigua", "nueva"})
+        start_date, end_date = views._click_flow_range()
+        self.assertEqual(sorted(client.queries), sorted([
+            ("2025-10-19", "2025-10-21", ["antigua"]),
+            ("2025-11-01", "2025-11-03", ["reciente"]),
+            (start_date, end_date, ["nueva"]),
+        ]))
+        # Lo encontrado en el rango amplio queda indexado
+        self.assertTrue(SessionLocator.objects.filter(session_id="nueva").exists())
+
+    def test_malformed_bodies_are_rejected(self):
+        self.assertEqual(self.client.post(self.url, "{", content_type="application/json").status_code, 400)
+        self.assertEqual(self.post(["a"]).status_code, 400)
+        self.assertEqual(self.post({"session_ids": "a,b"}).status_code, 400)
+        self.assertEqual(self.post({"session_ids": [1, 2]}).status_code, 400)
+        self.assertEqual(self.post({"session_ids": []}).status_code, 400)
+        too_many = [f"s{i}" for i in range(views.CLICK_FLOW_BATCH_MAX + 1)]
+        self.assertEqual(self.post({"session_ids": too_many}).status_code, 400)
@@ -3,6 +3,7 @@ from . import views
 
 urlpatterns = [
     path('dashboard/metrics/', views.ga4_dashboard_metrics, name="ga4_dashboard_metrics"),
+    path('dashboard/metrics/prometheus/', views.ga4_prometheus_metrics, name="ga4_prometheus_metrics"),
     path("dashboard/daily-metrics/", views.ga4_dashboard_daily_metrics),
     path("dashboard/load-time-hourly/", views.ga4_load_time_by_device_and_hour, name="ga4_load_time_by_device_and_hour"),
     path('dashboard/funnel-data/', views.ga4_funnel_data, name='ga4_funnel_data'),
@@ -10,11 +11,15 @@ urlpatterns = [
     path('dashboard/click_relation/', views.ga4_click_relation, name='click_relation_data'),
     path('dashboard/click_detail/<str:elemento>/', views.ga4_click_detail, name='click_detail_data'),
     path("dashboard/user_click_flow/", views.ga4_click_flow, name="user_click_flow"),  
+    path("dashboard/user_click_flows/", views.ga4_click_flows, name="user_click_flows"),
+    path("dashboard/click_paths/", views.ga4_click_paths, name="click_paths"),
     path("dashboard/genia-summary/", views.ga4_genia_summary, name="ga4_dashboard_summary"),
     path("dashboard/genia-daily-chart/", views.ga4_genia_ingresos_por_dia, name="ga4_dashboard_daily-chart"),
     path('dashboard/resources/general/', views.ga4_resources_general, name='ga4_resources_general'),
     path('dashboard/resources/hourly/', views.ga4_resources_hourly, name='ga4_resources_hourly'),
     path('dashboard/resources/daily/', views.ga4_resources_daily, name='ga4_resources_daily'),
+    path('dashboard/resources/cube/', views.ga4_resources_cube, name='ga4_resources_cube'),
+    path('dashboard/resources/regressions/', views.ga4_resource_regressions, name='ga4_resource_regressions'),
     path('dashboard/embudo_migra/', views.ga4_migracion_view_item_list, name='item_list'),
     path('dashboard/ga4_migracion_view_alert/', views.ga4_migracion_view_alert, name='view_alert'),
     path('dashboard/sesiones-vs-compras-comparacion/', views.sesiones_vs_compras_comparacion_view, name='sesiones_vs_compras_comparacion'),
@@ -1,7 +1,7 @@
 
 from datetime import datetime, timedelta
 import os
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from google.analytics.data_v1beta import BetaAnalyticsDataClient
 from google.analytics.data_v1beta.types import DateRange, Metric, Dimension, RunReportRequest, FilterExpression, Filter, FilterExpressionList
 from urllib.parse import urlparse
@@ -10,8 +10,17 @@ from collections import defaultdict
 import json
 from django.views.decorators.http import require_GET
 import re
+from . import ga4_client, ga4_filters, ga4_metrics, ga4_urls
+from .ga4_executor import run_parallel
+from . import click_paths, fact_store, funnel, latency_sketches, resource_cube, resource_index, resource_regressions
+from . import session_flows, session_locator
+from .models import ResourceRegression
+from .aggregates import ClickStats, PurchaseStats, StageStats
+from .ga4_columns import decode_pages, decode_response
+from .ga4_pagination import iter_report_pages, iter_report_rows
 
 
+@ga4_metrics.instrumented_view
 def ga4_dashboard_metrics(request):
 
     try:
@@ -28,7 +37,7 @@ def ga4_dashboard_metrics(request):
         start_date = request.GET.get("start", "7daysAgo")
         end_date = request.GET.get("end", "today")
 
-        client = BetaAnalyticsDataClient.from_service_account_file(credentials_path)
+        client = _get_ga4_client()
 
         response = client.run_report(
             RunReportRequest(
@@ -56,6 +65,15 @@ def ga4_dashboard_metrics(request):
     
 
 
+def ga4_prometheus_metrics(request):
+    """Histogramas de ga4_metrics en formato de texto de Prometheus."""
+    return HttpResponse(
+        ga4_metrics.render_prometheus(),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+@ga4_metrics.instrumented_view
 def ga4_dashboard_daily_metrics(request):
     try:
         credentials_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
@@ -73,7 +91,7 @@ def ga4_dashboard_daily_metrics(request):
             start_date = start_date_obj.strftime("%Y-%m-%d")
             end_date = end_date_obj.strftime("%Y-%m-%d")
 
-        client = BetaAnalyticsDataClient.from_service_account_file(credentials_path)
+        client = _get_ga4_client()
 
         response = client.run_report(
             RunReportRequest(
@@ -88,6 +106,9 @@ def ga4_dashboard_daily_metrics(request):
             )
         )
 
+        # Percentiles desde los sketches diarios (solo días faltantes van a GA4)
+        percentiles = latency_sketches.page_load_percentiles_by_day(client, property_id, start_date, end_date)
+
         data = []
         for row in response.rows:
             total_loading_time = float(row.metric_values[0].value)
@@ -96,11 +117,15 @@ def ga4_dashboard_daily_metrics(request):
 
             avg_load_time = total_loading_time / total_events if total_events > 0 else 0
 
-            data.append({
-                "date": row.dimension_values[0].value,
+            date = row.dimension_values[0].value
+            entry = {
+                "date": date,
                 "avg_load_time": round(avg_load_time, 2),
                 "items": items,
-            })
+            }
+            for name, value in percentiles.get(date, {}).items():
+                entry[f"load_time_{name}"] = value
+            data.append(entry)
 
         return JsonResponse(data, safe=False)
 
@@ -109,6 +134,7 @@ def ga4_dashboard_daily_metrics(request):
    
 
 
+@ga4_metrics.instrumented_view
 def ga4_load_time_by_device_and_hour(request):
 
     """
@@ -131,7 +157,7 @@ def ga4_load_time_by_device_and_hour(request):
             start_date = start_date_obj.strftime("%Y-%m-%d")
             end_date = end_date_obj.strftime("%Y-%m-%d")
 
-        client = BetaAnalyticsDataClient.from_service_account_file(credentials_path)
+        client = _get_ga4_client()
 
         # 2. Definir las dimensiones y métricas
         response = client.run_report(
@@ -149,6 +175,11 @@ def ga4_load_time_by_device_and_hour(request):
             )
         )
 
+        # Percentiles por (dispositivo, hora) desde los sketches diarios
+        percentiles = latency_sketches.page_load_percentiles_by_device_hour(
+            client, property_id, start_date, end_date
+        )
+
         # 3. Procesar la respuesta
         processed_data = []
         for row in response.rows:
@@ -173,11 +204,14 @@ def ga4_load_time_by_device_and_hour(request):
             # Calcular el tiempo promedio de carga
             avg_load_time = total_loading_time / total_events if total_events > 0 else 0
 
-            processed_data.append({
+            entry = {
                 "hour": int(hour),
                 "deviceCategory": device_category,
                 "avg_load_time": round(avg_load_time, 2),
-            })
+            }
+            for name, value in percentiles.get((device_category, hour), {}).items():
+                entry[f"load_time_{name}"] = value
+            processed_data.append(entry)
 
         return JsonResponse(processed_data, safe=False)
 
@@ -187,6 +221,7 @@ def ga4_load_time_by_device_and_hour(request):
     
 
 
+@ga4_metrics.instrumented_view
 def ga4_funnel_data(request):
     """
     Obtiene datos del embudo de marketing agrupados por etapa del funnel.
@@ -208,140 +243,45 @@ def ga4_funnel_data(request):
             start_date = start_date_obj.strftime("%Y-%m-%d")
             end_date = end_date_obj.strftime("%Y-%m-%d")
 
-        client = BetaAnalyticsDataClient.from_service_account_file(credentials_path)
+        # 2. Agregados del rango: días materializados (ya clasificados por etapa)
+        #    más los días en procesamiento
+        rows = funnel.load_range(_get_ga4_client(), property_id, start_date, end_date)
 
-        # 2. Definir las dimensiones y métricas
-        response = client.run_report(
-            RunReportRequest(
-                property=f"properties/{property_id}",
-                dimensions=[
-                    Dimension(name="deviceCategory"),
-                    Dimension(name="pagePath"),
-                ],
-                metrics=[
-                    Metric(name="screenPageViews"),
-                    Metric(name="eventCount"),
-                    Metric(name="userEngagementDuration"),
-                ],
-                date_ranges=[DateRange(start_date=start_date, end_date=end_date)],
-                limit=10000,  # Aumentar límite para obtener más datos
-            )
-        )
-
-        # 3. Definir patrones de etapas del funnel
-        interes = ["detalle-producto/", "claro/", "results", "login", "resetpassword"]
-        consideracion = ["cart", "delivery", "payments", "pago-a-cuotas", "validacion-otp", 
-                        "datos-personales-prepost", "postpago/cambiate-con-tu-mismo-numero/",
-                        "prepago/cambiate-con-tu-mismo-numero/datos-personales"]
-        conversion = ["thankyou", "resumen-pedido-prepost", "resumen-pedido"]
-
-        def get_stage(page_path):
-            """Determina la etapa del funnel basándose en la URL"""
-            path_lower = page_path.lower()
-            
-            if path_lower in ["/", "", "tienda.claro.com.co"]:
-                return "Atracción"
-            elif any(pattern in path_lower for pattern in conversion):
-                return "Conversión"
-            elif any(pattern in path_lower for pattern in consideracion):
-                return "Consideración"
-            elif any(pattern in path_lower for pattern in interes):
-                return "Interés"
-            else:
-                return "Interés"  # Por defecto
-
-        # 4. Procesar la respuesta
-        funnel_data = {
-            "Atracción": {"vistas": 0, "eventos": 0, "total_time": 0, "count": 0, 
-                         "desktop_time": 0, "mobile_time": 0, "desktop_count": 0, "mobile_count": 0,
-                         "urls": {}},
-            "Interés": {"vistas": 0, "eventos": 0, "total_time": 0, "count": 0,
-                       "desktop_time": 0, "mobile_time": 0, "desktop_count": 0, "mobile_count": 0,
-                       "urls": {}},
-            "Consideración": {"vistas": 0, "eventos": 0, "total_time": 0, "count": 0,
-                             "desktop_time": 0, "mobile_time": 0, "desktop_count": 0, "mobile_count": 0,
-                             "urls": {}},
-            "Conversión": {"vistas": 0, "eventos": 0, "total_time": 0, "count": 0,
-                          "desktop_time": 0, "mobile_time": 0, "desktop_count": 0, "mobile_count": 0,
-                          "urls": {}},
-        }
-
-        for row in response.rows:
-            device_category = row.dimension_values[0].value.lower()
-            page_path = row.dimension_values[1].value
+        # 3. Procesar las filas
+        funnel_data = {stage: StageStats() for stage in funnel.STAGES}
 
+        for stage, device_category, page_path, vistas, eventos, tiempo_total in rows:
             # Filtrar solo desktop y mobile
             if device_category not in ["desktop", "mobile"]:
                 continue
 
-            try:
-                vistas = int(row.metric_values[0].value)
-                eventos = int(row.metric_values[1].value)
-                tiempo_total = float(row.metric_values[2].value)
-            except (ValueError, IndexError):
-                continue
-
             # Calcular tiempo promedio por vista
             tiempo_promedio = tiempo_total / vistas if vistas > 0 else 0
 
-            # Determinar etapa del funnel
-            stage = get_stage(page_path)
             stage_data = funnel_data[stage]
 
-            # Agregar datos a la etapa
-            stage_data["vistas"] += vistas
-            stage_data["eventos"] += eventos
-            stage_data["total_time"] += tiempo_promedio
-            stage_data["count"] += 1
-
-            # Agregar datos por dispositivo
-            if device_category == "desktop":
-                stage_data["desktop_time"] += tiempo_promedio
-                stage_data["desktop_count"] += 1
-            elif device_category == "mobile":
-                stage_data["mobile_time"] += tiempo_promedio
-                stage_data["mobile_count"] += 1
+            # Agregar datos a la etapa (total y por dispositivo)
+            stage_data.vistas += vistas
+            stage_data.eventos += eventos
+            stage_data.add_time(device_category, tiempo_promedio)
 
             # Agregar datos de URL
-            if page_path not in stage_data["urls"]:
-                stage_data["urls"][page_path] = {
-                    "vistas": 0,
-                    "total_time": 0,
-                    "count": 0,
-                    "desktop_time": 0,
-                    "mobile_time": 0,
-                    "desktop_count": 0,
-                    "mobile_count": 0,
-                }
-
-            url_data = stage_data["urls"][page_path]
-            url_data["vistas"] += vistas
-            url_data["total_time"] += tiempo_promedio
-            url_data["count"] += 1
-
-            if device_category == "desktop":
-                url_data["desktop_time"] += tiempo_promedio
-                url_data["desktop_count"] += 1
-            elif device_category == "mobile":
-                url_data["mobile_time"] += tiempo_promedio
-                url_data["mobile_count"] += 1
+            url_data = stage_data.url(page_path)
+            url_data.vistas += vistas
+            url_data.add_time(device_category, tiempo_promedio)
 
-        # 5. Formatear respuesta
+        # 4. Formatear respuesta
         result = []
         for stage, data in funnel_data.items():
             # Calcular promedios
-            avg_time = data["total_time"] / data["count"] if data["count"] > 0 else 0
-            avg_desktop = data["desktop_time"] / data["desktop_count"] if data["desktop_count"] > 0 else 0
-            avg_mobile = data["mobile_time"] / data["mobile_count"] if data["mobile_count"] > 0 else 0
+            avg_time, avg_desktop, avg_mobile = data.averages()
 
             # Calcular top URLs
-            total_vistas_stage = data["vistas"]
+            total_vistas_stage = data.vistas
             top_urls = []
-            for url, url_data in data["urls"].items():
-                percentage = (url_data["vistas"] / total_vistas_stage * 100) if total_vistas_stage > 0 else 0
-                avg_url_time = url_data["total_time"] / url_data["count"] if url_data["count"] > 0 else 0
-                avg_url_desktop = url_data["desktop_time"] / url_data["desktop_count"] if url_data["desktop_count"] > 0 else 0
-                avg_url_mobile = url_data["mobile_time"] / url_data["mobile_count"] if url_data["mobile_count"] > 0 else 0
+            for url, url_data in data.urls.items():
+                percentage = (url_data.vistas / total_vistas_stage * 100) if total_vistas_stage > 0 else 0
+                avg_url_time, avg_url_desktop, avg_url_mobile = url_data.averages()
 
                 top_urls.append({
                     "url": url,
@@ -356,8 +296,8 @@ def ga4_funnel_data(request):
 
             result.append({
                 "stage": stage,
-                "vistas": data["vistas"],
-                "eventos": data["eventos"],
+                "vistas": data.vistas,
+                "eventos": data.eventos,
                 "avg_time": round(avg_time, 2),
                 "desktop_time": round(avg_desktop, 2),
                 "mobile_time": round(avg_mobile, 2),
@@ -616,11 +556,8 @@ def ga4_funnel_data(request):
 # ============================================================
 
 def _get_ga4_client():
-    """Retorna cliente de GA4"""
-    credentials_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-    if not credentials_path:
-        raise ValueError("GOOGLE_APPLICATION_CREDENTIALS no configurado")
-    return BetaAnalyticsDataClient.from_service_account_file(credentials_path)
+    """Retorna el cliente GA4 compartido del proceso (canal y token reutilizados)"""
+    return ga4_client.get_client()
 
 
 def _get_property_id():
@@ -632,14 +569,8 @@ def _get_property_id():
 
 
 def _normalize_url(url):
-    """Normaliza URL para comparación"""
-    try:
-        if not url.startswith("http"):
-            url = "https://" + url
-        p = urlparse(url)
-        return f"{p.scheme}://{p.netloc}{p.path.rstrip('/')}"
-    except:
-        return url.split("?")[0]
+    """Normaliza URL para comparación (memoizado en ga4_urls)"""
+    return ga4_urls.normalize_url(url)
 
 
 def _get_date_range(start_date, end_date):
@@ -654,34 +585,8 @@ def _get_date_range(start_date, end_date):
 
 def _get_event_filter():
     """Retorna filtro común para resource_performance"""
-    return FilterExpression(
-        filter=Filter(
-            field_name="eventName",
-            string_filter=Filter.StringFilter(
-                match_type=Filter.StringFilter.MatchType.EXACT,
-                value="resource_performance"
-            )
-        )
-    )
-
-def _get_resource_key(resource_name, page_path, resource_type):
-    """Determina la clave de agrupación (host externo o nombre completo)"""
-    try:
-        parsed_resource = urlparse(resource_name)
-        resource_host = parsed_resource.netloc if parsed_resource.netloc else resource_name
-    except:
-        resource_host = resource_name
-
-    # Determinar si es externo
-    try:
-        parsed_page = urlparse(page_path)
-        page_host = parsed_page.netloc
-        is_external = resource_host and page_host not in resource_host and resource_host != page_host
-    except:
-        is_external = False
+    return ga4_filters.event_name_filter("resource_performance")
 
-    # Retornar host si es externo, nombre completo si es interno
-    return resource_host if is_external else resource_name
 
 # ============================================================
 # ENDPOINT 1: DATOS GENERALES (TOP 50 RECURSOS)
@@ -901,10 +806,14 @@ def _get_resource_key(resource_name, page_path, resource_type):
 '''
 
 
+@ga4_metrics.instrumented_view
 def ga4_resources_general(request):
     """
     Obtiene recursos cargados para una página específica.
     Agrupa por dominio externo o nombre de recurso.
+    Con ?top=N devuelve solo los N más lentos y resume el resto en "others"
+    (solo conteos y promedios por evento; los percentiles se calculan
+    únicamente para los N recursos devueltos).
     """
     try:
         credentials_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
@@ -920,164 +829,68 @@ def ga4_resources_general(request):
 
         start_date = request.GET.get("start")
         end_date = request.GET.get("end")
-        if not start_date or not end_date:
-            end_date_obj = datetime.today()
-            start_date_obj = end_date_obj - timedelta(days=28)
-            start_date = start_date_obj.strftime("%Y-%m-%d")
-            end_date = end_date_obj.strftime("%Y-%m-%d")
+        start_date, end_date = _get_date_range(start_date, end_date)
 
-        # 2. Normalizar URL de búsqueda
-        def normalize_url(url):
-            """Normaliza una URL para comparación"""
+        # ?top=N: solo los N más lentos más un resumen "others"
+        top = request.GET.get("top")
+        if top is not None:
             try:
-                if not url.startswith("http"):
-                    url = "https://" + url
-                parsed = urlparse(url)
-                normalized = f"{parsed.scheme}://{parsed.netloc}{parsed.path.rstrip('/')}"
-                return normalized
-            except:
-                return url.split("?")[0].split("#")[0]
-
-        normalized_search = normalize_url(search_url.lower())
-
-        client = BetaAnalyticsDataClient.from_service_account_file(credentials_path)
-
-        # 3. Consultar GA4 con filtro por evento
-        response = client.run_report(
-            RunReportRequest(
-                property=f"properties/{property_id}",
-                dimensions=[
-                    Dimension(name="eventName"),  # ← AGREGAR: Para filtrar por evento
-                    Dimension(name="customEvent:page_location_loadPage"),
-                    Dimension(name="customEvent:resource_name_loadPage"),
-                    Dimension(name="customEvent:resource_type_loadPage"),
-                ],
-                metrics=[
-                    Metric(name="eventCount"),  # ← CRÍTICO: Necesario para promediar
-                    Metric(name="customEvent:total_duration_loadPage"),
-                    Metric(name="customEvent:resource_total_duration_loadPage"),
-                    Metric(name="customEvent:resource_total_size_loadPage"),
-                    Metric(name="customEvent:resource_repeat_count_loadPage"),
-                ],
-                date_ranges=[DateRange(start_date=start_date, end_date=end_date)],
-                limit=10000,
-            )
+                top = int(top)
+            except ValueError:
+                top = 0
+            if top <= 0:
+                return JsonResponse({"error": "Parámetro 'top' debe ser un entero positivo"}, status=400)
+
+        # 2. Índice local de todas las páginas; si no cubre el rango, cubo de la página
+        #    (una consulta GA4, compartida con hourly/daily)
+        totals = resource_index.get_index(property_id).lookup(
+            _normalize_url(search_url.lower()), start_date, end_date
         )
-
-        # 4. Procesar datos - Filtrar por evento resource_performance
-        grouped = {}
-        filtered_count = 0
-
-        for row in response.rows:
-            try:
-                event_name = row.dimension_values[0].value
-                page_path = row.dimension_values[1].value
-                resource_name = row.dimension_values[2].value
-                resource_type = row.dimension_values[3].value
-                
-                event_count = float(row.metric_values[0].value or 0)
-                page_duration = float(row.metric_values[1].value or 0)
-                resource_duration = float(row.metric_values[2].value or 0)
-                transfer_size = float(row.metric_values[3].value or 0)
-                resource_repeat = float(row.metric_values[4].value or 0)
-
-                # DEBUG: Imprimir primeras 3 filas para ver qué valores llegan
-                if filtered_count < 3:
-                    print(f"🔍 DEBUG Row {filtered_count}:")
-                    print(f"  Resource: {resource_name}")
-                    print(f"  Event Count: {event_count}")
-                    print(f"  Resource Duration: {resource_duration}")
-                    print(f"  Type: {resource_type}")
-
-            except (ValueError, IndexError) as e:
-                print(f"❌ Error parsing row: {e}")
-                continue
-
-            # FILTRO CRÍTICO: Solo eventos resource_performance
-            if event_name != "resource_performance":
-                continue
-
-            # Normalizar y filtrar por URL
-            normalized_page = normalize_url(page_path.lower())
-            if normalized_page != normalized_search:
-                continue
-
-            filtered_count += 1
-
-            # Extraer hostname del recurso
-            try:
-                parsed_resource = urlparse(resource_name)
-                resource_host = parsed_resource.netloc if parsed_resource.netloc else resource_name
-            except:
-                resource_host = resource_name
-
-            # Determinar si es externo o interno
-            try:
-                parsed_page = urlparse(page_path)
-                page_host = parsed_page.netloc
-                is_external = resource_host and page_host not in resource_host and resource_host != page_host
-            except:
-                is_external = False
-
-            # Clave de agrupación
-            key = resource_host if is_external else resource_name
-
-            if key not in grouped:
-                grouped[key] = {
-                    "host": resource_host,
-                    "type": resource_type,
-                    "event_count": 0,
-                    "total_duration": 0,
-                    "total_repeat": 0,
-                    "total_size": 0,
-                }
-
-            grouped[key]["event_count"] += event_count
-            grouped[key]["total_duration"] += resource_duration
-            grouped[key]["total_repeat"] += resource_repeat
-            grouped[key]["total_size"] += transfer_size
-
-        # 5. Calcular promedios usando event_count
-        if filtered_count == 0:
+        from_index = totals is not None
+        if totals is None:
+            cube = resource_cube.get_cube(_get_ga4_client(), property_id, search_url, start_date, end_date)
+            totals = cube.totals()
+        filtered_rows = sum(t.rows for t in totals.values())
+
+        # 3. Promedios por evento, ordenados por duración descendente
+        others = None
+        if top:
+            resources, others = resource_index.top_resources(totals, top)
+        else:
+            resources = resource_index.rank_resources(totals)
+
+        if filtered_rows == 0:
             return JsonResponse({
                 "url": search_url,
                 "total_resources": 0,
                 "resources": []
             })
 
-        resources = []
-        for name, data in grouped.items():
-            # CLAVE: Dividir entre event_count (cantidad real de eventos disparados)
-            # NO entre "count" (cantidad de filas de GA4)
-            if data["event_count"] > 0:
-                avg_duration = data["total_duration"] / data["event_count"]
-                avg_repeat = data["total_repeat"] / data["event_count"]
-                avg_size = data["total_size"] / data["event_count"]
-            else:
-                avg_duration = avg_repeat = avg_size = 0
-
-            resources.append({
-                "name": name,
-                "type": data["type"],
-                "duration_avg": round(avg_duration, 3),  # 3 decimales para valores como 0.324
-                "repeat_avg": round(avg_repeat, 2),
-                "size_avg": round(avg_size / 1024, 2) if avg_size > 0 else 0,  # Convertir a KB
-            })
+        # Percentiles de los promedios de duración por recurso (sketches diarios
+        # fusionados). Si respondió el índice no se consulta GA4: sin sketches
+        # locales se calculan en segundo plano y se omiten en esta respuesta.
+        percentiles = latency_sketches.resource_percentiles(
+            _get_ga4_client(), property_id, search_url, start_date, end_date, local_only=from_index
+        )
+        for r in resources:
+            for name, value in (percentiles or {}).get(r["name"], {}).items():
+                r[f"duration_{name}"] = value
 
-        # Ordenar por duración descendente
-        resources.sort(key=lambda x: x["duration_avg"], reverse=True)
         # 🔎 IMPRIMIR LAS FILAS CON avg_duration > 10
         print("\n=== RECURSOS CON avg_duration > 10s ===")
         for r in resources:
             if r["duration_avg"] > 10:
                 print(f"⚠️ {r['name']} | {r['type']} | avg_duration: {r['duration_avg']} sec | repeat_avg: {r['repeat_avg']}")
         print("=== FIN ===\n")
-        return JsonResponse({
+        payload = {
             "url": search_url,
-            "total_resources": len(resources),
-            "filtered_rows": filtered_count,
+            "total_resources": len(totals),
+            "filtered_rows": filtered_rows,
             "resources": resources,
-        })
+        }
+        if top:
+            payload["others"] = others
+        return JsonResponse(payload)
 
     except Exception as e:
         import traceback
@@ -1085,26 +898,21 @@ def ga4_resources_general(request):
         return JsonResponse({"error": str(e)}, status=500)
 
 
-
-
 # ============================================================
 # ENDPOINT 2: DATOS POR HORA
 # ============================================================
 
 
+@ga4_metrics.instrumented_view
 def ga4_resources_hourly(request):
     """
-    Versión con DEBUG: imprime todo lo necesario para entender la data recibida.
+    Retorna promedios de duración por hora para recursos específicos.
+    Parámetros: ?url=... &resources=name1,name2 &start=... &end=...
     """
     try:
         credentials_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
         property_id = os.getenv("GA4_PROPERTY_ID")
 
-        print("\n======= GA4 HOURLY DEBUG START =======")
-        print("URL PARAM:", request.GET.get("url"))
-        print("RESOURCES PARAM:", request.GET.get("resources"))
-        print("START/END:", request.GET.get("start"), request.GET.get("end"))
-
         if not credentials_path or not property_id:
             return JsonResponse({"error": "Credenciales o property ID no definidas"}, status=500)
 
@@ -1121,126 +929,17 @@ def ga4_resources_hourly(request):
         if not resource_names_raw:
             return JsonResponse({"error": "Lista de recursos vacía"}, status=400)
 
-        print("RESOURCES RAW:", resource_names_raw)
-
         start_date = request.GET.get("start")
         end_date = request.GET.get("end")
         start_date, end_date = _get_date_range(start_date, end_date)
 
-        normalized_search = _normalize_url(search_url.lower())
-        print("NORMALIZED SEARCH:", normalized_search)
-
-        # Normalización usada en resources_general
-        def normalize_resource_key(resource):
-            try:
-                parsed = urlparse(resource)
-                host = parsed.netloc
-                path = parsed.path
-                if host:
-                    return host + path
-                return resource
-            except:
-                return resource
-
-        requested_resources = {normalize_resource_key(r) for r in resource_names_raw}
-        print("REQUESTED NORMALIZED RESOURCES:", requested_resources)
-
-        client = BetaAnalyticsDataClient.from_service_account_file(credentials_path)
-
-        response = client.run_report(
-            RunReportRequest(
-                property=f"properties/{property_id}",
-                dimensions=[
-                    Dimension(name="eventName"),
-                    Dimension(name="customEvent:page_location_loadPage"),
-                    Dimension(name="customEvent:resource_name_loadPage"),
-                    Dimension(name="hour"),
-                ],
-                metrics=[
-                    Metric(name="eventCount"),
-                    Metric(name="customEvent:resource_total_duration_loadPage"),
-                ],
-                date_ranges=[DateRange(start_date=start_date, end_date=end_date)],
-                limit=5000,
-            )
-        )
-
-        hourly_data = {}
-
-        print("\n--- COMENZANDO LECTURA DE FILAS GA4 ---")
-
-        for row in response.rows:
-            try:
-                event_name = row.dimension_values[0].value
-                page_path = row.dimension_values[1].value
-                resource_name = row.dimension_values[2].value
-                hour = row.dimension_values[3].value
-
-                event_count = float(row.metric_values[0].value or 0)
-                resource_duration = float(row.metric_values[1].value or 0)
-            except:
-                print("❌ ERROR LEYENDO FILA")
-                continue
-
-            # === PRINT RAW ROW BEFORE FILTERING ===
-            print("\nROW RAW →", {
-                "event": event_name,
-                "page_path": page_path,
-                "resource_name": resource_name,
-                "hour": hour,
-                "event_count": event_count,
-                "resource_duration": resource_duration
-            })
-
-            if event_name != "resource_performance":
-                print("⛔ DESCARTADO: event != resource_performance")
-                continue
-
-            normalized_page = _normalize_url(page_path.lower())
-            print("NORMALIZED PAGE:", normalized_page)
-
-            if normalized_page != normalized_search:
-                print("⛔ DESCARTADO: página no coincide con búsqueda")
-                continue
-
-            # Parse recursos y página
-            try:
-                parsed_res = urlparse(resource_name)
-                res_host = parsed_res.netloc if parsed_res.netloc else resource_name
-            except:
-                res_host = resource_name
-
-            parsed_page = urlparse(page_path)
-            page_host = parsed_page.netloc
-
-            is_external = res_host and page_host not in res_host and res_host != page_host
-            key = res_host if is_external else resource_name
-
-            print("RESOURCE HOST:", res_host)
-            print("PAGE HOST:", page_host)
-            print("EXTERNAL?:", is_external)
-            print("KEY:", key)
-
-            if resource_name not in resource_names_raw:
-                print("⛔ DESCARTADO: recurso no coincide EXACTAMENTE")
-                continue
-            # Si pasó todos los filtros → Es válido
-            print("✔ ACEPTADO →", key)
-
-            # Agregar hora
-            if key not in hourly_data:
-                hourly_data[key] = {}
-
-            if event_count > 0:
-                hourly_data[key][hour] = round(resource_duration / event_count, 3)
-
-        print("\n======= GA4 HOURLY DEBUG END =======\n")
+        cube = resource_cube.get_cube(_get_ga4_client(), property_id, search_url, start_date, end_date)
 
         return JsonResponse({
             "url": search_url,
             "start_date": start_date,
             "end_date": end_date,
-            "resources": hourly_data
+            "resources": cube.hourly(set(resource_names_raw))
         })
 
     except Exception as e:
@@ -1252,6 +951,7 @@ def ga4_resources_hourly(request):
 # ENDPOINT 3: DATOS POR DÍA
 # ============================================================
 
+@ga4_metrics.instrumented_view
 def ga4_resources_daily(request):
     """
     Retorna promedios de duración por día para recursos específicos.
@@ -1283,76 +983,129 @@ def ga4_resources_daily(request):
         end_date = request.GET.get("end")
         start_date, end_date = _get_date_range(start_date, end_date)
 
-        normalized_search = _normalize_url(search_url.lower())
-
-        client = BetaAnalyticsDataClient.from_service_account_file(credentials_path)
+        cube = resource_cube.get_cube(_get_ga4_client(), property_id, search_url, start_date, end_date)
 
-        # Consulta GA4 por día
-        response = client.run_report(
-            RunReportRequest(
-                property=f"properties/{property_id}",
-                dimensions=[
-                    Dimension(name="eventName"),
-                    Dimension(name="customEvent:page_location_loadPage"),
-                    Dimension(name="customEvent:resource_name_loadPage"),
-                    Dimension(name="date"),
-                ],
-                metrics=[
-                    Metric(name="eventCount"),
-                    Metric(name="customEvent:resource_total_duration_loadPage"),
-                ],
-                date_ranges=[DateRange(start_date=start_date, end_date=end_date)],
-                limit=5000,
-            )
-        )
+        return JsonResponse({
+            "url": search_url,
+            "start_date": start_date,
+            "end_date": end_date,
+            "resources": cube.daily(set(resource_names))
+        })
 
-        # Procesar datos
-        daily_data = {}
+    except Exception as e:
+        import traceback
+        print(f"Error en GA4 Daily: {traceback.format_exc()}")
+        return JsonResponse({"error": str(e)}, status=500)
 
-        for row in response.rows:
-            try:
-                event_name = row.dimension_values[0].value
-                page_path = row.dimension_values[1].value
-                resource_name = row.dimension_values[2].value
-                date = row.dimension_values[3].value
-                
-                event_count = float(row.metric_values[0].value or 0)
-                resource_duration = float(row.metric_values[1].value or 0)
 
-            except (ValueError, IndexError):
-                continue
+# ============================================================
+# ENDPOINT 4: CUBO COMPLETO (GENERAL + HORA + DÍA)
+# ============================================================
 
-            if event_name != "resource_performance":
-                continue
+@ga4_metrics.instrumented_view
+def ga4_resources_cube(request):
+    """
+    Ranking general más perfiles por hora y por día de todos los recursos
+    de la página, derivados de la misma consulta.
+    Parámetros: ?url=... &start=YYYY-MM-DD &end=YYYY-MM-DD
+    """
+    try:
+        credentials_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+        property_id = os.getenv("GA4_PROPERTY_ID")
 
-            normalized_page = _normalize_url(page_path.lower())
-            if normalized_page != normalized_search:
-                continue
+        if not credentials_path or not property_id:
+            return JsonResponse({"error": "Credenciales o property ID no definidas"}, status=500)
 
-            key = _get_resource_key(resource_name, page_path, "")
-            
-            if key not in resource_names:
-                continue
+        search_url = request.GET.get("url")
+        if not search_url:
+            return JsonResponse({"error": "Parámetro 'url' requerido"}, status=400)
 
-            if key not in daily_data:
-                daily_data[key] = {}
+        start_date, end_date = _get_date_range(request.GET.get("start"), request.GET.get("end"))
 
-            if event_count > 0:
-                daily_data[key][date] = round(resource_duration / event_count, 3)
+        cube = resource_cube.get_cube(_get_ga4_client(), property_id, search_url, start_date, end_date)
+        resources = cube.general()
 
         return JsonResponse({
             "url": search_url,
             "start_date": start_date,
             "end_date": end_date,
-            "resources": daily_data
+            "total_resources": len(resources),
+            "filtered_rows": len(cube),
+            "resources": resources,
+            "hourly": cube.hourly(),
+            "daily": cube.daily(),
         })
 
     except Exception as e:
         import traceback
-        print(f"Error en GA4 Daily: {traceback.format_exc()}")
+        print(f"Error en GA4 Resource Cube: {traceback.format_exc()}")
         return JsonResponse({"error": str(e)}, status=500)
 
 
+# ============================================================
+# ENDPOINT: REGRESIONES DE RECURSOS (precalculadas, sin GA4)
+# ============================================================
+
+
+@ga4_metrics.instrumented_view
+def ga4_resource_regressions(request):
+    """
+    Recursos marcados por la detección diaria de regresiones (ver resource_regressions).
+    Parámetros: ?date=YYYY-MM-DD (por defecto la última detección) &url=... &metric=duration|size
+    """
+    try:
+        regressions = ResourceRegression.objects.all()
+
+        day = request.GET.get("date")
+        if day:
+            try:
+                day = datetime.strptime(day, "%Y-%m-%d").date()
+            except ValueError:
+                return JsonResponse({"error": "Parámetro 'date' debe tener formato YYYY-MM-DD"}, status=400)
+        else:
+            day = regressions.order_by("-date").values_list("date", flat=True).first()
+
+        metric = request.GET.get("metric")
+        if metric and metric not in resource_regressions.METRICS:
+            return JsonResponse({"error": f"Parámetro 'metric' debe ser uno de {list(resource_regressions.METRICS)}"}, status=400)
+
+        search_url = request.GET.get("url")
+
+        regressions = regressions.filter(date=day)
+        if metric:
+            regressions = regressions.filter(metric=metric)
+        if search_url:
+            regressions = regressions.filter(page=_normalize_url(search_url.lower()))
+
+        result = []
+        for r in regressions.order_by("-zscore"):
+            # Tamaños en KB, como en ga4_resources_general
+            scale = 1024 if r.metric == "size" else 1
+            result.append({
+                "page": r.page,
+                "name": r.resource,
+                "type": r.resource_type,
+                "metric": r.metric,
+                "value": round(r.value / scale, 3),
+                "baseline_mean": round(r.baseline_mean / scale, 3),
+                "baseline_std": round(r.baseline_std / scale, 3),
+                "baseline_days": r.baseline_days,
+                "change_pct": round((r.value / r.baseline_mean - 1) * 100, 2) if r.baseline_mean > 0 else None,
+                "zscore": round(r.zscore, 2),
+                "events": r.events,
+            })
+
+        return JsonResponse({
+            "date": day.isoformat() if day else None,
+            "total": len(result),
+            "regressions": result,
+        })
+
+    except Exception as e:
+        import traceback
+        print(f"Error en regresiones de recursos: {traceback.format_exc()}")
+        return JsonResponse({"error": str(e)}, status=500)
+
 
 
 
@@ -1370,6 +1123,7 @@ from datetime import datetime, timedelta
 from google.analytics.data_v1beta import BetaAnalyticsDataClient
 from google.analytics.data_v1beta.types import RunReportRequest, Dimension, Metric, DateRange
 
+@ga4_metrics.instrumented_view
 def ga4_click_relation(request):
     """
     Obtiene métricas de clicks y conversiones para el dashboard ClickRelation.
@@ -1386,47 +1140,9 @@ def ga4_click_relation(request):
         start_date = request.GET.get("start", "2025-10-15")
         end_date = request.GET.get("end", (datetime.today() - timedelta(days=1)).strftime("%Y-%m-%d"))
 
-        client = BetaAnalyticsDataClient.from_service_account_file(credentials_path)
-
-        # 1️⃣ Obtener sesiones y carritos por elemento (sin filtrar)
-        response = client.run_report(
-            RunReportRequest(
-                property=f"properties/{property_id}",
-                dimensions=[
-                    Dimension(name="customEvent:elemento_click_home"),
-                    Dimension(name="customEvent:img_click_home"),
-                ],
-                metrics=[Metric(name="sessions"), Metric(name="addToCarts")],
-                date_ranges=[DateRange(start_date=start_date, end_date=end_date)],
-                limit=10000,
-            )
-        )
-
-        grouped = {}
-        for row in response.rows:
-            elemento = row.dimension_values[0].value
-            img_click_home = row.dimension_values[1].value
-
-            if not elemento or elemento.lower() in ["(not set)", "none"]:
-                continue
-
-            sesiones = int(float(row.metric_values[0].value or 0))
-            carritos = int(float(row.metric_values[1].value or 0))
-
-            if elemento not in grouped:
-                grouped[elemento] = {
-                    "elemento": elemento,
-                    "img_click_home": img_click_home,
-                    "sesiones": 0,
-                    "carritos": 0,
-                    "compras": 0,
-                    "ingresos": 0.0,
-                }
-
-            grouped[elemento]["sesiones"] += sesiones
-            grouped[elemento]["carritos"] += carritos
+        client = _get_ga4_client()
 
-        # 2️⃣ Obtener compras e ingresos por elemento, aplicando filtro si hay unit
+        # 1️⃣ Filtro de compras por unidad de negocio, si hay unit
         filters = []
         if unit:
             unit_lower = unit.lower()
@@ -1446,38 +1162,76 @@ def ga4_click_relation(request):
                     "string_filter": {"value": "portabilidad postpago", "match_type": "EXACT"}
                 })
 
-        response_purchases = client.run_report(
+        # 2️⃣ Sesiones y carritos por elemento (sin filtrar), sobre todo el rango:
+        #    las sesiones no se pueden sumar entre días (una sesión que cruza
+        #    la medianoche o vuelve a clickear otro día contaría dos veces)
+        session_rows = iter_report_rows(
+            client,
             RunReportRequest(
                 property=f"properties/{property_id}",
-                dimensions=[Dimension(name="customEvent:elemento_click_home"), Dimension(name="transactionId")],
-                metrics=[Metric(name="purchaseRevenue")],
+                dimensions=[
+                    Dimension(name="customEvent:elemento_click_home"),
+                    Dimension(name="customEvent:img_click_home"),
+                ],
+                metrics=[Metric(name="sessions"), Metric(name="addToCarts")],
                 date_ranges=[DateRange(start_date=start_date, end_date=end_date)],
+            ),
+        )
+
+        # 3️⃣ Compras e ingresos ya agregados por elemento: son aditivos, así que
+        #    se sirven desde el almacén por día (solo se piden a GA4 los días nuevos)
+        purchase_rows = fact_store.fetch_rows(
+            client,
+            RunReportRequest(
+                property=f"properties/{property_id}",
+                dimensions=[Dimension(name="customEvent:elemento_click_home")],
+                metrics=[Metric(name="transactions"), Metric(name="purchaseRevenue")],
                 dimension_filter={"and_group": {"expressions": [{"filter": f} for f in filters]}} if filters else None,
-                limit=10000,
-            )
+            ),
+            start_date,
+            end_date,
         )
 
+        grouped = {}
+        for row in session_rows:
+            elemento = row.dimension_values[0].value
+            img_click_home = row.dimension_values[1].value
+
+            if not elemento or elemento.lower() in ["(not set)", "none"]:
+                continue
+
+            sesiones = int(float(row.metric_values[0].value or 0))
+            carritos = int(float(row.metric_values[1].value or 0))
+
+            stats = grouped.get(elemento)
+            if stats is None:
+                stats = grouped[elemento] = ClickStats(elemento, img_click_home)
+
+            stats.sesiones += sesiones
+            stats.carritos += carritos
+
         purchases_by_elemento = {}
-        for row in response_purchases.rows:
+        for row in purchase_rows:
             elemento = row.dimension_values[0].value
-            revenue = float(row.metric_values[0].value or 0)
             if not elemento or elemento.lower() == "(not set)":
                 continue
 
-            if elemento not in purchases_by_elemento:
-                purchases_by_elemento[elemento] = {"count": 0, "revenue": 0.0}
+            purchases = purchases_by_elemento.get(elemento)
+            if purchases is None:
+                purchases = purchases_by_elemento[elemento] = PurchaseStats()
 
-            purchases_by_elemento[elemento]["count"] += 1
-            purchases_by_elemento[elemento]["revenue"] += revenue
+            purchases.count += int(float(row.metric_values[0].value or 0))
+            purchases.revenue += float(row.metric_values[1].value or 0)
 
-        # 3️⃣ Asignar compras e ingresos a cada elemento
+        # 4️⃣ Asignar compras e ingresos a cada elemento
         for key, value in grouped.items():
-            if key in purchases_by_elemento:
-                value["compras"] = purchases_by_elemento[key]["count"]
-                value["ingresos"] = purchases_by_elemento[key]["revenue"]
+            purchases = purchases_by_elemento.get(key)
+            if purchases is not None:
+                value.compras = purchases.count
+                value.ingresos = purchases.revenue
 
-        data = list(grouped.values())
-        data.sort(key=lambda x: x["ingresos"], reverse=True)
+        data = sorted(grouped.values(), key=lambda x: x.ingresos, reverse=True)
+        data = [stats.as_dict() for stats in data]
         return JsonResponse({"data": data})
 
     except Exception as e:
@@ -1486,6 +1240,7 @@ def ga4_click_relation(request):
         return JsonResponse({"error": str(e)}, status=500)
 
 
+@ga4_metrics.instrumented_view
 @csrf_exempt
 def ga4_click_detail(request, elemento):
     """
@@ -1498,7 +1253,7 @@ def ga4_click_detail(request, elemento):
         if not credentials_path or not property_id:
             return JsonResponse({"error": "Credenciales no configuradas"}, status=500)
 
-        client = BetaAnalyticsDataClient.from_service_account_file(credentials_path)
+        client = _get_ga4_client()
         # --- 1️⃣ FECHAS INGRESADAS POR EL USUARIO ---
         start_date = request.GET.get("start_date")
         end_date = request.GET.get("end_date")
@@ -1540,71 +1295,74 @@ def ga4_click_detail(request, elemento):
         # ============================
         # REVENUE REAL POR DÍA
         # ============================
-        daily_rev_response = client.run_report(
-            RunReportRequest(
-                property=f"properties/{property_id}",
-                dimensions=[Dimension(name="date")],
-                metrics=[Metric(name="purchaseRevenue")],
-                date_ranges=[DateRange(start_date=start_date, end_date=end_date)],
-                dimension_filter={"and_group": {"expressions": [{"filter": f} for f in filters]}},
-                limit=1000,
-            )
+        daily_rev_request = RunReportRequest(
+            property=f"properties/{property_id}",
+            dimensions=[Dimension(name="date")],
+            metrics=[Metric(name="purchaseRevenue")],
+            date_ranges=[DateRange(start_date=start_date, end_date=end_date)],
+            dimension_filter={"and_group": {"expressions": [{"filter": f} for f in filters]}},
+            limit=1000,
         )
 
-        # Diccionario: {'20250101': 12345.67}
-        real_revenue_by_day = {
-            row.dimension_values[0].value: float(row.metric_values[0].value or 0)
-            for row in daily_rev_response.rows
-        }
-
-
-        response = client.run_report(
-            RunReportRequest(
-                property=f"properties/{property_id}",
-                dimensions=[
-                    Dimension(name="transactionId"),
-                    Dimension(name="customEvent:elemento_click_home"),
-                    Dimension(name="customEvent:items_purchased"),
-                    Dimension(name="customEvent:session_id_final"),
-                    Dimension(name="date"),
-                ],
-                metrics=[Metric(name="purchaseRevenue")],
-                date_ranges=[DateRange(start_date=start_date, end_date=end_date)],
-                dimension_filter={"and_group": {"expressions": [{"filter": f} for f in filters]}} if filters else None,
-                limit=1000,
-            )
+        detail_request = RunReportRequest(
+            property=f"properties/{property_id}",
+            dimensions=[
+                Dimension(name="transactionId"),
+                Dimension(name="customEvent:elemento_click_home"),
+                Dimension(name="customEvent:items_purchased"),
+                Dimension(name="customEvent:session_id_final"),
+                Dimension(name="date"),
+            ],
+            metrics=[Metric(name="purchaseRevenue")],
+            date_ranges=[DateRange(start_date=start_date, end_date=end_date)],
+            dimension_filter={"and_group": {"expressions": [{"filter": f} for f in filters]}} if filters else None,
+            limit=1000,
         )
 
         # ============================
         # CONSULTA ÚNICA DE PURCHASES → SUPER RÁPIDO
         # ============================
 
-        purchase_response = client.run_report(
-            RunReportRequest(
-                property=f"properties/{property_id}",
-                dimensions=[
-                    Dimension(name="transactionId"),
-                    Dimension(name="date"),
-                    Dimension(name="eventName"),
-                ],
-                metrics=[Metric(name="purchaseRevenue")],
-                date_ranges=[DateRange(start_date=start_date, end_date=end_date)],
-                dimension_filter={
-                    "and_group": {
-                        "expressions": [
-                            {
-                                "filter": {
-                                    "field_name": "eventName",
-                                    "string_filter": {"value": "purchase", "match_type": "EXACT"}
-                                }
+        purchase_request = RunReportRequest(
+            property=f"properties/{property_id}",
+            dimensions=[
+                Dimension(name="transactionId"),
+                Dimension(name="date"),
+                Dimension(name="eventName"),
+            ],
+            metrics=[Metric(name="purchaseRevenue")],
+            date_ranges=[DateRange(start_date=start_date, end_date=end_date)],
+            dimension_filter={
+                "and_group": {
+                    "expressions": [
+                        {
+                            "filter": {
+                                "field_name": "eventName",
+                                "string_filter": {"value": "purchase", "match_type": "EXACT"}
                             }
-                        ]
-                    }
-                },
-                limit=10000,
-            )
+                        }
+                    ]
+                }
+            },
+            limit=10000,
         )
 
+        # Las tres consultas son independientes → se lanzan en paralelo
+        responses = run_parallel({
+            "daily_rev": lambda timeout: client.run_report(daily_rev_request, timeout=timeout),
+            "detail": lambda timeout: client.run_report(detail_request, timeout=timeout),
+            "purchases": lambda timeout: client.run_report(purchase_request, timeout=timeout),
+        })
+        daily_rev_response = responses["daily_rev"]
+        response = responses["detail"]
+        purchase_response = responses["purchases"]
+
+        # Diccionario: {'20250101': 12345.67}
+        real_revenue_by_day = {
+            row.dimension_values[0].value: float(row.metric_values[0].value or 0)
+            for row in daily_rev_response.rows
+        }
+
         # Diccionario rápido: { (transactionId, fecha) : revenue }
         purchase_map = {}
         for r in purchase_response.rows:
@@ -1639,46 +1397,171 @@ def ga4_click_detail(request, elemento):
                 "valor": valor_real,
             })
 
-        # --- 2️⃣ Traer todos los session_id que tengan flujo de clicks ---
-        session_ids = list({row["session_id_final"] for row in modal_data if row["session_id_final"]})
-        sessions_with_flow = set()
-        if session_ids:
-            flow_response = client.run_report(
-                RunReportRequest(
-                    property=f"properties/{property_id}",
-                    dimensions=[
-                        Dimension(name="customEvent:session_id_final"),
-                    ],
-                    metrics=[],
-                    date_ranges=[DateRange(start_date=start_date, end_date=end_date)],
-                    dimension_filter={
-                        "and_group": {
-                            "expressions": [
-                                {
-                                    "filter": {
-                                        "field_name": "eventName",
-                                        "string_filter": {"value": "user_click_event", "match_type": "EXACT"}
-                                    }
-                                },
-                                {
-                                    "filter": {
-                                        "field_name": "customEvent:session_id_final",
-                                        "in_list_filter": {"values": session_ids}
-                                    }
-                                }
-                            ]
-                        }
-                    },
-                    limit=1000,
-                )
-            )
-            sessions_with_flow = {row.dimension_values[0].value for row in flow_response.rows}
+        # Días de cada sesión para acotar luego la consulta de su flujo de clicks
+        session_locator.record((row["session_id_final"], row["fecha"]) for row in modal_data)
+
+        # --- 2️⃣ Sesiones con flujo de clicks (bloques en paralelo, caché por día) ---
+        sessions_with_flow = session_flows.sessions_with_flow(
+            client,
+            property_id,
+            {row["session_id_final"] for row in modal_data},
+            start_date,
+            end_date,
+        )
 
         # --- 3️⃣ Marcar has_click_flow ---
         for row in modal_data:
             row["has_click_flow"] = row["session_id_final"] in sessions_with_flow
 
-        return JsonResponse({"data": modal_data})
+        return JsonResponse({"data": modal_data})
+
+    except Exception as e:
+        import traceback
+        print(traceback.format_exc())
+        return JsonResponse({"error": str(e)}, status=500)
+
+
+
+CLICK_FLOW_START = "2025-10-15"
+
+# Máximo de sesiones por llamada al flujo de clicks en lote
+CLICK_FLOW_BATCH_MAX = 1000
+
+
+def _click_flow_range():
+    """Rango amplio del flujo de clicks: desde el inicio del tracking hasta ayer."""
+    return CLICK_FLOW_START, (datetime.today() - timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+def _click_flow_request(property_id, session_id=None):
+    """Eventos de flujo de clicks; la primera dimensión es session_id_final."""
+    # --- 🔥 AHORA PEDIMOS eventName para capturar los scroll ---
+    return RunReportRequest(
+        property=f"properties/{property_id}",
+        dimensions=[
+            Dimension(name="customEvent:session_id_final"),
+            Dimension(name="eventName"),              # 👈 scroll-20, scroll-40, etc
+            Dimension(name="customEvent:user_click"), # sigue igual
+            Dimension(name="pageLocation"),
+            Dimension(name="dateHourMinute"),
+        ],
+        metrics=[],
+        dimension_filter={
+            "filter": {
+                "field_name": "customEvent:session_id_final",
+                "string_filter": {"value": session_id, "match_type": "EXACT"}
+            }
+        } if session_id else None,
+    )
+
+
+def _build_click_flow(flow_rows):
+    """
+    Filas de eventos de una sesión -> timeline de clicks y pageviews ordenada
+    por timestamp, con los scrolls de cada URL en sus pageviews.
+    """
+    scroll_prefix = "scroll-"
+    rows = []
+    url_scrolls = {}  # Agrupar scrolls por URL
+
+    for row in flow_rows:
+        sess = row.dimension_values[0].value
+        event_name = row.dimension_values[1].value
+        user_click = row.dimension_values[2].value
+        page_url = row.dimension_values[3].value
+        timestamp = row.dimension_values[4].value
+
+        # --- 🔥 Scroll event real (NO VIENE EN user_click) ---
+        if event_name.startswith(scroll_prefix):
+            perc = event_name.replace("scroll-", "")
+            url_scrolls.setdefault(page_url, []).append(f"{perc}%")
+
+        rows.append({
+            "session_id": sess,
+            "event_name": event_name,
+            "user_click": user_click,
+            "page_url": page_url,
+            "timestamp": timestamp
+        })
+
+    # ------------------------------
+    # Construir la salida final
+    # ------------------------------
+    result = []
+
+    for item in rows:
+
+        # CLICK MANUAL NORMAL
+        if item["user_click"] not in [None, "", "(not set)"]:
+            result.append({
+                "session_id": item["session_id"],
+                "type": "click",
+                "detail": item["user_click"],
+                "timestamp": item["timestamp"],
+                "scrolls": []
+            })
+
+        # PAGEVIEW (aquí se insertan scrolls asociados a esa URL)
+        if item["page_url"] not in [None, "", "(not set)"]:
+            result.append({
+                "session_id": item["session_id"],
+                "type": "pageview",
+                "detail": item["page_url"],
+                "timestamp": item["timestamp"],
+                "scrolls": url_scrolls.get(item["page_url"], [])
+            })
+
+    # Ordenar por timestamp ascendente
+    result.sort(key=lambda x: x["timestamp"])
+    return result
+
+
+@ga4_metrics.instrumented_view
+@csrf_exempt
+def ga4_click_flow(request):
+    """
+    Retorna flujo de un usuario por session_id, incluyendo:
+    - pageviews
+    - clicks
+    - scroll events (scroll-20, scroll-40, scroll-60, etc)
+    y los une por URL dentro del mismo flujo.
+    """
+    try:
+        credentials_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+        property_id = os.getenv("GA4_PROPERTY_ID")
+        if not credentials_path or not property_id:
+            return JsonResponse({"error": "Credenciales no configuradas"}, status=500)
+
+        session_id = request.GET.get("session_id")
+        if not session_id:
+            return JsonResponse({"error": "Se requiere session_id"}, status=400)
+
+        client = _get_ga4_client()
+
+        start_date, end_date = _click_flow_range()
+        flow_request = _click_flow_request(property_id, session_id)
+
+        # Servido desde el almacén por día: solo se piden a GA4 los días nuevos.
+        # Si la sesión está indexada se consultan solo sus días; si no (o no hay
+        # eventos en ellos) se usa el rango amplio y se indexa lo encontrado.
+        flow_rows = []
+        narrowed = session_locator.narrow_range(session_id, start_date, end_date)
+        if narrowed:
+            flow_rows = fact_store.fetch_rows(client, flow_request, *narrowed)
+        if not flow_rows:
+            flow_rows = fact_store.fetch_rows(client, flow_request, start_date, end_date)
+            session_locator.record((session_id, row.dimension_values[4].value) for row in flow_rows)
+
+        print("RAW ROWS:")
+        for row in flow_rows:
+            print("EVENT:", row.dimension_values[1].value, "CLICK:", row.dimension_values[2].value,
+                  "URL:", row.dimension_values[3].value)
+
+        result = _build_click_flow(flow_rows)
+
+        print("FINAL DATA:", result)
+
+        return JsonResponse({"data": result})
 
     except Exception as e:
         import traceback
@@ -1686,15 +1569,17 @@ def ga4_click_detail(request, elemento):
         return JsonResponse({"error": str(e)}, status=500)
 
 
-
+@ga4_metrics.instrumented_view
 @csrf_exempt
-def ga4_click_flow(request):
+def ga4_click_flows(request):
     """
-    Retorna flujo de un usuario por session_id, incluyendo:
-    - pageviews
-    - clicks
-    - scroll events (scroll-20, scroll-40, scroll-60, etc)
-    y los une por URL dentro del mismo flujo.
+    Flujo de clicks de varias sesiones a la vez (modal de detalle de clicks).
+    Parámetros: ?session_ids=id1,id2,... (o POST JSON {"session_ids": [...]})
+    Retorna {"data": {session_id: timeline}} con el mismo formato que user_click_flow.
+
+    Las sesiones se consultan en bloques con in_list_filter: las indexadas en
+    SessionLocator agrupadas por sus propios días (cada grupo sobre su
+    tramo), el resto (y las que no tengan eventos ahí) sobre el rango amplio.
     """
     try:
         credentials_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
@@ -1702,98 +1587,128 @@ def ga4_click_flow(request):
         if not credentials_path or not property_id:
             return JsonResponse({"error": "Credenciales no configuradas"}, status=500)
 
-        session_id = request.GET.get("session_id")
-        if not session_id:
-            return JsonResponse({"error": "Se requiere session_id"}, status=400)
-
-        client = BetaAnalyticsDataClient.from_service_account_file(credentials_path)
-
-        start_date = "2025-10-15"
-        end_date = (datetime.today() - timedelta(days=1)).strftime("%Y-%m-%d")
+        if request.method == "POST":
+            try:
+                body = json.loads(request.body or "{}")
+            except ValueError:
+                return JsonResponse({"error": "El cuerpo debe ser JSON válido"}, status=400)
+            if not isinstance(body, dict):
+                return JsonResponse({"error": "El cuerpo debe ser un objeto JSON"}, status=400)
+            session_ids = body.get("session_ids") or []
+            if not isinstance(session_ids, list) or not all(isinstance(s, str) for s in session_ids):
+                return JsonResponse({"error": "session_ids debe ser una lista de strings"}, status=400)
+        else:
+            session_ids = (request.GET.get("session_ids") or "").split(",")
+        if len(session_ids) > CLICK_FLOW_BATCH_MAX:
+            return JsonResponse({"error": f"Máximo {CLICK_FLOW_BATCH_MAX} sesiones por consulta"}, status=400)
+        session_ids = list(dict.fromkeys(s.strip() for s in session_ids if s and s.strip()))
+
+        if not session_ids:
+            return JsonResponse({"error": "Se requiere session_ids"}, status=400)
 
-        # --- 🔥 AHORA PEDIMOS eventName para capturar los scroll ---
-        response = client.run_report(
-            RunReportRequest(
-                property=f"properties/{property_id}",
-                dimensions=[
-                    Dimension(name="customEvent:session_id_final"),
-                    Dimension(name="eventName"),              # 👈 scroll-20, scroll-40, etc
-                    Dimension(name="customEvent:user_click"), # sigue igual
-                    Dimension(name="pageLocation"),
-                    Dimension(name="dateHourMinute"),
-                ],
-                metrics=[],
-                date_ranges=[DateRange(start_date=start_date, end_date=end_date)],
-                dimension_filter={
-                    "filter": {
-                        "field_name": "customEvent:session_id_final",
-                        "string_filter": {"value": session_id, "match_type": "EXACT"}
-                    }
-                },
-                limit=2000,
+        client = _get_ga4_client()
+        start_date, end_date = _click_flow_range()
+        flow_request = _click_flow_request(property_id)
+
+        # 1. Sesiones indexadas: grupos de sesiones cercanas, cada uno sobre sus días
+        narrowed = session_locator.narrow_ranges(session_ids, start_date, end_date)
+
+        flow_rows = {}
+        if narrowed:
+            flow_rows = session_flows.fetch_by_ranges(client, flow_request, narrowed)
+
+        # 2. Resto: rango amplio, indexando lo encontrado
+        wide = [s for s in session_ids if s not in flow_rows]
+        if wide:
+            wide_rows = session_flows.fetch_by_session(client, flow_request, wide, start_date, end_date)
+            session_locator.record(
+                (session_id, row.dimension_values[4].value)
+                for session_id, rows in wide_rows.items()
+                for row in rows
             )
-        )
+            flow_rows.update(wide_rows)
 
-        scroll_prefix = "scroll-"
-        rows = []
-        url_scrolls = {}  # Agrupar scrolls por URL
+        return JsonResponse({
+            "data": {
+                session_id: _build_click_flow(flow_rows.get(session_id, []))
+                for session_id in session_ids
+            }
+        })
 
-        print("RAW ROWS:")
-        for row in response.rows:
-            sess = row.dimension_values[0].value
-            event_name = row.dimension_values[1].value
-            user_click = row.dimension_values[2].value
-            page_url = row.dimension_values[3].value
-            timestamp = row.dimension_values[4].value
-
-            print("EVENT:", event_name, "CLICK:", user_click, "URL:", page_url)
-
-            # --- 🔥 Scroll event real (NO VIENE EN user_click) ---
-            if event_name.startswith(scroll_prefix):
-                perc = event_name.replace("scroll-", "")
-                url_scrolls.setdefault(page_url, []).append(f"{perc}%")
-
-            rows.append({
-                "session_id": sess,
-                "event_name": event_name,
-                "user_click": user_click,
-                "page_url": page_url,
-                "timestamp": timestamp
-            })
+    except Exception as e:
+        import traceback
+        print(traceback.format_exc())
+        return JsonResponse({"error": str(e)}, status=500)
 
-        # ------------------------------
-        # Construir la salida final
-        # ------------------------------
-        result = []
 
-        for item in rows:
 
-            # CLICK MANUAL NORMAL
-            if item["user_click"] not in [None, "", "(not set)"]:
-                result.append({
-                    "session_id": item["session_id"],
-                    "type": "click",
-                    "detail": item["user_click"],
-                    "timestamp": item["timestamp"],
-                    "scrolls": []
-                })
+@ga4_metrics.instrumented_view
+def ga4_click_paths(request):
+    """
+    Caminos de navegación (clicks y páginas) agregados de todas las sesiones.
+    Parámetros: ?start=YYYY-MM-DD &end=YYYY-MM-DD (por defecto los últimos 7 días
+    cerrados) &depth=1..10 &min_count=N (poda de ramas poco frecuentes)
+
+    Se calcula en segundo plano: mientras no hay resultado responde 202
+    {"status": "pending"}; reintentar en unos segundos. Si el cálculo falló
+    responde 502 {"status": "failed", "error": ...} (se reintenta pasado
+    click_paths.FAILURE_TTL).
+    """
+    try:
+        credentials_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+        property_id = os.getenv("GA4_PROPERTY_ID")
+        if not credentials_path or not property_id:
+            return JsonResponse({"error": "Credenciales no configuradas"}, status=500)
 
-            # PAGEVIEW (aquí se insertan scrolls asociados a esa URL)
-            if item["page_url"] not in [None, "", "(not set)"]:
-                result.append({
-                    "session_id": item["session_id"],
-                    "type": "pageview",
-                    "detail": item["page_url"],
-                    "timestamp": item["timestamp"],
-                    "scrolls": url_scrolls.get(item["page_url"], [])
-                })
+        yesterday = datetime.today() - timedelta(days=1)
+        start_date = request.GET.get("start") or (yesterday - timedelta(days=6)).strftime("%Y-%m-%d")
+        end_date = request.GET.get("end") or yesterday.strftime("%Y-%m-%d")
 
-        # Ordenar por timestamp ascendente
-        result.sort(key=lambda x: x["timestamp"])
+        try:
+            depth = int(request.GET.get("depth", click_paths.DEFAULT_DEPTH))
+            min_count = int(request.GET.get("min_count", click_paths.DEFAULT_MIN_COUNT))
+            datetime.strptime(start_date, "%Y-%m-%d")
+            datetime.strptime(end_date, "%Y-%m-%d")
+        except ValueError:
+            return JsonResponse({"error": "Parámetros inválidos: start/end YYYY-MM-DD, depth y min_count enteros"}, status=400)
 
-        print("FINAL DATA:", result)
+        if not 1 <= depth <= click_paths.MAX_DEPTH:
+            return JsonResponse({"error": f"Parámetro 'depth' debe estar entre 1 y {click_paths.MAX_DEPTH}"}, status=400)
+        min_count = max(min_count, click_paths.MIN_COUNT_FLOOR)
 
-        return JsonResponse({"data": result})
+        paths, stale, error = click_paths.get_paths(property_id, start_date, end_date, depth)
+        if paths is None and error:
+            return JsonResponse({
+                "status": "failed",
+                "error": error,
+                "start_date": start_date,
+                "end_date": end_date,
+                "depth": depth,
+            }, status=502)
+        if paths is None:
+            return JsonResponse({
+                "status": "pending",
+                "start_date": start_date,
+                "end_date": end_date,
+                "depth": depth,
+            }, status=202)
+
+        payload = {
+            "status": "ready",
+            "stale": stale,
+            "start_date": paths.start_date,
+            "end_date": paths.end_date,
+            "computed_at": datetime.fromtimestamp(paths.computed_at).isoformat(timespec="seconds"),
+            "depth": depth,
+            "min_count": min_count,
+            "sessions": paths.root.count,
+            "trie": click_paths.to_trie(paths, min_count),
+            "sankey": click_paths.to_sankey(paths, min_count),
+        }
+        if error:
+            # Resultado anterior servido mientras falla el recálculo
+            payload["refresh_error"] = error
+        return JsonResponse(payload)
 
     except Exception as e:
         import traceback
@@ -1801,7 +1716,7 @@ def ga4_click_flow(request):
         return JsonResponse({"error": str(e)}, status=500)
 
 
-
+@ga4_metrics.instrumented_view
 @csrf_exempt
 def ga4_genia_summary(request):
     """
@@ -1817,7 +1732,7 @@ def ga4_genia_summary(request):
         if not credentials_path or not property_id:
             return JsonResponse({"error": "Credenciales no configuradas"}, status=500)
 
-        client = BetaAnalyticsDataClient.from_service_account_file(credentials_path)
+        client = _get_ga4_client()
 
         # ============================
         # FECHAS
@@ -1854,9 +1769,6 @@ def ga4_genia_summary(request):
 
         genia_response = client.run_report(genia_request)
 
-        clicks = 0
-        sesiones = set()
-
         print("========== RAW GA4 ROWS (first 5) ==========")
         for i, row in enumerate(genia_response.rows[:5]):
             print(
@@ -1865,14 +1777,13 @@ def ga4_genia_summary(request):
                 [m.value for m in row.metric_values]
             )
 
-        for row in genia_response.rows:
-            session_id = row.dimension_values[1].value
-            count = int(row.metric_values[0].value or 0)
-
-            clicks += count
-
-            if session_id and session_id != "(not set)":
-                sesiones.add(session_id)
+        genia_columns = decode_response(genia_response)
+        clicks = int(genia_columns.metric("eventCount").sum())
+        sesiones = {
+            session_id
+            for session_id in genia_columns.levels("customEvent:session_id_final")
+            if session_id and session_id != "(not set)"
+        }
 
         # ============================
         # 2️⃣ PURCHASES (consulta única)
@@ -1896,13 +1807,11 @@ def ga4_genia_summary(request):
 
         purchase_response = client.run_report(purchase_request)
 
-        purchase_map = {}
-        for row in purchase_response.rows:
-            sid = row.dimension_values[0].value
-            revenue = float(row.metric_values[0].value or 0)
-
-            if sid and sid != "(not set)":
-                purchase_map[sid] = purchase_map.get(sid, 0) + revenue
+        purchase_map = decode_response(purchase_response).sum_by(
+            "customEvent:session_id_final", "purchaseRevenue"
+        )
+        purchase_map.pop("", None)
+        purchase_map.pop("(not set)", None)
 
         # ============================
         # 3️⃣ VENTAS + INGRESOS
@@ -1936,6 +1845,7 @@ def ga4_genia_summary(request):
 
 
 
+@ga4_metrics.instrumented_view
 @csrf_exempt
 def ga4_genia_ingresos_por_dia(request):
     """
@@ -1948,7 +1858,7 @@ def ga4_genia_ingresos_por_dia(request):
         if not credentials_path or not property_id:
             return JsonResponse({"error": "Credenciales no configuradas"}, status=500)
 
-        client = BetaAnalyticsDataClient.from_service_account_file(credentials_path)
+        client = _get_ga4_client()
 
         # -------------------
         # Fechas
@@ -1960,90 +1870,72 @@ def ga4_genia_ingresos_por_dia(request):
         # 1️⃣ Extraer session_ids de Genia
         # -------------------
         genia_sessions = {}
-        offset = 0
-        limit = 100000
-        while True:
-            genia_request = RunReportRequest(
-                property=f"properties/{property_id}",
-                dimensions=[Dimension(name="eventName"), Dimension(name="customEvent:session_id_final")],
-                metrics=[Metric(name="eventCount")],
-                date_ranges=[DateRange(start_date=start_date, end_date=end_date)],
-                dimension_filter=FilterExpression(
-                    filter=Filter(
-                        field_name="eventName",
-                        string_filter={"value": "Genia", "match_type": Filter.StringFilter.MatchType.EXACT}
-                    )
-                ),
-                limit=limit,
-                offset=offset
-            )
-            response = client.run_report(genia_request)
-            if not response.rows:
-                break
-
-            for row in response.rows:
-                sid = row.dimension_values[1].value
-                if sid and sid != "(not set)":
-                    genia_sessions[sid] = True
+        genia_request = RunReportRequest(
+            property=f"properties/{property_id}",
+            dimensions=[Dimension(name="eventName"), Dimension(name="customEvent:session_id_final")],
+            metrics=[Metric(name="eventCount")],
+            date_ranges=[DateRange(start_date=start_date, end_date=end_date)],
+            dimension_filter=FilterExpression(
+                filter=Filter(
+                    field_name="eventName",
+                    string_filter={"value": "Genia", "match_type": Filter.StringFilter.MatchType.EXACT}
+                )
+            ),
+        )
 
-            if len(response.rows) < limit:
-                break
-            offset += limit
+        for row in iter_report_rows(client, genia_request):
+            sid = row.dimension_values[1].value
+            if sid and sid != "(not set)":
+                genia_sessions[sid] = True
 
         # -------------------
         # 2️⃣ Extraer purchases de Genia
         # -------------------
         ingresos_por_dia = defaultdict(lambda: {"ingresos": 0, "detalle_ventas": []})
-        offset = 0
-        while True:
-            purchase_request = RunReportRequest(
-                property=f"properties/{property_id}",
-                dimensions=[
-                    Dimension(name="customEvent:session_id_final"),
-                    Dimension(name="date"),
-                    Dimension(name="transactionId"),
-                    Dimension(name="customEvent:items_purchased")  # si GA4 tiene productos comprados
-                ],
-                metrics=[Metric(name="purchaseRevenue")],
-                date_ranges=[DateRange(start_date=start_date, end_date=end_date)],
-                dimension_filter=FilterExpression(
-                    filter=Filter(
-                        field_name="eventName",
-                        string_filter={"value": "purchase", "match_type": Filter.StringFilter.MatchType.EXACT}
-                    )
-                ),
-                limit=limit,
-                offset=offset
-            )
-            purchase_response = client.run_report(purchase_request)
-            if not purchase_response.rows:
-                break
+        purchase_request = RunReportRequest(
+            property=f"properties/{property_id}",
+            dimensions=[
+                Dimension(name="customEvent:session_id_final"),
+                Dimension(name="date"),
+                Dimension(name="transactionId"),
+                Dimension(name="customEvent:items_purchased")  # si GA4 tiene productos comprados
+            ],
+            metrics=[Metric(name="purchaseRevenue")],
+            date_ranges=[DateRange(start_date=start_date, end_date=end_date)],
+            dimension_filter=FilterExpression(
+                filter=Filter(
+                    field_name="eventName",
+                    string_filter={"value": "purchase", "match_type": Filter.StringFilter.MatchType.EXACT}
+                )
+            ),
+        )
 
-            for row in purchase_response.rows:
-                sid = row.dimension_values[0].value
-                date_raw = row.dimension_values[1].value
-                trx_id = row.dimension_values[2].value if len(row.dimension_values) > 2 else "N/A"
-                items_raw = row.dimension_values[3].value if len(row.dimension_values) > 3 else "(sin_producto)"
-                revenue = float(row.metric_values[0].value or 0)
-
-                # Solo sumar si la session_id pertenece a Genia
-                if sid in genia_sessions:
-                    try:
-                        date_fmt = datetime.strptime(date_raw, "%Y%m%d").strftime("%Y-%m-%d")
-                    except:
-                        date_fmt = date_raw
-
-                    ingresos_por_dia[date_fmt]["ingresos"] += revenue
-                    ingresos_por_dia[date_fmt]["detalle_ventas"].append({
-                        "session_id": sid,
-                        "transaction_id": trx_id,
-                        "producto": items_raw.split(",")[0].strip() if items_raw else "(sin_producto)",
-                        "valor": round(revenue, 2)
-                    })
-
-            if len(purchase_response.rows) < limit:
-                break
-            offset += limit
+        located = []
+        for row in iter_report_rows(client, purchase_request):
+            sid = row.dimension_values[0].value
+            date_raw = row.dimension_values[1].value
+            trx_id = row.dimension_values[2].value if len(row.dimension_values) > 2 else "N/A"
+            items_raw = row.dimension_values[3].value if len(row.dimension_values) > 3 else "(sin_producto)"
+            revenue = float(row.metric_values[0].value or 0)
+
+            # Solo sumar si la session_id pertenece a Genia
+            if sid in genia_sessions:
+                located.append((sid, date_raw))
+                try:
+                    date_fmt = datetime.strptime(date_raw, "%Y%m%d").strftime("%Y-%m-%d")
+                except:
+                    date_fmt = date_raw
+
+                ingresos_por_dia[date_fmt]["ingresos"] += revenue
+                ingresos_por_dia[date_fmt]["detalle_ventas"].append({
+                    "session_id": sid,
+                    "transaction_id": trx_id,
+                    "producto": items_raw.split(",")[0].strip() if items_raw else "(sin_producto)",
+                    "valor": round(revenue, 2)
+                })
+
+        # Días de cada sesión para acotar luego la consulta de su flujo de clicks
+        session_locator.record(located)
 
         # -------------------
         # Formatear resultado final
@@ -2082,6 +1974,7 @@ def element_select(request):
 
 
 
+@ga4_metrics.instrumented_view
 @csrf_exempt
 def ga4_migracion_view_item_list(request):
 
@@ -2117,7 +2010,7 @@ def ga4_migracion_view_item_list(request):
                 status=500
             )
 
-        client = BetaAnalyticsDataClient.from_service_account_file(credentials_path)
+        client = _get_ga4_client()
 
         # -------------------
         # Fechas (querystring)
@@ -2151,86 +2044,76 @@ def ga4_migracion_view_item_list(request):
         })
 
         # -------------------
-        # Query GA4 por evento
+        # Query GA4 única: eventName como dimensión + filtro in-list
+        # (una sola ida y vuelta para todos los pasos del embudo)
         # -------------------
-        for event_name, label in FUNNEL_EVENTS.items():
-            offset = 0
-            limit = 100000
-
-            while True:
-                ga_request = RunReportRequest(
-                    property=f"properties/{property_id}",
-                    dimensions=[
-                        Dimension(name="date"),
-                        Dimension(name="customEvent:business_unit2"),
-                    ],
-                    metrics=[
-                        Metric(name="sessions"),
-                    ],
-                    date_ranges=[
-                        DateRange(start_date=start_date, end_date=end_date)
-                    ],
-                    
-                    dimension_filter = FilterExpression(
-                        and_group=FilterExpressionList(
-                            expressions=[
-                                FilterExpression(
-                                    filter=Filter(
-                                        field_name="hostName",
-                                        string_filter={"value": "tienda.claro.com.co"},
-                                    )
-                                ),
-                                FilterExpression(
-                                    filter=Filter(
-                                        field_name="customEvent:business_unit2",
-                                        string_filter={"value": "migracion"},
-                                    )
-                                ),
-                                # 👇 SOLO sesiones
-                                FilterExpression(
-                                    filter=Filter(
-                                        field_name="eventName",
-                                        string_filter={
-                                            "value": event_name,
-                                            "match_type": Filter.StringFilter.MatchType.EXACT,
-                                        },
-                                    )
-                                ),
-                            ]
-                        )
-                    ),
-                    
-                    limit=limit,
-                    offset=offset,
-                )
-
-                response = client.run_report(ga_request)
 
-                if not response.rows:
-                    break
+        ga_request = RunReportRequest(
+            property=f"properties/{property_id}",
+            dimensions=[
+                Dimension(name="date"),
+                Dimension(name="customEvent:business_unit2"),
+                Dimension(name="eventName"),
+            ],
+            metrics=[
+                Metric(name="sessions"),
+            ],
+            date_ranges=[
+                DateRange(start_date=start_date, end_date=end_date)
+            ],
 
-                for row in response.rows:
-                    date_raw = row.dimension_values[0].value
-                    business_unit2 = row.dimension_values[1].value
-                    count = int(row.metric_values[0].value or 0)
+            dimension_filter = FilterExpression(
+                and_group=FilterExpressionList(
+                    expressions=[
+                        FilterExpression(
+                            filter=Filter(
+                                field_name="hostName",
+                                string_filter={"value": "tienda.claro.com.co"},
+                            )
+                        ),
+                        FilterExpression(
+                            filter=Filter(
+                                field_name="customEvent:business_unit2",
+                                string_filter={"value": "migracion"},
+                            )
+                        ),
+                        # 👇 SOLO sesiones de los eventos del embudo
+                        FilterExpression(
+                            filter=Filter(
+                                field_name="eventName",
+                                in_list_filter=Filter.InListFilter(
+                                    values=list(FUNNEL_EVENTS.keys()),
+                                    case_sensitive=True,
+                                ),
+                            )
+                        ),
+                    ]
+                )
+            ),
+        )
 
-                    # 🔎 Filtro clave del embudo
-                    if business_unit2 != "migracion":
-                        continue
+        for row in iter_report_rows(client, ga_request):
+            date_raw = row.dimension_values[0].value
+            business_unit2 = row.dimension_values[1].value
+            event_name = row.dimension_values[2].value
+            count = int(row.metric_values[0].value or 0)
 
-                    try:
-                        date_fmt = datetime.strptime(
-                            date_raw, "%Y%m%d"
-                        ).strftime("%Y-%m-%d")
-                    except Exception:
-                        date_fmt = date_raw
+            # 🔎 Filtro clave del embudo
+            if business_unit2 != "migracion":
+                continue
 
-                    resultados_por_dia[date_fmt][label] += count
+            label = FUNNEL_EVENTS.get(event_name)
+            if label is None:
+                continue
 
-                if len(response.rows) < limit:
-                    break
+            try:
+                date_fmt = datetime.strptime(
+                    date_raw, "%Y%m%d"
+                ).strftime("%Y-%m-%d")
+            except Exception:
+                date_fmt = date_raw
 
-                offset += limit
+            resultados_por_dia[date_fmt][label] += count
 
         # -------------------
         # Formato final frontend
@@ -2257,6 +2140,7 @@ def ga4_migracion_view_item_list(request):
     
 
 
+@ga4_metrics.instrumented_view
 @csrf_exempt
 def ga4_migracion_view_alert(request):
     """
@@ -2287,9 +2171,7 @@ def ga4_migracion_view_alert(request):
                 {"error": "Credenciales GA4 no configuradas"}, status=500
             )
 
-        client = BetaAnalyticsDataClient.from_service_account_file(
-            credentials_path
-        )
+        client = _get_ga4_client()
 
         # -------------------
         # Fechas
@@ -2337,54 +2219,39 @@ def ga4_migracion_view_alert(request):
         # -------------------
         # Query GA4
         # -------------------
-        offset = 0
-        limit = 100000
         alerts_acumuladas = {}
         total_event_count = 0
 
-        while True:
-            ga_request = RunReportRequest(
-                property=f"properties/{property_id}",
-                dimensions=[
-                    Dimension(name="customEvent:alert_name"),
-                ],
-                metrics=[
-                    Metric(name="eventCount"),
-                ],
-                date_ranges=[
-                    DateRange(
-                        start_date=start_date,
-                        end_date=end_date
-                    )
-                ],
-                dimension_filter=dimension_filter,
-                limit=limit,
-                offset=offset,
-            )
-
-            response = client.run_report(ga_request)
-
-            if not response.rows:
-                break
-
-            for row in response.rows:
-                alert_name = (
-                    row.dimension_values[0].value
-                    if row.dimension_values
-                    else "(sin nombre)"
+        ga_request = RunReportRequest(
+            property=f"properties/{property_id}",
+            dimensions=[
+                Dimension(name="customEvent:alert_name"),
+            ],
+            metrics=[
+                Metric(name="eventCount"),
+            ],
+            date_ranges=[
+                DateRange(
+                    start_date=start_date,
+                    end_date=end_date
                 )
-                count = int(row.metric_values[0].value or 0)
-
-                total_event_count += count
+            ],
+            dimension_filter=dimension_filter,
+        )
 
-                alerts_acumuladas[alert_name] = (
-                    alerts_acumuladas.get(alert_name, 0) + count
-                )
+        for row in iter_report_rows(client, ga_request):
+            alert_name = (
+                row.dimension_values[0].value
+                if row.dimension_values
+                else "(sin nombre)"
+            )
+            count = int(row.metric_values[0].value or 0)
 
-            if len(response.rows) < limit:
-                break
+            total_event_count += count
 
-            offset += limit
+            alerts_acumuladas[alert_name] = (
+                alerts_acumuladas.get(alert_name, 0) + count
+            )
 
         # -------------------
         # Formato final
@@ -2429,6 +2296,7 @@ def _run_sessions_view_item_list(
     property_id,
     start_date,
     end_date,
+    timeout=None,
 ):
     request = RunReportRequest(
         property=f"properties/{property_id}",
@@ -2462,7 +2330,7 @@ def _run_sessions_view_item_list(
         ),
     )
 
-    response = client.run_report(request)
+    response = client.run_report(request, timeout=timeout)
 
     result = {}
     for row in response.rows:
@@ -2479,6 +2347,7 @@ def _run_purchases_migracion(
     property_id,
     start_date,
     end_date,
+    timeout=None,
 ):
     request = RunReportRequest(
         property=f"properties/{property_id}",
@@ -2505,7 +2374,7 @@ def _run_purchases_migracion(
         ),
     )
 
-    response = client.run_report(request)
+    response = client.run_report(request, timeout=timeout)
 
     result = {}
     for row in response.rows:
@@ -2518,20 +2387,7 @@ def _run_purchases_migracion(
     return result
 
 
-def run_sesiones_vs_compras_comparacion(
-    client,
-    property_id,
-    start_date,
-    end_date,
-):
-    sessions_by_date = _run_sessions_view_item_list(
-        client, property_id, start_date, end_date
-    )
-
-    purchases_by_date = _run_purchases_migracion(
-        client, property_id, start_date, end_date
-    )
-
+def _merge_sesiones_vs_compras(sessions_by_date, purchases_by_date):
     all_dates = sorted(
         set(sessions_by_date) | set(purchases_by_date)
     )
@@ -2557,6 +2413,7 @@ def run_sesiones_vs_compras_comparacion(
 
     return daily_summary
 
+
 # ==========================================================
 # 🔹 Comparación entre dos periodos
 # ==========================================================
@@ -2569,20 +2426,34 @@ def ga4_Sesiones_Vs_Compras_comparacion(
     credentials_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
     property_id = os.getenv("GA4_PROPERTY_ID")
 
-    client = BetaAnalyticsDataClient.from_service_account_file(credentials_path)
+    client = _get_ga4_client()
+
+    # 🔹 Las 4 consultas (2 por periodo) son independientes → en paralelo
+    periods = {
+        "p1": (period_1_start_date, period_1_end_date),
+        "p2": (period_2_start_date, period_2_end_date),
+    }
+    calls = {}
+    for key, (start, end) in periods.items():
+        calls[f"{key}_sessions"] = (
+            lambda timeout, start=start, end=end: _run_sessions_view_item_list(
+                client, property_id, start, end, timeout
+            )
+        )
+        calls[f"{key}_purchases"] = (
+            lambda timeout, start=start, end=end: _run_purchases_migracion(
+                client, property_id, start, end, timeout
+            )
+        )
+
+    results = run_parallel(calls)
 
     return {
-        "periodo_1": run_sesiones_vs_compras_comparacion(
-            client,
-            property_id,
-            period_1_start_date,
-            period_1_end_date,
+        "periodo_1": _merge_sesiones_vs_compras(
+            results["p1_sessions"], results["p1_purchases"]
         ),
-        "periodo_2": run_sesiones_vs_compras_comparacion(
-            client,
-            property_id,
-            period_2_start_date,
-            period_2_end_date,
+        "periodo_2": _merge_sesiones_vs_compras(
+            results["p2_sessions"], results["p2_purchases"]
         ),
     }
 
@@ -2590,6 +2461,7 @@ def ga4_Sesiones_Vs_Compras_comparacion(
 # ==========================================================
 # 🔹 View Django (API)
 # ==========================================================
+@ga4_metrics.instrumented_view
 @require_GET
 def sesiones_vs_compras_comparacion_view(request):
     p1_start = request.GET.get("p1_start")
@@ -2635,9 +2507,8 @@ def _run_channel_report(
     start_date,
     end_date,
     channel_dimension_name,
+    timeout=None,
 ):
-    offset = 0
-    limit = 100000
     report_data = []
 
     dimensions = [
@@ -2695,38 +2566,29 @@ def _run_channel_report(
         )
     )
 
-    while True:
-        request = RunReportRequest(
-            property=f"properties/{property_id}",
-            dimensions=dimensions,
-            metrics=metrics,
-            date_ranges=[
-                DateRange(
-                    start_date=start_date,
-                    end_date=end_date,
-                )
-            ],
-            dimension_filter=dimension_filter,
-            limit=limit,
-            offset=offset,
-        )
-
-        response = client.run_report(request)
-
-        if not response.rows:
-            break
-
-        for row in response.rows:
-            report_data.append({
-                "Canal": row.dimension_values[0].value,
-                "Sesiones Mig": int(row.metric_values[0].value or 0),
-                "Artículos comprados": int(row.metric_values[1].value or 0),
-            })
+    request = RunReportRequest(
+        property=f"properties/{property_id}",
+        dimensions=dimensions,
+        metrics=metrics,
+        date_ranges=[
+            DateRange(
+                start_date=start_date,
+                end_date=end_date,
+            )
+        ],
+        dimension_filter=dimension_filter,
+    )
 
-        if len(response.rows) < limit:
-            break
+    columns = decode_pages(iter_report_pages(client, request, timeout=timeout))
+    sesiones = columns.metric("sessions").astype(int).tolist()
+    compras = columns.metric("ecommercePurchases").astype(int).tolist()
 
-        offset += limit
+    for canal, sesiones_mig, articulos in zip(columns.dimension(channel_dimension_name), sesiones, compras):
+        report_data.append({
+            "Canal": canal,
+            "Sesiones Mig": sesiones_mig,
+            "Artículos comprados": articulos,
+        })
 
     return report_data
 
@@ -2741,29 +2603,33 @@ def ga4_traffic_channel_summary(start_date, end_date):
     if not credentials_path or not property_id:
         raise RuntimeError("Credenciales GA4 no configuradas")
 
-    client = BetaAnalyticsDataClient.from_service_account_file(credentials_path)
+    client = _get_ga4_client()
 
-    # 🔹 Canales principales (L1)
-    l1_results = _run_channel_report(
-        client,
-        property_id,
-        start_date,
-        end_date,
-        "sessionCustomChannelGroup:7566460458",
-    )
+    # 🔹 Canales principales (L1) y secundarios (L2) en paralelo
+    results = run_parallel({
+        "l1": lambda timeout: _run_channel_report(
+            client,
+            property_id,
+            start_date,
+            end_date,
+            "sessionCustomChannelGroup:7566460458",
+            timeout,
+        ),
+        "l2": lambda timeout: _run_channel_report(
+            client,
+            property_id,
+            start_date,
+            end_date,
+            "sessionCustomChannelGroup:8278048377",
+            timeout,
+        ),
+    })
 
+    l1_results = results["l1"]
     for row in l1_results:
         row["Tipo de Canal"] = "principal"
 
-    # 🔹 Canales secundarios (L2)
-    l2_results = _run_channel_report(
-        client,
-        property_id,
-        start_date,
-        end_date,
-        "sessionCustomChannelGroup:8278048377",
-    )
-
+    l2_results = results["l2"]
     for row in l2_results:
         row["Tipo de Canal"] = "secundario"
 
@@ -2783,6 +2649,7 @@ def ga4_traffic_channel_summary(start_date, end_date):
 # ==========================================================
 # 🔹 View Django (API)
 # ==========================================================
+@ga4_metrics.instrumented_view
 @require_GET
 def traffic_channel_summary_view(request):
     start_date = request.GET.get("start_date")
@@ -2804,6 +2671,7 @@ def traffic_channel_summary_view(request):
 
 
 
+@ga4_metrics.instrumented_view
 @require_GET
 def ga4_traffic_detail_summary_view(request):
     """
@@ -2837,15 +2705,11 @@ def ga4_traffic_detail_summary_view(request):
             status=500
         )
 
-    client = BetaAnalyticsDataClient.from_service_account_file(
-        credentials_path
-    )
+    client = _get_ga4_client()
 
     # -------------------
     # Configuración consulta
     # -------------------
-    offset = 0
-    limit = 100000
     results = []
 
     dimensions = [
@@ -2870,52 +2734,39 @@ def ga4_traffic_detail_summary_view(request):
     )
 
     # -------------------
-    # Paginación GA4
+    # Paginación GA4 (iterador con prefetch)
     # -------------------
-    while True:
-        ga_request = RunReportRequest(
-            property=f"properties/{property_id}",
-            dimensions=dimensions,
-            metrics=metrics,
-            date_ranges=[
-                DateRange(start_date=start_date, end_date=end_date)
-            ],
-            dimension_filter=dimension_filter,
-            limit=limit,
-            offset=offset,
-        )
-
-        response = client.run_report(ga_request)
-
-        if not response.rows:
-            break
-
-        for row in response.rows:
-            channel_l1 = row.dimension_values[0].value
-            source_medium = row.dimension_values[1].value
-            campaign = row.dimension_values[2].value
-
-            sessions = int(row.metric_values[0].value or 0)
-            purchases = int(row.metric_values[1].value or 0)
+    ga_request = RunReportRequest(
+        property=f"properties/{property_id}",
+        dimensions=dimensions,
+        metrics=metrics,
+        date_ranges=[
+            DateRange(start_date=start_date, end_date=end_date)
+        ],
+        dimension_filter=dimension_filter,
+    )
 
-            conversion_rate = (
-                round((purchases / sessions) * 100, 2)
-                if sessions > 0 else 0.0
-            )
+    for row in iter_report_rows(client, ga_request):
+        channel_l1 = row.dimension_values[0].value
+        source_medium = row.dimension_values[1].value
+        campaign = row.dimension_values[2].value
 
-            results.append({
-                "Canal L1": channel_l1,
-                "Fuente/Medio": source_medium,
-                "Campaña": campaign,
-                "Sesiones Mig": sessions,
-                "Artículos comprados": purchases,
-                "Tasa de Conversión": conversion_rate,
-            })
+        sessions = int(row.metric_values[0].value or 0)
+        purchases = int(row.metric_values[1].value or 0)
 
-        if len(response.rows) < limit:
-            break
+        conversion_rate = (
+            round((purchases / sessions) * 100, 2)
+            if sessions > 0 else 0.0
+        )
 
-        offset += limit
+        results.append({
+            "Canal L1": channel_l1,
+            "Fuente/Medio": source_medium,
+            "Campaña": campaign,
+            "Sesiones Mig": sessions,
+            "Artículos comprados": purchases,
+            "Tasa de Conversión": conversion_rate,
+        })
 
     return JsonResponse(
         {
@@ -2985,7 +2836,7 @@ def categorizar_subcanal(source_medium, channel_group):
     return "Otros"
 
 def _run_ga4_sesiones_subcanal(
-    client, property_id, start_date, end_date
+    client, property_id, start_date, end_date, timeout=None
 ):
     dimensions = [
         Dimension(name="date"),
@@ -3030,10 +2881,10 @@ def _run_ga4_sesiones_subcanal(
         limit=100000,
     )
 
-    return client.run_report(request)
+    return client.run_report(request, timeout=timeout)
 
 def _run_ga4_ventas_subcanal(
-    client, property_id, start_date, end_date
+    client, property_id, start_date, end_date, timeout=None
 ):
     dimensions = [
         Dimension(name="date"),
@@ -3072,7 +2923,7 @@ def _run_ga4_ventas_subcanal(
         limit=100000,
     )
 
-    return client.run_report(request)
+    return client.run_report(request, timeout=timeout)
 
 def _merge_sesiones_y_ventas(resp_sesiones, resp_ventas):
     data = defaultdict(lambda: {"sesiones": 0, "ventas": 0})
@@ -3106,25 +2957,39 @@ def _merge_sesiones_y_ventas(resp_sesiones, resp_ventas):
 def ga4_subcanal_owned_report_comparacion(
     p1_start, p1_end, p2_start, p2_end
 ):
-    client = BetaAnalyticsDataClient.from_service_account_file(
-        os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-    )
+    client = _get_ga4_client()
     property_id = os.getenv("GA4_PROPERTY_ID")
 
-    def run_period(start, end):
-        sesiones = _run_ga4_sesiones_subcanal(
-            client, property_id, start, end
+    # 🔹 Las 4 consultas (sesiones y ventas por periodo) van en paralelo
+    periods = {
+        "periodo_1": (p1_start, p1_end),
+        "periodo_2": (p2_start, p2_end),
+    }
+    calls = {}
+    for key, (start, end) in periods.items():
+        calls[(key, "sesiones")] = (
+            lambda timeout, start=start, end=end: _run_ga4_sesiones_subcanal(
+                client, property_id, start, end, timeout
+            )
         )
-        ventas = _run_ga4_ventas_subcanal(
-            client, property_id, start, end
+        calls[(key, "ventas")] = (
+            lambda timeout, start=start, end=end: _run_ga4_ventas_subcanal(
+                client, property_id, start, end, timeout
+            )
         )
-        return _merge_sesiones_y_ventas(sesiones, ventas)
+
+    results = run_parallel(calls)
 
     return {
-        "periodo_1": {"datos": run_period(p1_start, p1_end)},
-        "periodo_2": {"datos": run_period(p2_start, p2_end)},
+        key: {
+            "datos": _merge_sesiones_y_ventas(
+                results[(key, "sesiones")], results[(key, "ventas")]
+            )
+        }
+        for key in periods
     }
 
+@ga4_metrics.instrumented_view
 @require_GET
 def ga4_subcanal_owned_comparacion_view(request):
     p1_start = request.GET.get("period_1_start")
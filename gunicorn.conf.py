@@ -0,0 +1,13 @@
+"""
+Configuración de gunicorn (se carga sola desde el directorio de trabajo).
+"""
+import os
+
+
+def post_worker_init(worker):
+    """Arranca en cada worker el hilo del índice de recursos y su mantenimiento diario."""
+    property_id = os.getenv("GA4_PROPERTY_ID")
+    if property_id and os.getenv("GOOGLE_APPLICATION_CREDENTIALS"):
+        from dashboard import resource_index
+
+        resource_index.get_index(property_id)